@@ -0,0 +1,129 @@
+# benchmarks/fake_llm_server.py
+
+import json
+import time
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 只实现 colab/scene_batch.py 用到的 Anthropic Messages API 子集 (POST /v1/messages)
+
+
+def _default_reply(system_prompt, user_prompt, temperature):
+    """按提示词生成确定的 (回复文本, 输出 token 数)：一个带任务说明的最小场景程序。"""
+    digest = hashlib.sha256(f"{system_prompt}\n{user_prompt}\n{temperature}".encode('utf-8')).hexdigest()[:8]
+    text = (
+        "Here is the program:\n"
+        "```python\n"
+        "from helper import *\n\n"
+        "@register()\n"
+        f"def scene_{digest}() -> Shape:\n"
+        "    return primitive_call('cube', shape_kwargs={'scale': (1, 1, 1)}, color=(0.5, 0.5, 0.5))\n"
+        "```\n"
+    )
+    return text, len(text) // 4 + 1
+
+
+class FakeLLMServer:
+    """
+    本地的 LLM API 替身服务器，用于在不消耗 API 额度的情况下测试批量场景生成。
+
+    Args:
+        latency (float): 每个请求附加的延迟 (秒)，模拟生成耗时。
+        reply (callable, optional): (系统提示词, 用户提示词, 温度) -> (回复文本, 输出 token 数)。
+        fail_first (int): 前 fail_first 个请求返回 429 (带 retry-after 响应头)，用于测试重试。
+    """
+
+    def __init__(self, latency=0.0, reply=None, fail_first=0):
+        self.latency = latency
+        self.reply = reply or _default_reply
+        self.fail_first = fail_first
+        self.request_count = 0
+        self.max_concurrency = 0 # 观察到的最大并发请求数
+        self._active = 0
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, body, headers=None):
+                body = json.dumps(body, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                payload = json.loads(self.rfile.read(length) or b'{}')
+                with server._lock:
+                    server.request_count += 1
+                    request_number = server.request_count
+                    server._active += 1
+                    server.max_concurrency = max(server.max_concurrency, server._active)
+                try:
+                    if self.path != '/v1/messages':
+                        return self._send(404, {'type': 'error', 'error': {'type': 'not_found_error'}})
+                    if not self.headers.get('x-api-key'):
+                        return self._send(401, {'type': 'error', 'error': {'type': 'authentication_error'}})
+                    if request_number <= server.fail_first:
+                        return self._send(429, {'type': 'error', 'error': {'type': 'rate_limit_error'}},
+                                          {'retry-after': '0.1'})
+                    if server.latency:
+                        time.sleep(server.latency)
+
+                    user_prompt = ''.join(
+                        message['content'] for message in payload.get('messages', []) if message.get('role') == 'user'
+                    )
+                    system_prompt = payload.get('system', '')
+                    text, output_tokens = server.reply(system_prompt, user_prompt, payload.get('temperature'))
+                    output_tokens = min(output_tokens, payload.get('max_tokens', output_tokens))
+                    return self._send(200, {
+                        'id': f"msg_{request_number}",
+                        'type': 'message',
+                        'role': 'assistant',
+                        'model': payload.get('model'),
+                        'content': [{'type': 'text', 'text': text}],
+                        'stop_reason': 'end_turn',
+                        'usage': {
+                            'input_tokens': (len(system_prompt) + len(user_prompt)) // 4 + 1,
+                            'output_tokens': output_tokens,
+                        },
+                    })
+                finally:
+                    with server._lock:
+                        server._active -= 1
+
+        return Handler
@@ -0,0 +1,212 @@
+# benchmarks/fake_seatable_server.py
+
+import re
+import json
+import time
+import uuid
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, unquote
+
+# 只实现 SeaTableDataManager 和 ImageManager 用到的 SeaTable API 子集
+_SQL_PATTERN = re.compile(
+    r"SELECT\s+(?P<columns>.+?)\s+FROM\s+`(?P<table>[^`]+)`"
+    r"(?:\s+WHERE\s+(?P<where>.+?))?"
+    r"(?:\s+ORDER\s+BY\s+(?P<order>.+?))?"
+    r"(?:\s+LIMIT\s+(?P<limit>\d+)(?:\s+OFFSET\s+(?P<offset>\d+))?)?\s*$",
+    re.IGNORECASE | re.DOTALL
+)
+_AGGREGATE_PATTERN = re.compile(r"(?P<func>COUNT|MAX|MIN)\((?P<arg>\*|`[^`]+`)\)", re.IGNORECASE)
+_CONDITION_PATTERN = re.compile(r"`(?P<column>[^`]+)`\s*(?P<op>>=|<=|>|<|=)\s*'(?P<value>[^']*)'")
+
+
+def _evaluate_sql(sql, rows):
+    """执行 SeaTableDataManager 生成的简单 SQL：列投影、AND 连接的比较条件、COUNT/MAX/MIN 聚合、ORDER BY (升序) 和 LIMIT/OFFSET。"""
+    match = _SQL_PATTERN.match(sql.strip())
+    if not match:
+        raise ValueError(f"unsupported sql: {sql}")
+
+    conditions = []
+    if match.group('where'):
+        for part in re.split(r"\s+AND\s+", match.group('where'), flags=re.IGNORECASE):
+            condition = _CONDITION_PATTERN.fullmatch(part.strip())
+            if not condition:
+                raise ValueError(f"unsupported condition: {part}")
+            conditions.append((condition.group('column'), condition.group('op'), condition.group('value')))
+
+    operators = {
+        '>=': lambda a, b: a >= b, '<=': lambda a, b: a <= b,
+        '>': lambda a, b: a > b, '<': lambda a, b: a < b, '=': lambda a, b: a == b,
+    }
+    selected = [
+        row for row in rows
+        if all(row.get(column) is not None and operators[op](str(row.get(column)), value)
+               for column, op, value in conditions)
+    ]
+
+    columns = match.group('columns').strip()
+    expressions = [expression.strip() for expression in columns.split(',')]
+    aggregates = [_AGGREGATE_PATTERN.fullmatch(expression) for expression in expressions]
+    if all(aggregates):
+        result = {}
+        for expression, aggregate in zip(expressions, aggregates):
+            func = aggregate.group('func').upper()
+            if func == 'COUNT':
+                result[expression] = len(selected)
+                continue
+            values = [row.get(aggregate.group('arg').strip('`')) for row in selected]
+            values = [value for value in values if value is not None]
+            result[expression] = (max if func == 'MAX' else min)(values) if values else None
+        return [result]
+
+    if match.group('order'):
+        order_columns = [name.strip().strip('`') for name in match.group('order').split(',')]
+        selected.sort(key=lambda row: [(row.get(name) is not None, str(row.get(name))) for name in order_columns])
+
+    offset = int(match.group('offset') or 0)
+    limit = int(match.group('limit') or 100) # SeaTable SQL 默认只返回 100 行
+    selected = selected[offset:offset + limit]
+    if columns == '*':
+        return selected
+    names = [name.strip().strip('`') for name in columns.split(',')]
+    return [{name: row.get(name) for name in names if name in row} for row in selected]
+
+
+class FakeSeaTableServer:
+    """
+    本地的 SeaTable 替身服务器，用于在不访问 table.nju.edu.cn 的情况下测量吞吐量。
+
+    Args:
+        rows (list): 表中的行数据。
+        files (dict): 资源路径 (如 'images/poster_1.jpg') -> 文件字节。
+        latency (float): 每个请求附加的延迟 (秒)。
+        table_name (str): 表名。
+    """
+
+    def __init__(self, rows, files=None, latency=0.0, table_name='春季学期讲座信息收集'):
+        self.rows = rows
+        self.files = files or {}
+        self.latency = latency
+        self.table_name = table_name
+        self.dtable_uuid = uuid.uuid4().hex
+        self.request_count = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address
+        return f"http://{host}:{port}"
+
+    def asset_url(self, path):
+        """返回与 SeaTable 图片列格式一致的资源 URL。"""
+        return f"{self.url}/workspace/1/asset/{uuid.UUID(self.dtable_uuid)}/{path}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, body, content_type='application/json'):
+                if isinstance(body, (dict, list)):
+                    body = json.dumps(body, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                with server._lock:
+                    server.request_count += 1
+                    server.bytes_sent += len(body)
+
+            def _delay(self):
+                if server.latency:
+                    time.sleep(server.latency)
+
+            def do_GET(self):
+                self._delay()
+                parsed = urlparse(self.path)
+                params = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+
+                if parsed.path == '/api/v2.1/dtable/app-access-token/':
+                    return self._send(200, {
+                        'access_token': 'fake-jwt-token',
+                        'dtable_uuid': server.dtable_uuid,
+                        'dtable_server': f"{server.url}/dtable-server/",
+                        'dtable_db': f"{server.url}/dtable-db/",
+                        'workspace_id': 1,
+                        'dtable_name': 'fake',
+                        'use_api_gateway': False,
+                    })
+
+                if parsed.path == f'/dtable-server/api/v1/dtables/{server.dtable_uuid}/rows/':
+                    if params.get('table_name') != server.table_name:
+                        return self._send(404, {'error_msg': 'table not found'})
+                    start = int(params.get('start', 0))
+                    limit = params.get('limit')
+                    rows = server.rows[start:start + int(limit)] if limit else server.rows[start:]
+                    return self._send(200, {'rows': rows})
+
+                if parsed.path == f'/dtable-server/api/v1/dtables/{server.dtable_uuid}/columns/':
+                    if params.get('table_name') != server.table_name:
+                        return self._send(404, {'error_msg': 'table not found'})
+                    names = list(dict.fromkeys(column for row in server.rows for column in row))
+                    return self._send(200, {'columns': [
+                        {'name': name, 'type': 'text'} for name in names if not name.startswith('_')
+                    ]})
+
+                if parsed.path == '/api/v2.1/dtable/app-download-link/':
+                    path = params.get('path', '').strip('/')
+                    if path not in server.files:
+                        return self._send(404, {'error_msg': 'file not found'})
+                    return self._send(200, {'download_link': f"{server.url}/files/{path}"})
+
+                if parsed.path.startswith('/files/'):
+                    path = unquote(parsed.path[len('/files/'):])
+                    if path not in server.files:
+                        return self._send(404, b'not found', 'text/plain')
+                    return self._send(200, server.files[path], 'application/octet-stream')
+
+                return self._send(404, {'error_msg': 'not found'})
+
+            def do_POST(self):
+                self._delay()
+                parsed = urlparse(self.path)
+                length = int(self.headers.get('Content-Length', 0))
+                payload = json.loads(self.rfile.read(length) or b'{}')
+
+                if parsed.path == f'/dtable-db/api/v1/query/{server.dtable_uuid}/':
+                    match = _SQL_PATTERN.match(payload.get('sql', '').strip())
+                    if match and match.group('table') != server.table_name:
+                        return self._send(200, {'success': False, 'error_message': 'table not found'})
+                    try:
+                        results = _evaluate_sql(payload.get('sql', ''), server.rows)
+                    except ValueError as e:
+                        return self._send(200, {'success': False, 'error_message': str(e)})
+                    return self._send(200, {'success': True, 'metadata': [], 'results': results})
+
+                return self._send(404, {'error_msg': 'not found'})
+
+        return Handler
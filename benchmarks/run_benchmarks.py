@@ -0,0 +1,166 @@
+# benchmarks/run_benchmarks.py
+"""
+吞吐量基准测试：在本地 SeaTable 替身服务器上测量获取、筛选、海报处理、Markdown 渲染和 DOCX 生成各阶段的耗时与峰值内存。
+
+用法示例:
+    python benchmarks/run_benchmarks.py --rows 10000 --posters 60 --latency 0.02
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from seatable_data import SeaTableDataManager
+from data_processor import process_and_filter_lectures, filter_lecture_pages
+from image_downloader import ImageManager
+from poster_cache import PosterCache
+from report_generator import ReportGenerator
+from pandoc_tools import convert_markdown_file
+from staged_pipeline import StagedReportPipeline
+from fake_seatable_server import FakeSeaTableServer
+from synthetic_data import generate_posters, generate_lecture_rows
+
+
+class BenchmarkRunner:
+    """依次执行各个基准阶段，记录耗时和 tracemalloc 峰值内存。"""
+
+    def __init__(self, repeat=1, trace_memory=True):
+        self.repeat = repeat
+        self.trace_memory = trace_memory
+        self.results = []
+
+    def run(self, name, func):
+        timings = []
+        peak_bytes = 0
+        result = None
+        for _ in range(self.repeat):
+            if self.trace_memory:
+                tracemalloc.start()
+            start = time.perf_counter()
+            result = func()
+            timings.append(time.perf_counter() - start)
+            if self.trace_memory:
+                peak_bytes = max(peak_bytes, tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+        self.results.append({
+            'stage': name,
+            'best_seconds': min(timings),
+            'mean_seconds': sum(timings) / len(timings),
+            'peak_mib': peak_bytes / (1024 * 1024) if self.trace_memory else None,
+        })
+        print(f"  {name:<28} {min(timings):>9.3f}s" +
+              (f"  peak {peak_bytes / (1024 * 1024):>8.1f} MiB" if self.trace_memory else ''))
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='讲座报告流水线基准测试')
+    parser.add_argument('--rows', type=int, default=5000, help='合成讲座行数 (1k - 1M)')
+    parser.add_argument('--posters', type=int, default=30, help='不同海报图片的数量')
+    parser.add_argument('--latency', type=float, default=0.01, help='替身服务器每个请求的附加延迟 (秒)')
+    parser.add_argument('--window', default='2025-03-01:2025-03-31', help='筛选日期范围 START:END')
+    parser.add_argument('--repeat', type=int, default=1, help='每个阶段重复次数，报告最佳值')
+    parser.add_argument('--page-size', type=int, default=1000, help='分页获取的页大小')
+    parser.add_argument('--no-memory', action='store_true', help='不统计峰值内存 (tracemalloc 本身有开销)')
+    parser.add_argument('--json', metavar='PATH', help='将结果写为 JSON 文件')
+    parser.add_argument('-v', '--verbose', action='store_true', help='显示流水线自身的 INFO 日志')
+    args = parser.parse_args()
+
+    # 默认只显示基准结果，流水线日志仅保留警告和错误
+    logging.basicConfig(format='%(message)s')
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+
+    start_date_str, end_date_str = args.window.split(':', 1)
+    work_dir = tempfile.mkdtemp(prefix='lecture_bench_')
+    runner = BenchmarkRunner(repeat=args.repeat, trace_memory=not args.no_memory)
+
+    print(f"生成 {args.posters} 张海报和 {args.rows} 行合成数据...")
+    posters = generate_posters(args.posters)
+    server = FakeSeaTableServer([], files=posters, latency=args.latency, table_name=config.TABLE_NAME).start()
+    server.rows = generate_lecture_rows(args.rows, [server.asset_url(path) for path in posters])
+    print(f"替身服务器: {server.url} (延迟 {args.latency * 1000:.0f} ms)\n")
+
+    try:
+        manager = SeaTableDataManager(server.url, 'fake-api-token', config.BASE_NAME, config.TABLE_NAME)
+        runner.run('auth', manager.authenticate)
+
+        raw_rows = runner.run('fetch_full', manager.get_lecture_rows)
+        runner.run('fetch_sql', lambda: manager.query_lecture_rows(
+            start_date_str, end_date_str, config.REPORT_COLUMNS, page_size=config.SQL_PAGE_SIZE))
+        runner.run('fetch_stream+filter', lambda: filter_lecture_pages(
+            manager.iter_lecture_pages(page_size=args.page_size), start_date_str, end_date_str))
+        filtered_df = runner.run('process_and_filter', lambda: process_and_filter_lectures(
+            raw_rows, start_date_str, end_date_str))
+        print(f"  -> 日期范围内 {len(filtered_df)} 条讲座")
+
+        temp_dir = os.path.join(work_dir, 'images')
+        cache_dir = os.path.join(work_dir, 'poster_cache')
+
+        def make_image_manager():
+            image_manager = ImageManager(
+                temp_dir, config.REQUEST_HEADERS, config.IMAGE_DOWNLOAD_TIMEOUT, manager.get_api_instance(),
+                max_workers=config.IMAGE_DOWNLOAD_WORKERS, max_per_host=config.IMAGE_DOWNLOAD_PER_HOST,
+                poster_cache=PosterCache(cache_dir, config.POSTER_CACHE_MAX_BYTES),
+                target_format=config.POSTER_TARGET_FORMAT, max_dimension=config.POSTER_MAX_DIMENSION,
+                quality=config.POSTER_QUALITY, transcode_workers=config.POSTER_TRANSCODE_WORKERS)
+            image_manager.setup_temp_dir()
+            return image_manager
+
+        image_manager = make_image_manager()
+        image_paths = runner.run('posters_cold', lambda: image_manager.download_all(filtered_df))
+        image_manager = make_image_manager()
+        image_paths = runner.run('posters_warm_cache', lambda: image_manager.download_all(filtered_df))
+
+        md_path = os.path.join(work_dir, 'report.md')
+        reporter = ReportGenerator(md_path, os.path.join(work_dir, 'report.docx'), image_manager)
+        runner.run('generate_markdown', lambda: reporter.generate_markdown(filtered_df, image_paths=image_paths))
+
+        try:
+            import docx # noqa: F401
+            reporter.output_word_filename = os.path.join(work_dir, 'report_native.docx')
+            runner.run('docx_native', lambda: reporter.generate_word_native(filtered_df, image_paths=image_paths))
+        except ImportError:
+            print("  docx_native: 跳过 (未安装 python-docx)")
+
+        if shutil.which('pandoc'):
+            runner.run('docx_pandoc', lambda: convert_markdown_file(
+                md_path, os.path.join(work_dir, 'report_pandoc.docx'), temp_dir))
+        else:
+            print("  docx_pandoc: 跳过 (未找到 pandoc)")
+
+        # 分阶段流水线 (海报缓存为空)：分页获取、筛选、海报下载和渲染重叠执行，可与上面各阶段之和对比
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        staged_reporter = ReportGenerator(
+            os.path.join(work_dir, 'report_staged.md'), os.path.join(work_dir, 'report_staged.docx'),
+            make_image_manager())
+        runner.run('staged_pipeline_cold', lambda: StagedReportPipeline(
+            staged_reporter, start_date_str, end_date_str, queue_size=config.PIPELINE_QUEUE_SIZE,
+            poster_workers=config.IMAGE_DOWNLOAD_WORKERS, transcode_workers=config.POSTER_TRANSCODE_WORKERS,
+            render_batch_size=config.PIPELINE_RENDER_BATCH_SIZE,
+        ).run(manager.iter_lecture_pages(page_size=args.page_size)))
+    finally:
+        server.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"\n替身服务器共处理 {server.request_count} 个请求，发送 {server.bytes_sent / (1024 * 1024):.1f} MiB")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({
+                'rows': args.rows, 'posters': args.posters, 'latency': args.latency,
+                'window': args.window, 'requests': server.request_count,
+                'bytes_sent': server.bytes_sent, 'stages': runner.results,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入: {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+# benchmarks/synthetic_data.py
+
+import io
+import random
+import datetime
+from PIL import Image, ImageDraw
+
+# 与真实 SeaTable 表一致的列名，另外附带几列报告不会用到的列，以体现列投影的效果
+_TITLES = ['人工智能', '量子计算', '古典文学', '城市规划', '生物信息学', '碳中和', '数字人文', '材料科学']
+_SPEAKERS = ['张伟 教授', '李娜 副教授', '王强 研究员', '刘洋 讲师', '陈静 教授', '杨帆 博士']
+_LOCATIONS = ['仙林校区 逸夫楼 101', '鼓楼校区 北大楼 203', '苏州校区 报告厅', '线上 腾讯会议']
+_POSTER_SPECS = [
+    ('JPEG', (4032, 3024)), # 手机照片
+    ('JPEG', (1080, 1920)),
+    ('PNG', (1200, 1600)),
+    ('PNG', (600, 800)),
+    ('WEBP', (1500, 2000)),
+    ('WEBP', (800, 1000)),
+]
+_EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp'}
+
+
+def generate_posters(count, seed=0):
+    """
+    生成 count 张不同格式和尺寸的海报图片。
+
+    Returns:
+        dict: 资源路径 (如 'images/poster_3.webp') -> 图片字节。
+    """
+    rng = random.Random(seed)
+    posters = {}
+    for i in range(count):
+        image_format, size = _POSTER_SPECS[i % len(_POSTER_SPECS)]
+        img = Image.new('RGB', size, (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+        draw = ImageDraw.Draw(img)
+        for _ in range(20): # 加一些图形，避免图片过于容易压缩
+            x0, y0 = rng.randrange(size[0]), rng.randrange(size[1])
+            draw.rectangle([x0, y0, x0 + size[0] // 5, y0 + size[1] // 8],
+                           fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+        buffer = io.BytesIO()
+        save_kwargs = {} if image_format == 'PNG' else {'quality': 90}
+        img.save(buffer, image_format, **save_kwargs)
+        posters[f"images/poster_{i}{_EXTENSIONS[image_format]}"] = buffer.getvalue()
+    return posters
+
+
+def iter_lecture_rows(count, poster_urls=(), start_date='2025-02-17', days=140, seed=0):
+    """
+    逐行生成合成的讲座数据 (与 list_rows 返回的行格式一致)。
+
+    Args:
+        count (int): 行数。
+        poster_urls (sequence): 海报资源 URL，按顺序循环引用；约 20% 的讲座没有海报。
+        start_date (str): 讲座时间的起始日期。
+        days (int): 讲座时间分布的天数。
+        seed (int): 随机种子，保证结果可重复。
+
+    Yields:
+        dict: 一行讲座数据。
+    """
+    rng = random.Random(seed)
+    base = datetime.datetime.fromisoformat(start_date)
+    for i in range(count):
+        lecture_time = base + datetime.timedelta(days=rng.randrange(days), hours=rng.choice([9, 10, 14, 15, 19]))
+        modified = base + datetime.timedelta(seconds=i)
+        row = {
+            '_id': f"row{i:08d}",
+            '_ctime': modified.isoformat() + '+00:00',
+            '_mtime': modified.isoformat() + '+00:00',
+            '讲座名称（全称）': f"{rng.choice(_TITLES)}前沿讲座 第{i}期",
+            '讲座报告人+职称': rng.choice(_SPEAKERS),
+            '讲座时间': lecture_time.strftime('%Y-%m-%d %H:%M'),
+            '具体时间（例：14:00-15:00）': f"{lecture_time:%H}:00-{lecture_time.hour + 1:02d}:30",
+            '讲座地点': rng.choice(_LOCATIONS),
+            '讲座内容（摘要）': '本次讲座将介绍该领域的最新研究进展与未来方向。' * rng.randint(1, 6),
+            '联系人': rng.choice(_SPEAKERS).split()[0],
+            '主办院系': rng.choice(['计算机学院', '文学院', '物理学院', '建筑学院']),
+            '备注': '' if rng.random() < 0.7 else '需提前报名',
+        }
+        if poster_urls and rng.random() >= 0.2:
+            row['讲座海报照片'] = [poster_urls[i % len(poster_urls)]]
+        yield row
+
+
+def generate_lecture_rows(count, poster_urls=(), **kwargs):
+    return list(iter_lecture_rows(count, poster_urls, **kwargs))
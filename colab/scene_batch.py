@@ -0,0 +1,405 @@
+# scene_batch.py
+#
+# text_to_scene.ipynb 的批量场景生成：对一组场景描述并发请求 LLM 补全，
+# 受请求速率和 token 预算限制，并按 (系统提示词, 用户提示词, 采样设置) 的哈希在磁盘上缓存响应。
+# 本文件不依赖 scene-language 仓库和本项目的其他模块，可以单独下载到 Colab 中使用。
+
+import logging
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = 'https://api.anthropic.com'
+ANTHROPIC_VERSION = '2023-06-01'
+
+SYSTEM_PROMPT_TEMPLATE = """\
+You are a code completion model and can only write python functions wrapped within ```python```.
+
+You are provided with the following `helper.py` which defines the given functions and definitions:
+```python
+{header}
+```
+
+{rules}
+
+You should be precise and creative.
+"""
+
+USER_PROMPT_TEMPLATE = '''Here are some examples of how to use `helper.py`:
+```python
+{example}
+```
+IMPORTANT: THE FUNCTIONS ABOVE ARE JUST EXAMPLES, YOU CANNOT USE THEM IN YOUR PROGRAM!
+
+Now, write a similar program for the given task:
+```python
+from helper import *
+
+"""
+{task}
+"""
+```
+'''
+
+_PROGRAM_PATTERN = re.compile(r'```python\n(.*?)```', re.DOTALL)
+
+
+def build_prompts(task, header, rules, example):
+    """
+    生成与 text_to_scene.ipynb 相同的 (系统提示词, 用户提示词)。
+
+    Args:
+        task (str): 场景描述。
+        header (str): helper.py 的接口说明 (scripts.run_utils.SYSTEM_HEADER)。
+        rules (str): 编写规则 (scripts.run_utils.SYSTEM_RULES)。
+        example (str): 示例程序 (scripts.run_utils.read_example(animate=False))。
+    """
+    return (
+        SYSTEM_PROMPT_TEMPLATE.format(header=header, rules=rules),
+        USER_PROMPT_TEMPLATE.format(task=task, example=example),
+    )
+
+
+def extract_program(text):
+    """返回回复中最后一个 ```python``` 代码块，没有代码块时返回 None。"""
+    programs = _PROGRAM_PATTERN.findall(text)
+    return programs[-1] if programs else None
+
+
+def task_dirname(task):
+    """
+    场景描述 -> 输出子目录名 (与 engine.utils.argparse_utils.modify_string_for_file 的效果类似)。
+    名称会被截断并替换标点，末尾附加场景描述的短哈希，不同的描述不会落到同一个目录。
+    """
+    name = re.sub(r'[^0-9A-Za-z\u4e00-\u9fff]+', '_', task).strip('_')[:100]
+    digest = hashlib.sha256(task.encode('utf-8')).hexdigest()
+    return f"{name}_{digest[:8]}" if name else digest[:12]
+
+
+def estimate_tokens(text):
+    """粗略估计文本的 token 数 (偏多)，用于在请求前预留预算。"""
+    return len(text.encode('utf-8')) // 3 + 1
+
+
+def response_key(system_prompt, user_prompt, settings):
+    """
+    响应的缓存键：系统提示词、用户提示词和采样设置 (模型、温度、最大输出 token 数、补全序号) 的哈希。
+    同一提示词的第 n 个补全总是对应同一个键，重复运行时命中缓存。
+    """
+    payload = json.dumps([system_prompt, user_prompt, settings], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class BudgetExceeded(Exception):
+    """剩余 token 预算不足以发出请求。"""
+
+
+class ResponseCache:
+    """LLM 响应的磁盘缓存，每个响应按 response_key 保存为一个 JSON 文件，写入先写临时文件再替换。"""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        """
+        Returns:
+            dict: 缓存的响应 {'text', 'usage'}，未命中或文件损坏时返回 None。
+        """
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning("警告: 响应缓存 %s 损坏，将重新请求: %s", key, e)
+            return None
+
+    def put(self, key, response):
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(response, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+class RateBudget:
+    """
+    请求速率和 token 预算：每分钟最多 requests_per_minute 个请求 (令牌桶，允许积攒一分钟的量)，
+    整个批次消耗的输入 + 输出 token 不超过 token_budget。
+
+    请求前按 预估输入 token + 最大输出 token 预留预算，完成后按实际用量结算，
+    并发请求也不会超出预算。两项设为 None 表示不限制。
+    """
+
+    def __init__(self, requests_per_minute=None, token_budget=None):
+        self.requests_per_minute = requests_per_minute
+        self.token_budget = token_budget
+        self.tokens_used = 0
+        self._reserved = 0
+        self._allowance = float(requests_per_minute or 0)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens):
+        """
+        预留 tokens 个 token 的预算。
+
+        Raises:
+            BudgetExceeded: 剩余预算不足。
+        """
+        with self._lock:
+            if self.token_budget is not None and self.tokens_used + self._reserved + tokens > self.token_budget:
+                raise BudgetExceeded(
+                    f"需要 {tokens} token，预算剩余 {self.token_budget - self.tokens_used - self._reserved}"
+                )
+            self._reserved += tokens
+
+    def settle(self, reserved, used):
+        """释放预留的 reserved 个 token，计入实际用量 used。"""
+        with self._lock:
+            self._reserved -= reserved
+            self.tokens_used += used
+
+    def acquire(self):
+        """按请求速率限制阻塞等待，直到可以发出下一个请求。"""
+        if not self.requests_per_minute:
+            return
+        rate = self.requests_per_minute / 60.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._allowance = min(self.requests_per_minute, self._allowance + (now - self._updated) * rate)
+                self._updated = now
+                if self._allowance >= 1:
+                    self._allowance -= 1
+                    return
+                wait = (1 - self._allowance) / rate
+            time.sleep(wait)
+
+
+class MessagesClient:
+    """
+    Anthropic Messages API 的最小客户端，只依赖 requests。
+    base_url 可以指向本地的替身服务器 (benchmarks/fake_llm_server.py) 以便不消耗额度地测试。
+    429、529 和 5xx 响应以及连接错误、超时按指数退避重试 (优先遵循 retry-after 响应头)，
+    每次等待不超过 max_retry_delay 秒。
+    """
+
+    RETRY_STATUS_CODES = (429, 500, 502, 503, 504, 529)
+
+    def __init__(self, api_key, base_url=DEFAULT_BASE_URL, timeout=600, max_retries=4, backoff_factor=2.0,
+                 max_retry_delay=60.0):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_retry_delay = max_retry_delay
+        self.request_count = 0 # 实际发出的 HTTP 请求数 (含重试)
+        self._lock = threading.Lock()
+        self._session = requests.Session()
+        self._session.headers.update({
+            'x-api-key': api_key,
+            'anthropic-version': ANTHROPIC_VERSION,
+            'content-type': 'application/json',
+        })
+
+    def _retry_delay(self, attempt, retry_after=None):
+        """
+        第 attempt 次重试前的等待秒数。retry-after 可以是秒数或 HTTP 日期，
+        无法解析时使用指数退避；结果限制在 [0, max_retry_delay] 之间。
+        """
+        delay = self.backoff_factor * 2 ** attempt
+        if retry_after:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                try:
+                    delay = parsedate_to_datetime(retry_after).timestamp() - time.time()
+                except (TypeError, ValueError, OverflowError):
+                    pass
+        return min(max(delay, 0.0), self.max_retry_delay)
+
+    def create(self, model, system_prompt, user_prompt, max_tokens, temperature, acquire=None):
+        """
+        请求一次补全。
+
+        Args:
+            acquire (callable, optional): 每次发出 HTTP 请求 (包括重试) 前调用，例如 RateBudget.acquire，
+                使重试也计入请求速率限制。
+
+        Returns:
+            dict: {'text': 回复文本, 'usage': {'input_tokens', 'output_tokens'}}。
+        """
+        payload = {
+            'model': model,
+            'max_tokens': max_tokens,
+            'temperature': temperature,
+            'system': system_prompt,
+            'messages': [{'role': 'user', 'content': user_prompt}],
+        }
+        for attempt in range(self.max_retries + 1):
+            if acquire is not None:
+                acquire()
+            with self._lock:
+                self.request_count += 1
+            try:
+                response = self._session.post(f"{self.base_url}/v1/messages", json=payload, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self._retry_delay(attempt)
+                logger.warning("连接失败或超时 (%s)，%.1f 秒后重试", e, delay)
+                time.sleep(delay)
+                continue
+            if response.status_code in self.RETRY_STATUS_CODES and attempt < self.max_retries:
+                delay = self._retry_delay(attempt, response.headers.get('retry-after'))
+                logger.warning("请求返回 %s，%.1f 秒后重试", response.status_code, delay)
+                time.sleep(delay)
+                continue
+            response.raise_for_status()
+            data = response.json()
+            text = ''.join(block.get('text', '') for block in data.get('content', []) if block.get('type') == 'text')
+            usage = data.get('usage', {})
+            return {
+                'text': text,
+                'usage': {
+                    'input_tokens': usage.get('input_tokens', 0),
+                    'output_tokens': usage.get('output_tokens', 0),
+                },
+            }
+
+    def close(self):
+        self._session.close()
+
+
+class SceneBatchRunner:
+    """
+    对一组场景描述批量请求补全。
+
+    每个 (场景, 补全序号) 是一个任务，在线程池中并发执行：先查响应缓存，未命中时才占用速率和
+    token 预算并请求 API，因此提示词和采样设置未变化的批次重新运行时不会发出任何 API 请求。
+    预算不足的任务被跳过 (不影响其他任务)，结果中记录原因。
+    """
+
+    def __init__(self, client: MessagesClient, cache: ResponseCache, model, header, rules, example,
+                 max_tokens=8192, temperature=0.2, num_completions=2, max_workers=4, budget: RateBudget = None):
+        self.client = client
+        self.cache = cache
+        self.model = model
+        self.header = header
+        self.rules = rules
+        self.example = example
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.num_completions = num_completions
+        self.max_workers = max(1, max_workers)
+        self.budget = budget or RateBudget()
+
+    def _settings(self, completion_index):
+        return {
+            'model': self.model,
+            'max_tokens': self.max_tokens,
+            'temperature': self.temperature,
+            'completion_index': completion_index,
+        }
+
+    def _complete(self, system_prompt, user_prompt, completion_index):
+        """
+        Returns:
+            dict: {'text', 'usage', 'cached'}。
+        """
+        key = response_key(system_prompt, user_prompt, self._settings(completion_index))
+        cached = self.cache.get(key)
+        if cached is not None:
+            return {**cached, 'cached': True}
+
+        reserved = estimate_tokens(system_prompt) + estimate_tokens(user_prompt) + self.max_tokens
+        self.budget.reserve(reserved)
+        used = 0
+        try:
+            # 每次 HTTP 请求 (包括重试) 都占用一个速率配额
+            response = self.client.create(self.model, system_prompt, user_prompt, self.max_tokens, self.temperature,
+                                          acquire=self.budget.acquire)
+            used = response['usage']['input_tokens'] + response['usage']['output_tokens']
+        except Exception:
+            # 失败的请求可能已经计费，保守地按预留量结算
+            used = reserved
+            raise
+        finally:
+            self.budget.settle(reserved, used)
+        self.cache.put(key, response)
+        return {**response, 'cached': False}
+
+    def run(self, tasks, save_dir=None):
+        """
+        Args:
+            tasks (list): 场景描述列表。
+            save_dir (str, optional): 保存提示词和生成程序的目录，每个场景一个子目录
+                (<save_dir>/<场景名>/<补全序号>/program.py)。
+
+        Returns:
+            list: 与 tasks 一一对应的 dict：{'task', 'system_prompt', 'user_prompt', 'completions'}，
+                  completions 为每个补全的 {'text', 'program', 'usage', 'cached', 'error'}。
+        """
+        prompts = [build_prompts(task, self.header, self.rules, self.example) for task in tasks]
+        jobs = [(task_index, completion_index)
+                for task_index in range(len(tasks)) for completion_index in range(self.num_completions)]
+
+        def run_job(job):
+            task_index, completion_index = job
+            system_prompt, user_prompt = prompts[task_index]
+            try:
+                response = self._complete(system_prompt, user_prompt, completion_index)
+            except Exception as e:
+                logger.warning("场景 '%s' 的第 %s 个补全失败: %s", tasks[task_index], completion_index, e)
+                return {'text': None, 'program': None, 'usage': None, 'cached': False, 'error': str(e)}
+            return {**response, 'program': extract_program(response['text']), 'error': None}
+
+        logger.info("批量生成 %s 个场景，每个 %s 个补全 (并发数: %s)", len(tasks), self.num_completions, self.max_workers)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            completions = list(executor.map(run_job, jobs))
+
+        results = []
+        for task_index, task in enumerate(tasks):
+            system_prompt, user_prompt = prompts[task_index]
+            task_completions = completions[task_index * self.num_completions:(task_index + 1) * self.num_completions]
+            results.append({
+                'task': task,
+                'system_prompt': system_prompt,
+                'user_prompt': user_prompt,
+                'completions': task_completions,
+            })
+            if save_dir:
+                self._save(save_dir, results[-1])
+
+        cached = sum(1 for completion in completions if completion['cached'])
+        failed = sum(1 for completion in completions if completion['error'])
+        logger.info("批量生成完成: 缓存命中 %s, 新请求 %s, 失败 %s, 已用 token %s",
+                    cached, len(completions) - cached - failed, failed, self.budget.tokens_used)
+        return results
+
+    def _save(self, save_dir, result):
+        task_dir = os.path.join(save_dir, task_dirname(result['task']))
+        os.makedirs(task_dir, exist_ok=True)
+        for filename, text in (('system_prompt.txt', result['system_prompt']), ('user_prompt.txt', result['user_prompt'])):
+            with open(os.path.join(task_dir, filename), 'w', encoding='utf-8') as f:
+                f.write(text)
+        for completion_index, completion in enumerate(result['completions']):
+            if completion['program'] is None:
+                continue
+            completion_dir = os.path.join(task_dir, str(completion_index))
+            os.makedirs(completion_dir, exist_ok=True)
+            with open(os.path.join(completion_dir, 'program.py'), 'w', encoding='utf-8') as f:
+                f.write(completion['program'])
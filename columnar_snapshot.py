@@ -0,0 +1,185 @@
+# columnar_snapshot.py
+
+import logging
+import os
+import json
+import time
+import shutil
+import numpy as np
+from metrics import RUN_METRICS
+
+logger = logging.getLogger(__name__)
+
+
+def _intern_values(values):
+    """
+    将一列字符串编码为字符串池：每个不同的字符串只保存一次，各行只保存 int32 编号 (-1 表示缺失)。
+
+    Returns:
+        tuple: (codes, offsets, blob) 三个 NumPy 数组。
+    """
+    import pandas as pd
+    codes, pool = pd.factorize(values, use_na_sentinel=True)
+    codes = codes.astype(np.int32)
+    encoded = [value.encode('utf-8') for value in pool.tolist()]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(item) for item in encoded], out=offsets[1:])
+    blob = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    return codes, offsets, blob
+
+
+class ColumnarSnapshot:
+    """
+    讲座时间线的列式本地快照。
+
+    目录中每列单独存储为 NumPy 文件：'讲座时间' 预先解析为 datetime64 并已排序，
+    其他列以字符串池 (codes/offsets/pool) 存储，非字符串的值 (如海报附件列表) 先序列化为 JSON。
+    读取时以内存映射方式打开，只解码所需的列以及日期范围内的行 (二分查找定位)。
+    读取路径只依赖 NumPy，pandas 只在写入和构造 DataFrame 时才导入，以便轻量的命令行子命令快速启动。
+    """
+
+    FORMAT_VERSION = 1
+    META_FILENAME = 'meta.json'
+    TIME_COLUMN = '讲座时间'
+
+    def __init__(self, path):
+        self.path = path
+
+    def exists(self):
+        return os.path.exists(os.path.join(self.path, self.META_FILENAME))
+
+    def _column_file(self, directory, index, suffix):
+        # 列名可能包含路径中不允许的字符，文件名只使用列序号
+        return os.path.join(directory, f"col{index}.{suffix}.npy")
+
+    def write(self, timeline_df):
+        """
+        保存 build_lecture_timeline 的结果 (已按讲座时间排序，且不含无效时间的行)。
+        先写入临时目录，完成后整体替换旧快照。
+
+        Args:
+            timeline_df (pd.DataFrame): 已排序的讲座时间线。
+        """
+        import pandas as pd
+
+        if timeline_df.empty or self.TIME_COLUMN not in timeline_df.columns:
+            logger.info("没有可保存到列式快照的数据。")
+            return
+
+        with RUN_METRICS.stage('snapshot_write'):
+            tmp_dir = f"{self.path}.tmp"
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            os.makedirs(tmp_dir)
+
+            columns = []
+            for index, column in enumerate(timeline_df.columns):
+                if column == self.TIME_COLUMN:
+                    np.save(self._column_file(tmp_dir, index, 'time'), timeline_df[column].to_numpy())
+                    columns.append({'name': column, 'kind': 'datetime'})
+                    continue
+
+                values = timeline_df[column]
+                kind = 'string' if pd.api.types.infer_dtype(values, skipna=True) in ('string', 'empty') else 'json'
+                if kind == 'json':
+                    present = values.notna()
+                    values = values.astype(object).where(present, None)
+                    values[present] = values[present].map(
+                        lambda value: json.dumps(value, ensure_ascii=False, sort_keys=True, default=str))
+                codes, offsets, blob = _intern_values(values)
+                np.save(self._column_file(tmp_dir, index, 'codes'), codes)
+                np.save(self._column_file(tmp_dir, index, 'offsets'), offsets)
+                np.save(self._column_file(tmp_dir, index, 'pool'), blob)
+                columns.append({'name': column, 'kind': kind})
+
+            meta = {
+                'version': self.FORMAT_VERSION,
+                'row_count': len(timeline_df),
+                'columns': columns,
+                'written_at': time.time(),
+            }
+            with open(os.path.join(tmp_dir, self.META_FILENAME), 'w', encoding='utf-8') as f:
+                json.dump(meta, f, ensure_ascii=False, indent=2)
+
+            old_dir = f"{self.path}.old"
+            shutil.rmtree(old_dir, ignore_errors=True)
+            if os.path.exists(self.path):
+                os.replace(self.path, old_dir)
+            os.replace(tmp_dir, self.path)
+            shutil.rmtree(old_dir, ignore_errors=True)
+        logger.info("列式快照已保存: %s (%s 行, %s 列)", self.path, len(timeline_df), len(columns))
+
+    def _load_meta(self):
+        with open(os.path.join(self.path, self.META_FILENAME), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != self.FORMAT_VERSION:
+            raise ValueError(f"不支持的列式快照版本: {meta.get('version')}")
+        return meta
+
+    def _decode_column(self, index, kind, lo, hi):
+        codes = np.load(self._column_file(self.path, index, 'codes'), mmap_mode='r')[lo:hi]
+        offsets = np.load(self._column_file(self.path, index, 'offsets'), mmap_mode='r')
+        blob = np.load(self._column_file(self.path, index, 'pool'), mmap_mode='r')
+
+        # 只解码范围内实际出现的字符串，每个不同的值解码一次
+        unique_codes, inverse = np.unique(codes, return_inverse=True)
+        decoded = []
+        for code in unique_codes:
+            if code < 0:
+                decoded.append(None)
+                continue
+            text = blob[offsets[code]:offsets[code + 1]].tobytes().decode('utf-8')
+            decoded.append(json.loads(text) if kind == 'json' else text)
+        return [decoded[position] for position in inverse.reshape(-1)]
+
+    def read_columns(self, columns=None, start_date_str=None, end_date_str=None):
+        """
+        读取快照中日期范围内的行，不依赖 pandas。
+
+        Args:
+            columns (list, optional): 需要的列，默认为全部列。'讲座时间' 总是包含在内。
+            start_date_str (str, optional): 起始日期字符串 (YYYY-MM-DD)。
+            end_date_str (str, optional): 结束日期字符串 (YYYY-MM-DD)，包含当天。
+
+        Returns:
+            dict: 列名 -> 值列表 ('讲座时间' 为 datetime64 数组)，按讲座时间排序。
+        """
+        with RUN_METRICS.stage('snapshot_read'):
+            meta = self._load_meta()
+            positions = {column['name']: index for index, column in enumerate(meta['columns'])}
+            time_index = positions[self.TIME_COLUMN]
+            times = np.load(self._column_file(self.path, time_index, 'time'), mmap_mode='r')
+
+            lo, hi = 0, len(times)
+            if start_date_str:
+                start = np.datetime64(start_date_str, 'D').astype(times.dtype)
+                lo = int(times.searchsorted(start, side='left'))
+            if end_date_str:
+                end_exclusive = np.datetime64(end_date_str, 'D') + np.timedelta64(1, 'D')
+                hi = int(times.searchsorted(end_exclusive.astype(times.dtype), side='left'))
+            hi = max(lo, hi)
+
+            wanted = [column['name'] for column in meta['columns']] if columns is None else list(columns)
+            data = {}
+            for name in wanted:
+                if name not in positions:
+                    continue
+                index = positions[name]
+                if name == self.TIME_COLUMN:
+                    data[name] = np.array(times[lo:hi])
+                else:
+                    data[name] = self._decode_column(index, meta['columns'][index]['kind'], lo, hi)
+            if self.TIME_COLUMN not in data:
+                data[self.TIME_COLUMN] = np.array(times[lo:hi])
+
+        RUN_METRICS.incr('snapshot_rows_read', hi - lo)
+        return data
+
+    def read(self, columns=None, start_date_str=None, end_date_str=None):
+        """
+        读取快照中日期范围内的行，参数同 read_columns。
+
+        Returns:
+            pd.DataFrame: 按讲座时间排序的讲座信息DataFrame。
+        """
+        import pandas as pd
+        return pd.DataFrame(self.read_columns(columns, start_date_str, end_date_str))
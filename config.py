@@ -1,6 +1,7 @@
 # config.py
 
 import os
+import re
 import datetime
 
 # --- SeaTable API 配置 ---
@@ -10,15 +11,81 @@ API_TOKEN = '895abfe18ac0f35568788a864515782011c160fc'
 BASE_NAME = '讲座信息收集'
 TABLE_NAME = '春季学期讲座信息收集'
 
+# --- 多数据源配置 ---
+# 讲座分散在多个 base/表 (例如每个学期或院系一张表) 时，在此列出全部数据源，程序会并发获取、
+# 统一列名并合并，同一场讲座 (时间和名称相同) 出现在多个数据源中时只保留一条。
+# 为空时只使用上面的 API_TOKEN/BASE_NAME/TABLE_NAME。每个 base 有自己的 API Token；
+# 'server_url' 默认为 SERVER_URL，'column_mapping' 为该数据源特有的 源列名 -> 标准列名。
+# SEATABLE_SOURCES = [
+#     {'name': '春季学期', 'api_token': '...', 'base_name': '讲座信息收集', 'table_name': '春季学期讲座信息收集'},
+#     {'name': '文学院', 'api_token': '...', 'base_name': '文学院讲座', 'table_name': '讲座',
+#      'column_mapping': {'题目': '讲座名称（全称）'}},
+# ]
+SEATABLE_SOURCES = []
+SOURCE_FETCH_WORKERS = 4 # 并发访问的数据源数
+# 各数据源通用的列名别名 -> 标准列名 (REPORT_COLUMNS)
+COLUMN_ALIASES = {
+    '讲座名称': '讲座名称（全称）',
+    '讲座报告人': '讲座报告人+职称',
+    '报告人': '讲座报告人+职称',
+    '主讲人': '讲座报告人+职称',
+    '具体时间': '具体时间（例：14:00-15:00）',
+    '地点': '讲座地点',
+    '讲座内容': '讲座内容（摘要）',
+    '内容摘要': '讲座内容（摘要）',
+    '讲座海报': '讲座海报照片',
+    '海报': '讲座海报照片',
+}
+
 # --- 筛选时间范围 ---
 START_DATE_STR = '2025-05-24'
 END_DATE_STR = '2025-05-31'
 
+# --- 数据获取配置 ---
+# 'sql': 通过 SQL 查询接口在服务端按日期筛选并只获取所需列 (不可用时自动回退)
+# 'full': 获取整张表，在本地筛选
+# 'delta': 只获取上次同步后修改过的行，合并进本地快照 SNAPSHOT_PATH 后在本地筛选
+# 'stream': 分页获取整张表，每页到达时即在本地筛选
+# 'local': 不访问服务器获取数据，直接从列式快照 COLUMNAR_SNAPSHOT_DIR 读取 (快照不存在时全量获取)；
+#          只有海报缓存未命中时才认证并下载 SeaTable 海报
+FETCH_MODE = 'sql'
+SQL_PAGE_SIZE = 10000 # 单次 SQL 查询返回的最大行数 (SeaTable 上限为 10000)
+SNAPSHOT_PATH = 'lecture_snapshot.json' # 'delta' 模式的本地行快照
+FETCH_PAGE_SIZE = 1000 # 'stream' 模式每页行数
+COLUMNAR_SNAPSHOT_DIR = 'lecture_columns' # 'full'/'delta' 模式获取整张表后保存的列式快照，设为 None 可禁用
+LECTURE_INDEX_PATH = 'lecture_index.sqlite3' # 获取整张表后增量更新的全文索引 (python main.py search)，设为 None 可禁用
+# 报告实际用到的列，'sql' 模式下只有这些列会被传输
+REPORT_COLUMNS = [
+    '讲座名称（全称）',
+    '讲座报告人+职称',
+    '讲座时间',
+    '具体时间（例：14:00-15:00）',
+    '讲座地点',
+    '讲座内容（摘要）',
+    '讲座海报照片',
+]
+
 # --- 输出文件配置 ---
 OUTPUT_WORD_FILENAME = f'讲座信息_{START_DATE_STR}_至_{END_DATE_STR}.docx'
 OUTPUT_MARKDOWN_FILENAME = f'讲座信息_{START_DATE_STR}_至_{END_DATE_STR}.md'
 OUTPUT_CSV_FILENAME = f'讲座信息_{START_DATE_STR}_至_{END_DATE_STR}.csv' # 确保这行存在！
 TEMP_IMAGE_DIR = 'temp_lecture_images'
+# Word 文档生成后端: 'pandoc' (生成 Markdown 后调用 Pandoc) 或 'native' (python-docx 直接生成，无需 Pandoc)
+DOCX_BACKEND = 'pandoc'
+PANDOC_PROBE_CACHE = '.pandoc_probe.json' # Pandoc 检测结果的缓存文件 (按可执行文件路径和修改时间失效)，设为 None 可禁用
+
+def build_search_filenames(keywords, start_date_str=None, end_date_str=None):
+    """返回检索结果报告的 (Markdown 文件名, Word 文件名)。"""
+    name = '_'.join(re.sub(r'[\\/:*?"<>|\s]+', '-', keyword) for keyword in keywords) or '全部'
+    name = f"{name}_{start_date_str or '最早'}_至_{end_date_str or '最晚'}"
+    return f'讲座检索_{name}.md', f'讲座检索_{name}.docx'
+
+def build_output_filenames(start_date_str, end_date_str):
+    """返回指定日期范围对应的 (Markdown 文件名, Word 文件名)，用于批量模式。"""
+    return (
+        f'讲座信息_{start_date_str}_至_{end_date_str}.md',
+        f'讲座信息_{start_date_str}_至_{end_date_str}.docx',
+    )
 
 # --- 其他配置 ---
 REQUEST_HEADERS = {
@@ -27,3 +94,48 @@ REQUEST_HEADERS = {
     'Referer': SERVER_URL
 }
 IMAGE_DOWNLOAD_TIMEOUT = 15
+
+# --- 共享 HTTP 客户端配置 (http_client.py) ---
+HTTP_MAX_RETRIES = 3 # 连接错误、超时和 5xx 响应的最大重试次数
+HTTP_BACKOFF_FACTOR = 0.5 # 指数退避系数，第 n 次重试前等待 factor * 2^(n-1) 秒
+HTTP_POOL_MAXSIZE = 8 # 每个主机保持的 keep-alive 连接数，应不小于并发下载数
+HTTP_RATE_LIMIT = 10 # 每个主机每秒请求数上限，设为 None 可禁用限速
+HTTP_RATE_BURST = 20 # 令牌桶容量，允许的短时突发请求数
+
+# --- 海报并发下载配置 ---
+IMAGE_DOWNLOAD_WORKERS = 8 # 并发下载线程数
+IMAGE_DOWNLOAD_PER_HOST = 4 # 每个主机同时进行的下载数上限
+
+# --- 海报转码配置 ---
+POSTER_TARGET_FORMAT = 'JPEG' # 所有海报统一转换的格式: 'JPEG'、'PNG' 或 'WEBP'
+POSTER_MAX_DIMENSION = 1600 # 海报最长边的像素上限，超出时等比缩小
+POSTER_QUALITY = 85 # JPEG/WebP 编码质量
+POSTER_TRANSCODE_WORKERS = 4 # 并行转码的工作进程数
+# 相同的海报只保留一个文件：内容哈希相同，或 dHash 汉明距离不超过该值且通过逐像素比较
+# (重新编码或等比缩放的副本)。同一模板只改讲者或日期的海报 dHash 可能相同，由逐像素比较区分。
+# 设为 None 可禁用去重
+POSTER_DEDUP_MAX_DISTANCE = 0
+
+# --- 海报持久化缓存配置 ---
+POSTER_CACHE_DIR = '.poster_cache' # 设为 None 可禁用缓存
+POSTER_CACHE_MAX_BYTES = 500 * 1024 * 1024 # 缓存字节预算，超出后按最近最少使用淘汰
+
+# --- 讲座片段缓存配置 ---
+FRAGMENT_CACHE_DIR = '.fragment_cache' # 已渲染讲座片段的缓存目录，设为 None 可禁用
+FRAGMENT_CACHE_MAX_ENTRIES = 5000 # 最多保留的片段数，超出后淘汰最久未使用的片段
+
+# --- 分阶段流水线配置 (获取、筛选、海报下载、渲染重叠执行) ---
+PIPELINE_QUEUE_SIZE = 256 # 相邻阶段之间最多缓冲的讲座条数，队列满时上游阶段等待
+PIPELINE_RENDER_BATCH_SIZE = 64 # 渲染阶段每批格式化的讲座条数
+
+# --- 监视模式配置 (python main.py --watch) ---
+WATCH_INTERVAL_SECONDS = 300 # 变化检测的间隔
+TOKEN_REFRESH_MARGIN_SECONDS = 3600 # 访问令牌过期前多久重新认证
+
+# --- 批量模式配置 ---
+BATCH_PANDOC_WORKERS = 4 # 并行执行 Pandoc 转换的工作进程数
+
+# --- 日志与运行指标配置 ---
+LOG_LEVEL = 'INFO' # 命令行 -q 为 'WARNING'，-v 为 'DEBUG'
+METRICS_JSON_PATH = 'run_metrics.json' # 每次运行结束时写出的 JSON 运行报告，设为 None 可禁用
+METRICS_PROMETHEUS_PATH = None # 可选的 Prometheus 文本文件路径
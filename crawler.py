@@ -1,14 +1,151 @@
+import os
 import requests
+from http_client import get_http_client
 import pandas as pd
 import json # 用于在调试时查看JSON结构
 
+# 可选依赖: 安装 ijson 后可增量解析响应，无需将整个 JSON 载入内存
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+ROW_PREFIXES = ('tables.item.rows.item', 'rows.item') # 讲座行所在的 JSON 路径 (ijson 前缀)
+ROWS_ARRAY_PREFIXES = ('tables.item.rows', 'rows') # 行数组本身的前缀
+
+
+def _iter_streamed_rows(stream, structure=None):
+    """
+    用 ijson 增量解析响应流，逐行产出 `tables[0].rows` (或顶层 `rows`) 中的行。
+    每次只在内存中构建一行，读到第二个表格时立即停止。
+
+    Args:
+        structure (dict, optional): 解析过程中记录响应结构：'tables' 为是否出现了表格，
+                                    'rows' 为是否找到了行数组 (空数组也算找到)。
+    """
+    if structure is None:
+        structure = {}
+    structure.setdefault('tables', False)
+    structure.setdefault('rows', False)
+    table_count = 0
+    builder = None
+    row_prefix = None
+    for prefix, event, value in ijson.parse(stream, use_float=True):
+        if builder is not None:
+            builder.event(event, value)
+            if prefix == row_prefix and event == 'end_map':
+                yield builder.value
+                builder = None
+            continue
+        if prefix == 'tables.item' and event == 'start_map':
+            table_count += 1
+            structure['tables'] = True
+            if table_count > 1:
+                return
+        elif prefix in ROWS_ARRAY_PREFIXES and event == 'start_array':
+            structure['rows'] = True
+        elif prefix in ROW_PREFIXES and event == 'start_map':
+            row_prefix = prefix
+            builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+
+
+def _print_structure_error(has_tables):
+    if has_tables:
+        print("错误：API响应的 'tables' 键中第一个元素未找到 'rows' 键或其不是列表结构。")
+    else:
+        print("错误：API响应中未找到预期的讲座数据结构 ('tables'[0]['rows'] 或 'rows')。")
+
+
+def _iter_loaded_rows(data):
+    """从已完整解析的 JSON 中取出讲座行 (未安装 ijson 时使用)。"""
+    if 'tables' in data and isinstance(data['tables'], list) and len(data['tables']) > 0:
+        first_table = data['tables'][0]
+        if 'rows' in first_table and isinstance(first_table['rows'], list):
+            return first_table['rows']
+        _print_structure_error(has_tables=True)
+        return None
+    # 兼容性检查：如果数据直接在 'rows' 键下
+    if 'rows' in data and isinstance(data['rows'], list):
+        return data['rows']
+    _print_structure_error(has_tables=False)
+    return None
+
+
+def _collect_rows(rows, column_mapping, preview=False):
+    """
+    逐行收集数据，提供 column_mapping 时每行只保留映射中的列。
+
+    Returns:
+        tuple: (行列表, 实际出现的映射列, 是否应用了映射)
+    """
+    collected = []
+    seen_columns = set()
+    apply_mapping = bool(column_mapping)
+    for row in rows:
+        if not collected:
+            if preview:
+                print("\n--- API 响应数据预览（第一行） ---")
+                print(json.dumps(row, ensure_ascii=False, indent=2)[:1000])
+                print("--- API 响应数据预览结束 ---\n")
+            if apply_mapping and not any(api_col in row for api_col in column_mapping):
+                # 第一行就没有任何映射列，视为映射不匹配，保留所有原始列
+                print("警告：提供的column_mapping中没有键与API响应的列名匹配。未进行列筛选和重命名。")
+                apply_mapping = False
+        if apply_mapping:
+            row = {api_col: row[api_col] for api_col in column_mapping if api_col in row}
+            seen_columns.update(row)
+        collected.append(row)
+    return collected, [api_col for api_col in (column_mapping or {}) if api_col in seen_columns], apply_mapping
+
+
+def _load_conditional_cache(cache_path, api_url, column_mapping):
+    """读取上次爬取的缓存 (URL 和列映射都一致时才有效)。"""
+    if not cache_path or not os.path.exists(cache_path):
+        return None
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"警告：爬取缓存损坏，将重新下载: {e}")
+        return None
+    if cache.get('url') != api_url or cache.get('column_mapping') != (column_mapping or None):
+        return None
+    return cache
+
+
+def _save_conditional_cache(cache_path, api_url, column_mapping, response, df):
+    """保存 ETag/Last-Modified 以及 (已筛选的) 数据，供下次条件请求使用。"""
+    etag = response.headers.get('ETag')
+    last_modified = response.headers.get('Last-Modified')
+    if not etag and not last_modified:
+        return # 服务器不支持条件请求，缓存没有意义
+    cache = {
+        'url': api_url,
+        'column_mapping': column_mapping or None,
+        'etag': etag,
+        'last_modified': last_modified,
+        'columns': list(df.columns),
+        'rows': df.to_dict('split')['data'],
+    }
+    tmp_path = f"{cache_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False)
+    os.replace(tmp_path, cache_path)
+
+
 # --- 新的爬取函数，针对API请求和JSON数据 ---
-def scrape_nju_api_data(api_url, headers, column_mapping=None):
+def scrape_nju_api_data(api_url, headers, column_mapping=None, cache_path=None, preview=False):
     """
     爬取指定API URL的JSON数据，并转换为DataFrame。
     如果提供了 column_mapping，则根据映射筛选和重命名列。
     此版本已更新以处理数据在 `data['tables'][0]['rows']` 结构中的情况。
 
+    安装了 ijson 时响应以流的方式增量解析，每行读入后只保留映射中的列，
+    不会把整个导出载入内存；未安装时回退为 response.json()。
+    提供 cache_path 时会发送 If-None-Match/If-Modified-Since 条件请求，
+    服务器返回 304 (导出未变化) 时直接使用缓存的数据，不再下载和解析。
+
     Args:
         api_url (str): 目标API的URL。
         headers (dict): 包含认证信息（如Cookie）的请求头。
@@ -16,84 +153,78 @@ def scrape_nju_api_data(api_url, headers, column_mapping=None):
                                           值是你想重命名成的中文名。
                                           例如: {"8Y7q": "标题", "3EYP": "主讲人"}。
                                           默认为None，表示不进行列筛选和重命名。
+        cache_path (str, optional): 条件请求缓存文件路径。默认为None，表示不缓存。
+        preview (bool, optional): 是否打印第一行数据预览（用于调试，了解数据结构）。
 
     Returns:
         pandas.DataFrame: 包含爬取数据的DataFrame，如果失败则返回None。
     """
     print(f"正在尝试从 API: {api_url} 爬取数据...")
 
+    json_errors = (json.JSONDecodeError,) + ((ijson.JSONError,) if ijson is not None else ())
+    response = None
     try:
-        # 发送HTTP GET请求获取API数据
-        response = requests.get(api_url, headers=headers)
+        request_headers = {'Accept': 'application/json', **headers}
+        cache = _load_conditional_cache(cache_path, api_url, column_mapping)
+        if cache:
+            if cache.get('etag'):
+                request_headers['If-None-Match'] = cache['etag']
+            if cache.get('last_modified'):
+                request_headers['If-Modified-Since'] = cache['last_modified']
+
+        # 发送HTTP GET请求获取API数据 (流式读取响应体，共享客户端负责连接复用、重试和限速)
+        response = get_http_client().get(api_url, headers=request_headers, stream=ijson is not None)
+        if response.status_code == 304 and cache:
+            print(f"API 数据未变化 (304)，使用缓存的 {len(cache['rows'])} 条数据。")
+            return pd.DataFrame(cache['rows'], columns=cache['columns'])
         response.raise_for_status()  # 检查请求是否成功
 
-        # 解析JSON响应
-        data = response.json()
-
-        # 打印原始JSON数据（用于调试，了解数据结构）
-        print("\n--- API 响应数据预览（前1000字符） ---")
-        print(json.dumps(data, indent=2)[:1000])
-        print("--- API 响应数据预览结束 ---\n")
-
-        df = None # 初始化 DataFrame
-
-        # --- 新的数据提取逻辑 ---
-        # 尝试从 data['tables'][0]['rows'] 中提取数据
-        if 'tables' in data and isinstance(data['tables'], list) and len(data['tables']) > 0:
-            first_table = data['tables'][0]
-            if 'rows' in first_table and isinstance(first_table['rows'], list):
-                df = pd.DataFrame(first_table['rows'])
-                print(f"成功从API爬取 {len(first_table['rows'])} 条数据 (来自 tables[0]['rows'])。")
-            else:
-                print("错误：API响应的 'tables' 键中第一个元素未找到 'rows' 键或其不是列表结构。")
+        # --- 数据提取逻辑 ---
+        # 从 data['tables'][0]['rows'] (或顶层 'rows') 中逐行提取数据
+        if ijson is not None:
+            response.raw.decode_content = True # 处理 gzip 等压缩编码
+            structure = {}
+            collected, selected_columns, mapping_applied = _collect_rows(
+                _iter_streamed_rows(response.raw, structure), column_mapping, preview)
+            if not structure['rows']:
+                # 与非流式解析一致：找不到行数组时视为失败，不返回 (也不缓存) 空数据
+                _print_structure_error(structure['tables'])
                 return None
-        # 兼容性检查：如果数据直接在 'rows' 键下（虽然根据你的描述不太可能，但保留）
-        elif 'rows' in data and isinstance(data['rows'], list):
-            df = pd.DataFrame(data['rows'])
-            print(f"成功从API爬取 {len(data['rows'])} 条原始数据 (来自 'rows' 键)。")
         else:
-            print("错误：API响应中未找到预期的讲座数据结构 ('tables'[0]['rows'] 或 'rows')。")
-            return None
-
-        if df is None: # 如果以上任何情况都没成功提取数据
-            return None
-
-        # --- 应用列筛选和重命名 (这部分逻辑保持不变) ---
-        if column_mapping:
-            # 获取DataFrame中实际存在的列名
-            df_columns = set(df.columns)
-
-            # 过滤出column_mapping中那些在df_columns中存在的键
-            valid_columns_to_map = {
-                api_col: display_name
-                for api_col, display_name in column_mapping.items()
-                if api_col in df_columns
-            }
-
-            if not valid_columns_to_map:
-                print("警告：提供的column_mapping中没有键与API响应的列名匹配。未进行列筛选和重命名。")
-                return df # 返回原始DataFrame，因为它没有匹配的列
-
-            # 1. 筛选列：只保留我们需要的列
-            selected_columns = list(valid_columns_to_map.keys())
-            df_filtered = df[selected_columns].copy() # 使用.copy()避免SettingWithCopyWarning
-
-            # 2. 重命名列
-            df_renamed = df_filtered.rename(columns=valid_columns_to_map)
+            rows = _iter_loaded_rows(response.json())
+            if rows is None:
+                return None
+            collected, selected_columns, mapping_applied = _collect_rows(rows, column_mapping, preview)
+        print(f"成功从API爬取 {len(collected)} 条数据。")
 
+        # --- 应用列筛选和重命名 ---
+        if mapping_applied:
+            valid_columns_to_map = {api_col: column_mapping[api_col] for api_col in selected_columns}
+            df = pd.DataFrame(collected, columns=selected_columns).rename(columns=valid_columns_to_map)
             print(f"根据映射筛选并重命名了 {len(valid_columns_to_map)} 列。")
-            return df_renamed
         else:
-            print("未提供 column_mapping，返回所有原始列。")
-            return df
+            df = pd.DataFrame(collected)
+            if not column_mapping:
+                print("未提供 column_mapping，返回所有原始列。")
+
+        if cache_path:
+            try:
+                _save_conditional_cache(cache_path, api_url, column_mapping, response, df)
+            except (OSError, TypeError, ValueError) as e:
+                print(f"警告：保存爬取缓存失败: {e}")
+        return df
 
     except requests.exceptions.RequestException as e:
         print(f"请求API错误：{e}")
         return None
-    except json.JSONDecodeError:
+    except json_errors:
         print("错误：API响应不是有效的JSON格式。")
-        print(f"响应内容（非JSON）：{response.text[:500]}...")
+        if response is not None and ijson is None:
+            print(f"响应内容（非JSON）：{response.text[:500]}...")
         return None
     except Exception as e:
         print(f"发生未知错误：{e}")
-        return None
\ No newline at end of file
+        return None
+    finally:
+        if response is not None:
+            response.close()
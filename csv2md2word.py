@@ -1,9 +1,64 @@
 import csv
 import os
+import sys
+import itertools
 import pypandoc  # 推荐使用，需要 pip install pypandoc
 import tempfile
 import requests
-import uuid
+from http_client import get_http_client
+import shutil
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# 从Content-Type获取文件扩展名
+EXTENSION_MAP = {
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'image/gif': '.gif',
+    'image/bmp': '.bmp',
+    'image/webp': '.webp',
+    'image/svg+xml': '.svg'  # SVG图片可能需要特殊的pandoc版本或配置来嵌入
+}
+
+
+def _download_image_to_content_path(image_url, temp_img_dir):
+    """
+    流式下载图片，边写临时文件边计算 SHA-256，最后以内容哈希命名 (<sha256><ext>)。
+    内容相同的图片 (即使 URL 不同) 只保留一个文件。
+
+    Returns:
+        str: 本地图片的绝对路径。
+    """
+    # 设置请求超时 (共享客户端负责连接复用、重试和限速)
+    response = get_http_client().get(image_url, stream=True, timeout=10)
+    try:
+        response.raise_for_status()  # 检查HTTP响应状态码，如果不是200会抛出HTTPError
+
+        content_type = response.headers.get('Content-Type', '').split(';')[0]
+        ext = EXTENSION_MAP.get(content_type, '.bin')  # 默认为.bin，防止未知类型
+
+        hasher = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(mode='wb', delete=False, dir=temp_img_dir, suffix='.part') as f:
+            tmp_path = f.name
+            try:
+                for chunk in response.iter_content(chunk_size=8192):
+                    hasher.update(chunk)
+                    f.write(chunk)
+            except BaseException:
+                # 下载中断时不留下不完整的 .part 文件
+                f.close()
+                os.remove(tmp_path)
+                raise
+    finally:
+        response.close()
+
+    local_img_path = os.path.abspath(os.path.join(temp_img_dir, f"{hasher.hexdigest()}{ext}"))
+    if os.path.exists(local_img_path):
+        os.remove(tmp_path)
+    else:
+        os.replace(tmp_path, local_img_path)
+    return local_img_path
+
 
 def download_image_and_get_markdown(image_url, temp_img_dir, alt_text="图片"):
     """
@@ -14,30 +69,7 @@ def download_image_and_get_markdown(image_url, temp_img_dir, alt_text="图片"):
         return ""  # 如果没有URL，返回空字符串
 
     try:
-        # 设置请求超时
-        response = requests.get(image_url, stream=True, timeout=10)
-        response.raise_for_status()  # 检查HTTP响应状态码，如果不是200会抛出HTTPError
-
-        # 从Content-Type获取文件扩展名
-        content_type = response.headers.get('Content-Type', '').split(';')[0]
-        extension_map = {
-            'image/jpeg': '.jpg',
-            'image/png': '.png',
-            'image/gif': '.gif',
-            'image/bmp': '.bmp',
-            'image/webp': '.webp',
-            'image/svg+xml': '.svg'  # SVG图片可能需要特殊的pandoc版本或配置来嵌入
-        }
-        ext = extension_map.get(content_type, '.bin')  # 默认为.bin，防止未知类型
-
-        # 生成唯一的本地文件名
-        unique_filename = f"{uuid.uuid4()}{ext}"
-        local_img_path = os.path.join(temp_img_dir, unique_filename)
-
-        with open(local_img_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-
+        local_img_path = _download_image_to_content_path(image_url, temp_img_dir)
         print(f"Downloaded: {image_url} to {local_img_path}")
         # 返回 Markdown 图片语法
         # 注意：Markdown语法中图片路径需要是相对路径或绝对路径，
@@ -54,71 +86,223 @@ def download_image_and_get_markdown(image_url, temp_img_dir, alt_text="图片"):
     except Exception as e:
         print(f"Warning: An unexpected error occurred during image download/save from {image_url}: {e}")
         return f"[图片处理错误：{image_url}]"
-def csv_to_markdown_to_word(csv_filepath, output_word_filepath):
+
+
+def resolve_image_markdown(image_urls, temp_img_dir, alt_text="图片", max_workers=8):
+    """
+    批量解析图片：URL 去重后并发下载，每个 URL 只下载一次。
+
+    Args:
+        image_urls (iterable): 图片 URL (可以重复)。
+        temp_img_dir (str): 图片保存目录。
+        alt_text (str, optional): Markdown 图片的替代文本。
+        max_workers (int, optional): 并发下载线程数。
+
+    Returns:
+        dict: URL -> Markdown 图片链接 (失败时为错误提示文本)。
+    """
+    unique_urls = sorted({url for url in image_urls if url})
+    if not unique_urls:
+        return {}
+    os.makedirs(temp_img_dir, exist_ok=True)
+    workers = max(1, min(max_workers, len(unique_urls)))
+    print(f"Resolving {len(unique_urls)} unique image URL(s) with {workers} threads...")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        markdown = executor.map(
+            lambda url: download_image_and_get_markdown(url, temp_img_dir, alt_text), unique_urls)
+        return dict(zip(unique_urls, markdown))
+
+
+def _collect_image_urls(csv_filepath, image_columns):
+    """第一遍扫描 CSV，只收集图片列中的 URL 集合。"""
+    with open(csv_filepath, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f)
+        headers = next(reader)
+        positions = [headers.index(column) for column in image_columns if column in headers]
+        urls = set()
+        for row in reader:
+            for position in positions:
+                if position < len(row) and row[position].strip():
+                    urls.add(row[position].strip())
+    return urls
+
+
+def _escape_cells(cells):
+    # 确保每个单元格内容中的管道符 | 被转义，否则会破坏Markdown表格结构
+    return [cell.replace('|', '\\|') for cell in cells]
+
+
+def _table_header_lines(headers):
+    """Markdown 表头和分隔线 (每列一个 ---)。"""
+    return [
+        f"| {' | '.join(_escape_cells(headers))} |\n",
+        f"|{'---|' * len(headers)}\n",
+    ]
+
+
+def _iter_row_chunks(reader, chunk_size):
+    """按 chunk_size 行一批读取 CSV，内存中最多只保留一批。"""
+    while True:
+        chunk = list(itertools.islice(reader, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _convert_markdown_part(md_path, docx_path):
+    """在工作进程中用 pypandoc 转换一个 Markdown 文件，返回是否成功。"""
+    try:
+        # `extra_args` 可以添加额外的 Pandoc 参数，例如样式文件
+        # pypandoc.convert_file(md_path, 'docx', outputfile=docx_path, extra_args=['--reference-doc=path/to/your/template.docx'])
+        pypandoc.convert_file(md_path, 'docx', outputfile=docx_path)
+        print(f"Successfully created Word document: {docx_path}")
+        return True
+    except Exception as e:
+        print(f"Error during Pandoc conversion of '{md_path}': {e}")
+        print("Please ensure Pandoc is installed and accessible in your system's PATH.")
+        print("You can verify by running 'pandoc --version' in your terminal.")
+        return False
+
+
+def _part_filepath(output_word_filepath, part_number):
+    stem, ext = os.path.splitext(output_word_filepath)
+    return f"{stem}_part{part_number}{ext or '.docx'}"
+
+
+def csv_to_markdown_to_word(csv_filepath, output_word_filepath, section_rows=None, split_parts=False,
+                            chunk_size=1000, workers=4, echo=False,
+                            image_columns=None, temp_img_dir=None, image_workers=8):
     """
     读取CSV文件，转换为Markdown格式，然后生成Word文档。
 
+    CSV 按 chunk_size 行分批读取，Markdown 逐批写入临时文件，内存占用不随行数增长。
+
     Args:
         csv_filepath (str): 输入的CSV文件路径。
         output_word_filepath (str): 输出的Word文件路径 (例如 'output.docx')。
+        section_rows (int, optional): 每 section_rows 行拆分为一个带标题的独立表格。默认为None，表示只生成一个表格。
+        split_parts (bool, optional): 与 section_rows 一起使用，每个分段生成单独的 Word 文档
+                                      (output_XXX_part1.docx, ...)，并在多个进程中并行转换。
+        chunk_size (int, optional): 每批读取的行数。
+        workers (int, optional): 并行转换的进程数 (仅 split_parts 时使用)。
+        echo (bool, optional): 是否将生成的 Markdown 同时打印到标准输出 (用于调试)。
+        image_columns (list, optional): 内容为图片 URL 的列名。这些列中的 URL 会先去重并发下载，
+                                        再替换为指向本地文件 (按内容哈希命名) 的 Markdown 图片链接。
+        temp_img_dir (str, optional): 图片保存目录。默认为None，表示使用临时目录并在转换后删除。
+        image_workers (int, optional): 并发下载图片的线程数。
+
+    Returns:
+        list: 成功生成的 Word 文档路径。
     """
-    md_content = []
+    temp_md_paths = []
+    parts = [] # (Markdown 临时文件, Word 输出路径)
+    created = []
+    owns_img_dir = image_columns and temp_img_dir is None
+    if owns_img_dir:
+        temp_img_dir = tempfile.mkdtemp(prefix='csv_images_')
+
+    def open_part():
+        # 使用 tempfile 确保临时文件创建和清理的健壮性
+        temp_md_file = tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.md', encoding='utf-8')
+        temp_md_paths.append(temp_md_file.name)
+        return temp_md_file
+
+    def write(md_file, lines):
+        md_file.writelines(lines)
+        if echo:
+            sys.stdout.writelines(lines)
 
     try:
-        with open(csv_filepath, 'r', encoding='utf-8') as f:
+        if split_parts and not section_rows:
+            print("Warning: split_parts requires section_rows; writing a single document.")
+            split_parts = False
+
+        image_markdown = {}
+        if image_columns:
+            # 先收集并去重所有图片 URL，一次性并发下载，写表格时只做查表
+            image_markdown = resolve_image_markdown(
+                _collect_image_urls(csv_filepath, image_columns), temp_img_dir, max_workers=image_workers)
+
+        with open(csv_filepath, 'r', encoding='utf-8', newline='') as f:
             reader = csv.reader(f)
             headers = next(reader)  # 读取表头
+            header_lines = _table_header_lines(headers)
+            image_positions = [i for i, header in enumerate(headers) if header in (image_columns or ())]
 
-            # --- 1. 生成 Markdown 表头 ---
-            # 确保每个单元格内容中的管道符 | 被转义，否则会破坏Markdown表格结构
-            escaped_headers = [header.replace('|', '\\|') for header in headers]
-            md_content.append(f"| {' | '.join(escaped_headers)} |")
-
-            # --- 2. 生成 Markdown 分隔线 ---
-            md_content.append(f"|{'-' * 3}{'|' + '-' * 3 * len(headers)}|")
-            # 简化版：md_content.append(f"|{'---' * len(headers)}|")
-            # 确保分隔线长度与列数匹配，且格式正确
-            md_content.append(f"|{'---' * len(headers)}|")
-
-            # --- 3. 生成 Markdown 行数据 ---
-            for row in reader:
-                # 确保每个单元格内容中的管道符 | 被转义
-                escaped_row = [cell.replace('|', '\\|') for cell in row]
-                md_content.append(f"| {' | '.join(escaped_row)} |")
-
-        markdown_text = "\n".join(md_content)
-        print("--- Generated Markdown Content ---")
-        print(markdown_text)
-        print("----------------------------------")
-
-        # --- 将Markdown内容保存到临时文件 ---
-        # 使用 tempfile 确保临时文件创建和清理的健壮性
-        with tempfile.NamedTemporaryFile(mode='w+', delete=False, suffix='.md', encoding='utf-8') as temp_md_file:
-            temp_md_file.write(markdown_text)
-            temp_md_path = temp_md_file.name
+            if echo:
+                print("--- Generated Markdown Content ---")
+            md_file = open_part()
+            section_number = 1
+            rows_in_section = 0
+            total_rows = 0
+            try:
+                if section_rows:
+                    write(md_file, [f"## 第 {section_number} 部分\n\n"])
+                write(md_file, header_lines)
+
+                for chunk in _iter_row_chunks(reader, chunk_size):
+                    lines = []
+                    for row in chunk:
+                        if section_rows and rows_in_section == section_rows:
+                            # 当前分段已满，开始新的分段 (或新的文档)
+                            section_number += 1
+                            rows_in_section = 0
+                            if split_parts:
+                                write(md_file, lines)
+                                lines = []
+                                md_file.close()
+                                parts.append((md_file.name, _part_filepath(output_word_filepath, section_number - 1)))
+                                md_file = open_part()
+                            else:
+                                lines.append("\n")
+                            lines.append(f"## 第 {section_number} 部分\n\n")
+                            lines.extend(header_lines)
+                        cells = _escape_cells(row)
+                        for position in image_positions:
+                            if position < len(row) and row[position].strip():
+                                cells[position] = image_markdown.get(row[position].strip(), cells[position])
+                        lines.append(f"| {' | '.join(cells)} |\n")
+                        rows_in_section += 1
+                    write(md_file, lines)
+                    total_rows += len(chunk)
+            finally:
+                md_file.close()
+            if echo:
+                print("----------------------------------")
 
-        print(f"Markdown content saved to temporary file: {temp_md_path}")
+        if split_parts:
+            parts.append((md_file.name, _part_filepath(output_word_filepath, section_number)))
+        else:
+            parts.append((md_file.name, output_word_filepath))
+        print(f"Markdown content for {total_rows} rows saved to {len(parts)} temporary file(s).")
 
         # --- 使用 pypandoc 将 Markdown 转换为 Word ---
-        print(f"Converting '{temp_md_path}' to Word document '{output_word_filepath}' using Pandoc...")
-        try:
-            # `extra_args` 可以添加额外的 Pandoc 参数，例如样式文件
-            # pypandoc.convert_file(temp_md_path, 'docx', outputfile=output_word_filepath, extra_args=['--reference-doc=path/to/your/template.docx'])
-            pypandoc.convert_file(temp_md_path, 'docx', outputfile=output_word_filepath)
-            print(f"Successfully created Word document: {output_word_filepath}")
-        except Exception as e:
-            print(f"Error during Pandoc conversion: {e}")
-            print("Please ensure Pandoc is installed and accessible in your system's PATH.")
-            print("You can verify by running 'pandoc --version' in your terminal.")
+        if len(parts) == 1:
+            md_path, docx_path = parts[0]
+            print(f"Converting '{md_path}' to Word document '{docx_path}' using Pandoc...")
+            if _convert_markdown_part(md_path, docx_path):
+                created.append(docx_path)
+        else:
+            pool_size = max(1, min(workers, len(parts)))
+            print(f"Converting {len(parts)} parts to Word documents using {pool_size} Pandoc processes...")
+            with ProcessPoolExecutor(max_workers=pool_size) as executor:
+                results = executor.map(_convert_markdown_part, *zip(*parts))
+                created = [docx_path for (_, docx_path), ok in zip(parts, results) if ok]
 
     except FileNotFoundError:
         print(f"Error: CSV file not found at '{csv_filepath}'")
+    except StopIteration:
+        print(f"Error: CSV file '{csv_filepath}' is empty")
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
     finally:
         # --- 清理临时文件 ---
-        if 'temp_md_path' in locals() and os.path.exists(temp_md_path):
-            os.remove(temp_md_path)
-            print(f"Cleaned up temporary Markdown file: {temp_md_path}")
-
+        for temp_md_path in temp_md_paths:
+            if os.path.exists(temp_md_path):
+                os.remove(temp_md_path)
+        if temp_md_paths:
+            print(f"Cleaned up {len(temp_md_paths)} temporary Markdown file(s).")
+        if owns_img_dir:
+            shutil.rmtree(temp_img_dir, ignore_errors=True)
 
+    return created
@@ -1,57 +1,279 @@
 # data_processor.py
 
+import logging
+import numpy as np
 import pandas as pd
+from metrics import RUN_METRICS
+from columnar_snapshot import ColumnarSnapshot
 
-def process_and_filter_lectures(raw_rows, start_date_str, end_date_str):
+logger = logging.getLogger(__name__)
+
+def _parse_lecture_time(series):
+    """将 '讲座时间' 列转换为不带时区的 datetime64，无效值为 NaT。"""
+    times = pd.to_datetime(series, errors='coerce')
+    # 如果存在时区信息，移除它以便与纯日期比较
+    if times.dt.tz is not None:
+        times = times.dt.tz_localize(None)
+    return times
+
+@RUN_METRICS.timed('filter')
+def build_lecture_timeline(raw_rows):
+    """
+    将原始SeaTable数据转换为按 '讲座时间' 排序的DataFrame。'讲座时间' 只解析一次，
+    无效时间的行被丢弃，结果可以交给 slice_lecture_windows 按任意多个日期范围切片。
+
+    Args:
+        raw_rows (list | pd.DataFrame): 从SeaTable获取的原始行数据。
+
+    Returns:
+        pd.DataFrame: 按讲座时间排序的DataFrame (索引为排序后的位置)；无可用数据时为空DataFrame。
+    """
+    df = raw_rows if isinstance(raw_rows, pd.DataFrame) else pd.DataFrame(raw_rows)
+    if df.empty:
+        logger.info("没有数据可供处理。")
+        return pd.DataFrame()
+
+    if '讲座时间' not in df.columns:
+        logger.error("错误：DataFrame 中不存在名为 '讲座时间' 的列。请检查SeaTable列名是否正确。可用列: %s", df.columns.tolist())
+        return pd.DataFrame()
+
+    times = _parse_lecture_time(df['讲座时间']).to_numpy()
+    # 去除 NaT 并排序合并为一次 take，避免中间副本
+    valid_positions = np.flatnonzero(~np.isnat(times))
+    order = valid_positions[np.argsort(times[valid_positions], kind='stable')]
+
+    timeline_df = df.take(order).reset_index(drop=True)
+    timeline_df['讲座时间'] = times[order]
+    logger.info("去除无效 '讲座时间' 后行数: %s", len(timeline_df))
+    return timeline_df
+
+@RUN_METRICS.timed('filter')
+def slice_lecture_windows(timeline_df, date_windows):
+    """
+    按多个日期范围对 build_lecture_timeline 的结果进行切片。每个范围只需两次二分查找，
+    切片保留时间线上的原始索引，因此不同范围之间的行索引互不冲突。
+
+    Args:
+        timeline_df (pd.DataFrame): build_lecture_timeline 返回的已排序DataFrame。
+        date_windows (list): (起始日期字符串, 结束日期字符串) 元组列表，结束日期包含当天。
+
+    Returns:
+        list: 与 date_windows 一一对应的 pd.DataFrame 列表。
+    """
+    if timeline_df.empty or not date_windows:
+        return [pd.DataFrame() for _ in date_windows]
+
+    times = timeline_df['讲座时间'].to_numpy()
+    starts = pd.DatetimeIndex([pd.Timestamp(start).normalize() for start, _ in date_windows])
+    ends = pd.DatetimeIndex([pd.Timestamp(end).normalize() + pd.Timedelta(days=1) for _, end in date_windows])
+    lower = times.searchsorted(starts.to_numpy().astype(times.dtype), side='left')
+    upper = times.searchsorted(ends.to_numpy().astype(times.dtype), side='left')
+
+    return [timeline_df.iloc[lo:hi] for lo, hi in zip(lower, upper)]
+
+def process_and_filter_lectures(raw_rows, start_date_str, end_date_str, columns=None):
     """
     将原始SeaTable数据转换为DataFrame，并根据日期范围进行筛选和排序。
 
     Args:
-        raw_rows (list): 从SeaTable获取的原始行数据。
+        raw_rows (list | pd.DataFrame | ColumnarSnapshot): 从SeaTable获取的原始行数据，或本地列式快照。
+            传入快照时以内存映射方式只读取所需的列和日期范围内的行。
         start_date_str (str): 起始日期字符串 (YYYY-MM-DD)。
         end_date_str (str): 结束日期字符串 (YYYY-MM-DD)。
+        columns (list, optional): 只从列式快照中读取这些列，默认为全部列。
 
     Returns:
         pd.DataFrame: 筛选并排序后的讲座信息DataFrame。
     """
-    if not raw_rows:
-        print("没有数据可供处理。")
+    if isinstance(raw_rows, ColumnarSnapshot):
+        logger.info("从列式快照 %s 读取日期范围: %s 至 %s", raw_rows.path, start_date_str, end_date_str)
+        filtered_df = raw_rows.read(columns, start_date_str, end_date_str)
+        logger.info("最终筛选后行数: %s 条", len(filtered_df))
+        RUN_METRICS.incr('rows_matched', len(filtered_df))
+        if filtered_df.empty:
+            logger.info("在 '%s' 到 '%s' 范围内没有找到讲座信息。", start_date_str, end_date_str)
+        return filtered_df
+
+    return filter_lecture_timeline(build_lecture_timeline(raw_rows), start_date_str, end_date_str)
+
+def filter_lecture_timeline(timeline_df, start_date_str, end_date_str):
+    """
+    从 build_lecture_timeline 的结果中二分查找出日期范围内的讲座，不重新解析和排序。
+
+    Returns:
+        pd.DataFrame: 日期范围内按讲座时间排序的讲座信息DataFrame。
+    """
+    if timeline_df.empty:
+        return timeline_df
+
+    logger.info("正在筛选日期范围: %s 至 %s", start_date_str, end_date_str)
+    filtered_df = slice_lecture_windows(timeline_df, [(start_date_str, end_date_str)])[0]
+    logger.info("最终筛选后行数: %s 条", len(filtered_df))
+    RUN_METRICS.incr('rows_matched', len(filtered_df))
+
+    if filtered_df.empty:
+        logger.info("在 '%s' 到 '%s' 范围内没有找到讲座信息。", start_date_str, end_date_str)
+
+    return filtered_df.reset_index(drop=True)
+
+def normalize_lecture_columns(raw_rows, column_mapping):
+    """
+    将数据源自己的列名重命名为标准列名 (config.REPORT_COLUMNS)。
+    同一行中标准列已存在时保留标准列，丢弃对应的别名列。
+
+    Args:
+        raw_rows (list | pd.DataFrame): 一个数据源的原始行数据。
+        column_mapping (dict): 源列名 -> 标准列名。
+
+    Returns:
+        pd.DataFrame: 列名已规范化的DataFrame。
+    """
+    df = raw_rows if isinstance(raw_rows, pd.DataFrame) else pd.DataFrame(raw_rows)
+    renames = {}
+    for column in df.columns:
+        canonical = column_mapping.get(column)
+        if canonical and canonical != column and canonical not in df.columns and canonical not in renames.values():
+            renames[column] = canonical
+    duplicates = [column for column in df.columns if column in column_mapping and column not in renames
+                  and column_mapping[column] != column]
+    return df.drop(columns=duplicates).rename(columns=renames)
+
+def _normalized_text(series):
+    """比较用的文本：去除所有空白并忽略大小写，缺失值为空字符串。"""
+    return series.fillna('').astype(str).str.replace(r'\s+', '', regex=True).str.casefold()
+
+def merge_lecture_sources(source_frames):
+    """
+    合并多个数据源的讲座，同一场讲座出现在多个数据源中时只保留一个数据源中的记录：
+    讲座时间 (精确到分钟)、名称和地点 (均忽略空白和大小写) 相同视为同一场讲座，
+    保留 `_mtime` 最新的记录所在的数据源，没有 `_mtime` 时保留排在前面的数据源。
+    同一数据源内部的行不会互相去重 (例如同一时间在不同教室举行的同名分会场，或表中确实录入了两次)。
+    '讲座时间' 列按各数据源分别解析为 datetime64 (无效值为 NaT)。
+
+    Args:
+        source_frames (list): 按优先级排列的各数据源DataFrame (列名已规范化)。
+
+    Returns:
+        pd.DataFrame: 合并去重后的DataFrame，行顺序与合并前一致。
+    """
+    sources = [(position, frame) for position, frame in enumerate(source_frames) if not frame.empty]
+    if not sources:
         return pd.DataFrame()
+    with RUN_METRICS.stage('merge'):
+        merged = pd.concat([frame for _, frame in sources], ignore_index=True, sort=False)
+        if '讲座时间' not in merged.columns or '讲座名称（全称）' not in merged.columns:
+            return merged
 
-    df = pd.DataFrame(raw_rows)
+        # 各数据源的时间格式可能不同 (例如是否带时区)，分别解析后写回，下游不必再处理混合格式
+        merged['讲座时间'] = pd.concat([
+            _parse_lecture_time(frame['讲座时间']) if '讲座时间' in frame.columns
+            else pd.Series(pd.NaT, index=frame.index, dtype='datetime64[ns]')
+            for _, frame in sources
+        ], ignore_index=True)
+        keys = pd.DataFrame({
+            'time': merged['讲座时间'].dt.floor('min'),
+            'name': _normalized_text(merged['讲座名称（全称）']),
+            'place': _normalized_text(merged['讲座地点']) if '讲座地点' in merged.columns else '',
+            'source': np.repeat([position for position, _ in sources], [len(frame) for _, frame in sources]),
+        })
+        # 无效时间或没有名称的行无法判断是否重复，全部保留
+        comparable = (keys['time'].notna() & merged['讲座名称（全称）'].notna()).to_numpy()
 
-    if '讲座时间' not in df.columns:
-        print(f"错误：DataFrame 中不存在名为 '讲座时间' 的列。请检查SeaTable列名是否正确。可用列: {df.columns.tolist()}")
+        # 优先级：_mtime 新的在前，其次按数据源顺序；每个键只保留优先级最高的行所在的数据源
+        ordered = keys[comparable]
+        if '_mtime' in merged.columns:
+            mtimes = merged.loc[comparable, '_mtime']
+            ordered = ordered.assign(mtime=mtimes.astype(str).where(mtimes.notna(), ''))
+            ordered = ordered.sort_values(['mtime', 'source'], ascending=[False, True], kind='stable')
+        else:
+            ordered = ordered.sort_values('source', kind='stable')
+        winning_source = ordered.groupby(['time', 'name', 'place'], sort=False)['source'].transform('first')
+        duplicated = pd.Series(False, index=merged.index)
+        duplicated.loc[ordered.index] = (ordered['source'] != winning_source).to_numpy()
+
+        removed = int(duplicated.sum())
+        RUN_METRICS.incr('rows_deduplicated', removed)
+        logger.info("合并 %s 个数据源: 共 %s 行，跨数据源重复 %s 行", len(sources), len(merged), removed)
+        return merged.loc[~duplicated].reset_index(drop=True)
+
+def lecture_window_bounds(start_date_str, end_date_str):
+    """返回日期范围的 (起始时间, 结束日期次日零点)，结束日期包含当天。"""
+    start_ts = pd.Timestamp(start_date_str).normalize()
+    end_exclusive_ts = pd.Timestamp(end_date_str).normalize() + pd.Timedelta(days=1)
+    return start_ts, end_exclusive_ts
+
+def filter_lecture_page(page, start_ts, end_exclusive_ts):
+    """
+    筛选一页原始行数据中 [start_ts, end_exclusive_ts) 内的讲座，'讲座时间' 转换为 datetime64。
+
+    Args:
+        page (list | pd.DataFrame): 一页原始行数据。
+        start_ts (pd.Timestamp): 起始时间 (包含)。
+        end_exclusive_ts (pd.Timestamp): 结束时间 (不包含)。
+
+    Returns:
+        pd.DataFrame: 命中的行 (未排序)，没有命中时为 None。
+    """
+    with RUN_METRICS.stage('filter'):
+        chunk = page if isinstance(page, pd.DataFrame) else pd.DataFrame(page)
+        if '讲座时间' not in chunk.columns:
+            logger.warning("警告: 当前页中不存在 '讲座时间' 列，已跳过 %s 行。", len(chunk))
+            return None
+
+        times = _parse_lecture_time(chunk['讲座时间'])
+        mask = ((times >= start_ts) & (times < end_exclusive_ts)).to_numpy()
+        if not mask.any():
+            return None
+        chunk = chunk.loc[mask].copy()
+        chunk['讲座时间'] = times[mask]
+        return chunk
+
+def filter_lecture_pages(pages, start_date_str, end_date_str):
+    """
+    逐页消费原始行数据 (例如 SeaTableDataManager.iter_lecture_pages 的输出)，
+    每页到达时立即丢弃日期范围外的行，内存占用只与页大小和命中行数有关。
+
+    Args:
+        pages (iterable): 逐页产出原始行数据 (list) 的可迭代对象。
+        start_date_str (str): 起始日期字符串 (YYYY-MM-DD)。
+        end_date_str (str): 结束日期字符串 (YYYY-MM-DD)，包含当天。
+
+    Returns:
+        pd.DataFrame: 筛选并按讲座时间排序后的讲座信息DataFrame。
+    """
+    start_ts, end_exclusive_ts = lecture_window_bounds(start_date_str, end_date_str)
+
+    matched_chunks = []
+    total_rows = 0
+    for page in pages:
+        if not len(page):
+            continue
+        total_rows += len(page)
+        chunk = filter_lecture_page(page, start_ts, end_exclusive_ts)
+        if chunk is not None:
+            matched_chunks.append(chunk)
+
+    matched_rows = sum(len(chunk) for chunk in matched_chunks)
+    RUN_METRICS.incr('rows_matched', matched_rows)
+    logger.info("逐页筛选完成: 共处理 %s 行，日期范围 %s 至 %s 内 %s 条", total_rows, start_date_str, end_date_str, matched_rows)
+
+    if not matched_chunks:
         return pd.DataFrame()
 
-    # 转换 '讲座时间' 列为 datetime 对象
-    df['讲座时间'] = pd.to_datetime(df['讲座时间'], errors='coerce')
-    # 如果存在时区信息，移除它以便与纯日期比较
-    if df['讲座时间'].dt.tz is not None:
-        df['讲座时间'] = df['讲座时间'].dt.tz_localize(None)
-
-    # 转换筛选日期为 datetime.date 对象
-    start_date_dt = pd.to_datetime(start_date_str).date()
-    end_date_dt = pd.to_datetime(end_date_str).date()
-
-    # 筛选掉 '讲座时间' 为 NaT 的行，然后按日期范围筛选
-    filtered_df = df[df['讲座时间'].notna()].copy()
-    print(f"去除无效 '讲座时间' 后行数: {len(filtered_df)}")
-    print(f"正在筛选日期范围: {start_date_str} 至 {end_date_str}")
-
-    filtered_df = filtered_df[
-        (filtered_df['讲座时间'].dt.date >= start_date_dt) &
-        (filtered_df['讲座时间'].dt.date <= end_date_dt)
-    ].copy()
-
-    print(f"最终筛选后行数: {len(filtered_df)} 条")
-
-    if not filtered_df.empty:
-        print("筛选后的 DataFrame 头部预览:")
-        print(filtered_df.head())
-        # 按讲座时间排序
-        filtered_df = filtered_df.sort_values(by='讲座时间').reset_index(drop=True)
-    else:
-        print(f"在 '{start_date_str}' 到 '{end_date_dt}' 范围内没有找到讲座信息。")
-
-    return filtered_df
+    with RUN_METRICS.stage('filter'):
+        filtered_df = pd.concat(matched_chunks, ignore_index=True)
+        return filtered_df.sort_values(by='讲座时间').reset_index(drop=True)
+
+def weekly_date_windows(start_date_str, end_date_str):
+    """
+    将 [起始日期, 结束日期] 划分为连续的 7 天日期范围，最后一个范围截止到结束日期。
+
+    Returns:
+        list: (起始日期字符串, 结束日期字符串) 元组列表。
+    """
+    end_date = pd.Timestamp(end_date_str).normalize()
+    windows = []
+    for week_start in pd.date_range(pd.Timestamp(start_date_str).normalize(), end_date, freq='7D'):
+        week_end = min(week_start + pd.Timedelta(days=6), end_date)
+        windows.append((week_start.strftime('%Y-%m-%d'), week_end.strftime('%Y-%m-%d')))
+    return windows
@@ -0,0 +1,106 @@
+# docx_writer.py
+
+import logging
+from PIL import Image
+from report_generator import format_lecture_columns
+from pandoc_tools import staging_path, publish_file, discard_file
+from metrics import RUN_METRICS
+
+try:
+    import docx
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+    from docx.oxml import OxmlElement
+    from docx.oxml.ns import qn
+    from docx.shared import Inches
+except ImportError: # python-docx 为可选依赖
+    docx = None
+
+logger = logging.getLogger(__name__)
+
+
+class DocxReportWriter:
+    """
+    使用 python-docx 直接生成讲座报告，版式与 Markdown + Pandoc 的输出一致：
+    一级标题为讲座名称，加粗标签的信息段落，海报图片，讲座之间以分隔线隔开。
+    """
+
+    def __init__(self, output_word_filename, image_dpi=96):
+        if docx is None:
+            raise ImportError("原生 DOCX 后端需要 python-docx。请运行 'pip install python-docx' 安装。")
+        self.output_word_filename = output_word_filename
+        self.image_dpi = image_dpi # 与 Pandoc 一致，按像素尺寸/DPI 计算图片的自然宽度
+
+    def _add_label_paragraph(self, document, label, value):
+        paragraph = document.add_paragraph()
+        paragraph.add_run(f"{label}：").bold = True
+        paragraph.add_run(f" {value}")
+
+    def _add_horizontal_rule(self, document):
+        paragraph = document.add_paragraph()
+        paragraph_format = paragraph._p.get_or_add_pPr()
+        borders = OxmlElement('w:pBdr')
+        bottom = OxmlElement('w:bottom')
+        bottom.set(qn('w:val'), 'single')
+        bottom.set(qn('w:sz'), '6')
+        bottom.set(qn('w:space'), '1')
+        bottom.set(qn('w:color'), 'auto')
+        borders.append(bottom)
+        paragraph_format.append(borders)
+
+    def _add_poster(self, document, image_path, max_width):
+        with Image.open(image_path) as img:
+            natural_width = Inches(img.width / self.image_dpi)
+        # 直接使用新建的段落：document.paragraphs 每次访问都会重建整个段落列表
+        paragraph = document.add_paragraph()
+        paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
+        paragraph.add_run().add_picture(image_path, width=min(natural_width, max_width))
+
+    @RUN_METRICS.timed('docx_native')
+    def write(self, filtered_df, image_paths):
+        """
+        根据筛选后的DataFrame和海报路径生成Word文档。
+
+        Args:
+            filtered_df (pd.DataFrame): 筛选后的讲座信息DataFrame。
+            image_paths (dict): 行索引 -> 海报路径 (无海报时为 None)。
+
+        Returns:
+            bool: 生成是否成功。
+        """
+        logger.info("正在使用原生 DOCX 后端生成 '%s'...", self.output_word_filename)
+        document = docx.Document()
+        section = document.sections[0]
+        max_width = section.page_width - section.left_margin - section.right_margin
+
+        if filtered_df.empty:
+            logger.info("没有筛选后的数据可供生成 Word 文档。")
+            document.add_heading("讲座信息", level=1)
+            document.add_paragraph("无可用讲座信息。")
+        else:
+            columns = format_lecture_columns(filtered_df)
+            for index, 名称, 主讲人, 时间, 地点, 摘要 in zip(filtered_df.index, *columns.values()):
+                document.add_heading(str(名称), level=1)
+                self._add_label_paragraph(document, '主讲人', 主讲人)
+                self._add_label_paragraph(document, '时间', 时间)
+                self._add_label_paragraph(document, '地点', 地点)
+                self._add_label_paragraph(document, '内容摘要', 摘要)
+
+                final_image_path = image_paths.get(index)
+                if final_image_path:
+                    try:
+                        self._add_poster(document, final_image_path, max_width)
+                    except Exception as e:
+                        logger.warning("警告: 无法嵌入海报图片 %s: %s", final_image_path, e)
+
+                self._add_horizontal_rule(document)
+
+        staged_word_filename = staging_path(self.output_word_filename)
+        try:
+            document.save(staged_word_filename)
+            publish_file(staged_word_filename, self.output_word_filename)
+        except Exception as e:
+            logger.error("保存 Word 文档时发生错误: %s", e)
+            discard_file(staged_word_filename)
+            return False
+        logger.info("成功生成 Word 文档: '%s'", self.output_word_filename)
+        return True
@@ -0,0 +1,125 @@
+# fragment_cache.py
+
+import logging
+import os
+import json
+import hashlib
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def fragment_key(kind, fields, poster_digest):
+    """
+    计算单条讲座片段的缓存键：输出类型、模板/版式版本、展示字段和海报内容哈希共同决定片段内容。
+
+    Args:
+        kind (str): 片段类型及其版本，例如 Markdown 模板的哈希。
+        fields (dict): 参与渲染的展示字段。
+        poster_digest (str): 海报文件的内容哈希，无海报时为 None。
+    """
+    payload = json.dumps([kind, fields, poster_digest], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def file_digest(path):
+    """文件内容的 SHA-256。"""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class FragmentCache:
+    """
+    已渲染讲座片段的磁盘缓存。
+
+    每个片段按 fragment_key 保存为一个文件，重新生成报告时只有字段或海报变化的讲座需要重新渲染。
+    documents.json 记录每个 Word 输出文件对应的文档哈希 (全部片段键按顺序的哈希)，
+    文档哈希未变化且文件仍存在时可以跳过 Pandoc/原生 DOCX 的整份转换。
+    片段总数超过 max_entries 时按最近使用时间淘汰。
+    """
+
+    DOCUMENTS_FILENAME = 'documents.json'
+    FRAGMENT_EXTENSION = '.frag'
+
+    def __init__(self, cache_dir, max_entries=5000):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self._documents_path = os.path.join(cache_dir, self.DOCUMENTS_FILENAME)
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._documents = self._load_documents()
+
+    def _load_documents(self):
+        if os.path.exists(self._documents_path):
+            try:
+                with open(self._documents_path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning("警告: 片段缓存的文档索引损坏，将重建: %s", e)
+        return {}
+
+    def _fragment_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}{self.FRAGMENT_EXTENSION}")
+
+    def get(self, key):
+        """
+        Returns:
+            bytes: 缓存的片段内容，未命中时返回 None。
+        """
+        path = self._fragment_path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        os.utime(path) # 记录最近使用时间，用于淘汰
+        return data
+
+    def put(self, key, data):
+        path = self._fragment_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def document_hash(keys):
+        """整份文档的哈希：按顺序组合所有片段键。"""
+        hasher = hashlib.sha256()
+        for key in keys:
+            hasher.update(key.encode('ascii'))
+        return hasher.hexdigest()
+
+    def is_document_current(self, output_path, doc_hash):
+        """output_path 是否已由内容相同的文档生成过 (且文件仍存在)。"""
+        with self._lock:
+            recorded = self._documents.get(os.path.abspath(output_path))
+        return recorded == doc_hash and os.path.exists(output_path)
+
+    def mark_document(self, output_path, doc_hash):
+        with self._lock:
+            self._documents[os.path.abspath(output_path)] = doc_hash
+            tmp_path = f"{self._documents_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._documents, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self._documents_path)
+
+    def prune(self):
+        """片段数超过 max_entries 时删除最久未使用的片段。"""
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith(self.FRAGMENT_EXTENSION):
+                    entries.append((entry.stat().st_mtime, entry.path))
+            excess = len(entries) - self.max_entries
+            if excess <= 0:
+                return
+            for _, path in sorted(entries)[:excess]:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            logger.info("片段缓存超出上限，已淘汰 %s 个片段", excess)
@@ -0,0 +1,131 @@
+# http_client.py
+
+import logging
+import threading
+import time
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    令牌桶限速器：每秒补充 rate 个令牌，最多积攒 burst 个。
+    acquire() 在令牌不足时阻塞等待，线程安全。
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class HttpClient:
+    """
+    共享的 HTTP 客户端：每个主机一个 requests.Session (带 keep-alive 连接池)，
+    对连接错误、超时和 5xx 响应按指数退避自动重试，并按主机进行令牌桶限速。
+    """
+
+    RETRY_STATUS_CODES = (500, 502, 503, 504)
+
+    def __init__(self, headers=None, timeout=15, max_retries=3, backoff_factor=0.5,
+                 pool_maxsize=10, rate_limit=None, rate_burst=None):
+        self.headers = dict(headers or {})
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.pool_maxsize = pool_maxsize # 每个主机保持的连接数上限
+        self.rate_limit = rate_limit # 每个主机每秒请求数上限，None 表示不限速
+        self.rate_burst = rate_burst or (int(rate_limit) if rate_limit else 1)
+        self._sessions = {}
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _build_session(self):
+        retry = Retry(
+            total=self.max_retries,
+            connect=self.max_retries,
+            read=self.max_retries,
+            status=self.max_retries,
+            status_forcelist=self.RETRY_STATUS_CODES,
+            allowed_methods=frozenset(['GET', 'HEAD']),
+            backoff_factor=self.backoff_factor,
+            raise_on_status=False, # 重试耗尽后返回最后的响应，由调用方 raise_for_status()
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize, max_retries=retry)
+        session = requests.Session()
+        session.headers.update(self.headers)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def _for_host(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = self._build_session()
+                self._sessions[host] = session
+                if self.rate_limit:
+                    self._buckets[host] = TokenBucket(self.rate_limit, self.rate_burst)
+                logger.debug("为主机 %s 创建连接池", host)
+            return session, self._buckets.get(host)
+
+    def get(self, url, headers=None, **kwargs):
+        """
+        发送 GET 请求。headers 会合并到默认请求头之上；未指定 timeout 时使用客户端默认超时。
+
+        Returns:
+            requests.Response
+        """
+        session, bucket = self._for_host(url)
+        if bucket is not None:
+            bucket.acquire()
+        kwargs.setdefault('timeout', self.timeout)
+        return session.get(url, headers=headers, **kwargs)
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+            self._buckets.clear()
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_http_client():
+    """返回按 config.py 配置的进程级共享客户端 (首次调用时创建)。"""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            import config
+            _default_client = HttpClient(
+                headers=config.REQUEST_HEADERS,
+                timeout=config.IMAGE_DOWNLOAD_TIMEOUT,
+                max_retries=config.HTTP_MAX_RETRIES,
+                backoff_factor=config.HTTP_BACKOFF_FACTOR,
+                pool_maxsize=config.HTTP_POOL_MAXSIZE,
+                rate_limit=config.HTTP_RATE_LIMIT,
+                rate_burst=config.HTTP_RATE_BURST
+            )
+        return _default_client
@@ -1,37 +1,112 @@
 # image_downloader.py
 
+import logging
 import os
 import shutil
-import requests
-import mimetypes
-from PIL import Image
-# from urllib.parse import urljoin
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from urllib.parse import urlparse, unquote
+from uuid import UUID
 from seatable_api import SeaTableAPI
+from poster_cache import PosterCache
+from poster_dedup import PosterDeduplicator
+from http_client import HttpClient
+from image_transcoder import transcode_image, TARGET_EXTENSIONS
+from metrics import RUN_METRICS
+
+logger = logging.getLogger(__name__)
+
+
+def _timed_transcode(*args):
+    """在工作进程中执行转码并返回耗时，以便主进程记录 transcode 阶段。"""
+    start = time.perf_counter()
+    result = transcode_image(*args)
+    return result, time.perf_counter() - start
+
+
+class LazyProcessPool:
+    """第一次提交转码任务时才启动的进程池，海报全部命中缓存时不会创建任何工作进程。"""
+
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor.submit(fn, *args)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
 
 
 class ImageManager:
-    def __init__(self, temp_dir, request_headers, timeout, seatable_api_instance: SeaTableAPI):
+    def __init__(self, temp_dir, request_headers, timeout, seatable_api_instance: SeaTableAPI,
+                 max_workers=8, max_per_host=4, poster_cache: PosterCache = None,
+                 target_format='JPEG', max_dimension=1600, quality=85, transcode_workers=4,
+                 http_client: HttpClient = None, deduplicator: PosterDeduplicator = None,
+                 seatable_api_factory=None):
         self.temp_dir = temp_dir
         self.request_headers = request_headers
         self.timeout = timeout
+        # 共享的连接池客户端，大批量海报复用已建立的连接
+        self.http_client = http_client or HttpClient(headers=request_headers, timeout=timeout)
         self.seatable_api = seatable_api_instance
+        # 可选：seatable_api_instance 为 None 时，第一次需要下载 SeaTable 资源时才调用的工厂函数 (延迟认证)
+        self._seatable_api_factory = seatable_api_factory
+        self._seatable_api_lock = threading.Lock()
+        self.max_workers = max_workers # 并发下载线程数
+        self.max_per_host = max_per_host # 每个主机同时进行的下载数上限
+        self._host_semaphores = {}
+        self._host_lock = threading.Lock()
+        self.poster_cache = poster_cache # 可选的持久化海报缓存
+        self.target_format = target_format # 所有海报统一转换为该格式
+        self.max_dimension = max_dimension # 海报最长边的像素上限
+        self.quality = quality
+        self.transcode_workers = transcode_workers # 转码进程数
+        # 多次调用 download_all (批量、监视模式) 共用的转码进程池，第一次缓存未命中时才启动
+        self._transcode_pool = LazyProcessPool(max(1, transcode_workers))
+        self.deduplicator = deduplicator # 可选：相同或近似相同的海报只保留一个文件
+        # 本次运行中每个海报 URL (缓存键) 的处理结果：多条讲座共用一张海报时只下载、转码一次
+        self._poster_futures = {}
+        self._poster_futures_lock = threading.Lock()
 
     def setup_temp_dir(self):
         # ... (unchanged) ...
         if os.path.exists(self.temp_dir):
             shutil.rmtree(self.temp_dir)
-            print(f"已清空: {self.temp_dir}")
+            logger.info("已清空: %s", self.temp_dir)
         os.makedirs(self.temp_dir, exist_ok=True)
-        print(f"图片将下载到: {os.path.abspath(self.temp_dir)}")
+        with self._poster_futures_lock:
+            self._poster_futures.clear() # 临时目录已清空，上次运行的结果不再有效
+        if self.deduplicator:
+            self.deduplicator.reset()
+        logger.info("图片将下载到: %s", os.path.abspath(self.temp_dir))
+
+    def close(self):
+        """关闭转码进程池 (如果已启动)。"""
+        self._transcode_pool.shutdown()
 
     def cleanup_temp_dir(self):
         # ... (unchanged) ...
         if os.path.exists(self.temp_dir):
             try:
                 shutil.rmtree(self.temp_dir)
-                print(f"\n已清理临时图片目录: {self.temp_dir}")
+                logger.info("已清理临时图片目录: %s", self.temp_dir)
             except Exception as e:
-                print(f"清理临时图片目录失败: {e}")
+                logger.warning("清理临时图片目录失败: %s", e)
 
     def _get_image_url(self, image_field_value):
         # ... (unchanged) ...
@@ -45,94 +120,209 @@ class ImageManager:
             return image_field_value
         return None
 
-    def download_and_convert_image(self, row_data, index):
-        image_field_value = row_data.get('讲座海报照片')
-        initial_image_url = self._get_image_url(image_field_value)
+    def _get_host_semaphore(self, url):
+        host = urlparse(url).netloc
+        with self._host_lock:
+            semaphore = self._host_semaphores.get(host)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(self.max_per_host)
+                self._host_semaphores[host] = semaphore
+        return semaphore
 
-        讲座名称 = row_data.get('讲座名称（全称）', f'讲座_{index}')
+    def download_all(self, filtered_df):
+        """
+        使用有界线程池并发下载 DataFrame 中所有讲座的海报，并在进程池中并行完成验证、缩放和格式转换。
+        多条讲座使用同一海报 URL 时只下载、转码一次 (见 download_and_convert_image)。
 
-        if initial_image_url:
-            try:
-                unified_base_name = f"lecture_poster_{index}"
-
-                _, url_ext = os.path.splitext(initial_image_url.split('?')[0])
-                original_ext_lower = url_ext.lower() if url_ext else ".jpg"
+        Args:
+            filtered_df (pd.DataFrame): 筛选后的讲座信息DataFrame。
 
-                temp_download_path = os.path.join(self.temp_dir, f"{unified_base_name}{original_ext_lower}")
+        Returns:
+            dict: 行索引 -> 最终图片路径 (下载失败或无海报时为 None)。
+        """
+        if filtered_df.empty:
+            return {}
 
-                print(
-                    f"正在使用 SeaTable API 下载图片: URL={initial_image_url} 到 {temp_download_path} for '{讲座名称}'...")
+        rows = filtered_df.to_dict('index')
+        workers = max(1, min(self.max_workers, len(rows)))
+        logger.info("开始并发下载 %s 张海报 (线程数: %s, 每主机上限: %s)...", len(rows), workers, self.max_per_host)
 
-                download_success = self.seatable_api.download_file(initial_image_url, temp_download_path)
+        image_paths = {}
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(self.download_and_convert_image, row_data, index, self._transcode_pool): index
+                for index, row_data in rows.items()
+            }
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    image_paths[index] = future.result()
+                except Exception as e:
+                    logger.warning("警告: 海报下载任务失败 (行 %s): %s", index, e)
+                    image_paths[index] = None
 
+        if self.poster_cache:
+            self.poster_cache.flush()
 
+        logger.info("海报下载完成: 成功 %s / %s", sum(1 for p in image_paths.values() if p), len(image_paths))
+        return image_paths
 
-                print(f"原始图片已下载到: {temp_download_path}")
+    def _fetch_image_bytes(self, url):
+        """
+        将海报下载到内存。SeaTable 资源 URL 先换取临时下载链接 (与 SeaTableAPI.download_file 相同)，
+        其他 URL 直接请求。
+        """
+        seatable_api, dtable_uuid = self._seatable_api_for(url)
+        with self._get_host_semaphore(url), RUN_METRICS.stage('poster_download'):
+            if seatable_api is not None:
+                asset_path = url.split(dtable_uuid)[-1].strip('/')
+                download_link = seatable_api.get_file_download_link(unquote(asset_path))
+                response = self.http_client.get(download_link, timeout=self.timeout)
+            else:
+                response = self.http_client.get(url, headers=self.request_headers, timeout=self.timeout)
+        response.raise_for_status()
+        RUN_METRICS.incr('poster_bytes_downloaded', len(response.content))
+        return response.content
 
-                final_image_path_for_md = temp_download_path  # 默认路径
+    def _seatable_api_for(self, url):
+        """
+        返回资源 URL 所属 base 的 (SeaTableAPI 实例, base UUID)，不是 SeaTable 资源时返回 (None, None)。
+        多数据源时 seatable_api 是各 base 的实例列表，按 URL 中的 base UUID 选择。
+        """
+        if self._seatable_api_factory is not None and '/asset/' in url:
+            with self._seatable_api_lock:
+                if self._seatable_api_factory is not None:
+                    self.seatable_api = self._seatable_api_factory()
+                    self._seatable_api_factory = None
+        apis = self.seatable_api if isinstance(self.seatable_api, (list, tuple)) else [self.seatable_api]
+        for seatable_api in apis:
+            dtable_uuid = getattr(seatable_api, 'dtable_uuid', None)
+            if dtable_uuid and str(UUID(dtable_uuid)) in url:
+                return seatable_api, str(UUID(dtable_uuid))
+        return None, None
 
-                # 验证下载的文件是否存在且是有效的图像文件
-                if not os.path.exists(temp_download_path):
-                    print(f"错误: 文件 {temp_download_path} 不存在，尽管 download_file 报告成功。")
-                    print("DEBUG: 下载的文件不存在，将返回 None。")  # DEBUG: 2
-                    return None
+    def _cache_key(self, url):
+        # 转码参数变化后不应命中旧的缓存变体
+        return f"{url}#{self.target_format}-{self.max_dimension}-{self.quality}"
 
-                try:
+    def _deduplicate(self, image_path):
+        """与已处理的海报相同或近似相同时改为引用已有的文件，去重失败不影响海报本身。"""
+        if self.deduplicator is None:
+            return image_path
+        try:
+            return self.deduplicator.resolve(image_path)
+        except Exception as e:
+            logger.warning("警告: 海报去重失败 (%s): %s", image_path, e)
+            return image_path
 
-                    img = Image.open(temp_download_path)
-                    img_format = img.format.lower()  # 获取实际文件格式，如 'jpeg', 'png', 'webp'
-                    img.close()
+    def download_and_convert_image(self, row_data, index, transcode_pool=None):
+        """
+        下载单张海报到内存，一次解码完成验证、缩放和格式转换，最后只写一次文件。
+        同一 URL 在本次运行中只处理一次：并发或随后请求同一 URL 的讲座等待第一次的结果，
+        再以硬链接引用同一文件 (启用去重时直接返回去重后的路径)。
 
-                    if img_format == 'jpeg':
-                        current_ext = '.jpg'
-                    elif img_format == 'png':
-                        current_ext = '.png'
-                    elif img_format == 'webp':
-                        current_ext = '.webp'
-                    # 添加其他常见格式判断，如 'gif', 'bmp' 等
-                    else:
-                        print(f"警告: 无法识别的图片格式: {img_format} for {temp_download_path}")
-                        current_ext = original_ext_lower
+        Args:
+            row_data (dict | pd.Series): 讲座行数据。
+            index: 行索引，用于生成文件名 lecture_poster_{index}。
+            transcode_pool (ProcessPoolExecutor | LazyProcessPool, optional): 执行转码的进程池，为 None 时在当前进程转码。
 
+        Returns:
+            str: 最终图片路径 (启用去重时可能是其他讲座的相同海报)，失败或无海报时返回 None。
+        """
+        image_field_value = row_data.get('讲座海报照片')
+        initial_image_url = self._get_image_url(image_field_value)
 
-                    if current_ext != original_ext_lower:
-                        new_temp_download_path = os.path.join(self.temp_dir, f"{unified_base_name}{current_ext}")
-                        os.rename(temp_download_path, new_temp_download_path)
-                        print(f"重命名文件从 {temp_download_path} 到 {new_temp_download_path} (格式匹配)")
-                        temp_download_path = new_temp_download_path
-                        original_ext_lower = current_ext
+        讲座名称 = row_data.get('讲座名称（全称）', f'讲座_{index}')
 
-                    final_image_path_for_md = temp_download_path  # 更新为重命名后的路径
+        if not initial_image_url:
+            logger.info("讲座 '%s' 没有提供海报图片。", 讲座名称)
+            return None
 
-                except Exception as e:
-                    print(f"警告: 无法打开或验证下载的图片文件 {temp_download_path}: {e}。可能不是有效图片。")
-                    print("DEBUG: 无法验证图片文件，将返回 None。")  # DEBUG: 3
-                    return None
-
-                # 处理WebP转换
-                if original_ext_lower == '.webp':
-                    print(f"检测到 WebP 图像，尝试转换为 JPEG...")
-                    try:
-                        img = Image.open(temp_download_path)
-                        converted_jpg_path = os.path.join(self.temp_dir, f"{unified_base_name}.jpg")
-                        img.save(converted_jpg_path, "JPEG")
-                        print(f"WebP 图像已成功转换为 JPEG: {converted_jpg_path}")
-                        os.remove(temp_download_path)
-                        print(f"已删除原始 WebP 文件: {temp_download_path}")
-                        final_image_path_for_md = converted_jpg_path
-                    except Exception as e:
-                        print(f"警告: WebP 图像转换失败 ({temp_download_path}): {e}。将尝试使用原始 WebP 文件。")
-
-
-                print(f"DEBUG: 最终返回的图片路径: {final_image_path_for_md}")  # DEBUG: 4
-                return final_image_path_for_md
+        unified_base_name = f"lecture_poster_{index}"
+        cache_key = self._cache_key(initial_image_url)
+        with self._poster_futures_lock:
+            future = self._poster_futures.get(cache_key)
+            owner = future is None
+            if owner:
+                future = self._poster_futures[cache_key] = Future()
 
-            except Exception as e:
-                print(f"警告: 处理图片时发生未知错误 ({initial_image_url}) for '{讲座名称}': {e}")
-                print("DEBUG: 捕获到未知异常，将返回 None。")  # DEBUG: 5
+        if not owner:
+            # 同一 URL 已由其他讲座下载 (或正在下载)，等待其结果后共用
+            image_path, resolved_path = future.result()
+            if image_path is None:
                 return None
-        else:
-            print(f"INFO: 讲座 '{讲座名称}' 没有提供海报图片。")
-            print("DEBUG: initial_image_url 为空，将返回 None。")  # DEBUG: 6
+            RUN_METRICS.incr('poster_url_reused')
+            logger.info("海报与其他讲座相同，共用已处理的文件: %s for '%s'", initial_image_url, 讲座名称)
+            if self.deduplicator is not None:
+                return resolved_path
+            return self._link_poster(image_path, unified_base_name)
+
+        image_path = resolved_path = None
+        try:
+            image_path = self._resolve_poster(initial_image_url, cache_key, unified_base_name, 讲座名称, transcode_pool)
+            if image_path:
+                resolved_path = self._deduplicate(image_path)
+            return resolved_path
+        finally:
+            future.set_result((image_path, resolved_path))
+
+    def _link_poster(self, image_path, base_name):
+        """以硬链接 (文件系统不支持时复制) 让另一条讲座引用同一张已转换的海报。"""
+        target_path = os.path.join(self.temp_dir, f"{base_name}{os.path.splitext(image_path)[1]}")
+        if os.path.exists(target_path):
+            os.remove(target_path)
+        try:
+            os.link(image_path, target_path)
+        except OSError:
+            shutil.copyfile(image_path, target_path)
+        return target_path
+
+    def _resolve_poster(self, initial_image_url, cache_key, unified_base_name, 讲座名称, transcode_pool):
+        """
+        从海报缓存复制或下载并转码一张海报。
+
+        Returns:
+            str: 转换后的海报路径 (去重之前)，失败时返回 None。
+        """
+        try:
+            # 缓存命中时直接复制已转换的海报，跳过网络请求和 PIL 处理
+            if self.poster_cache:
+                cached_path = self.poster_cache.copy_to(
+                    cache_key, os.path.join(self.temp_dir, unified_base_name))
+                if cached_path:
+                    RUN_METRICS.incr('poster_cache_hits')
+                    logger.info("命中海报缓存: %s -> %s for '%s'", initial_image_url, cached_path, 讲座名称)
+                    return cached_path
+
+                RUN_METRICS.incr('poster_cache_misses')
+
+            logger.info("正在下载图片: URL=%s for '%s'...", initial_image_url, 讲座名称)
+            data = self._fetch_image_bytes(initial_image_url)
+        except Exception as e:
+            logger.warning("警告: 下载图片失败 (%s) for '%s': %s", initial_image_url, 讲座名称, e)
             return None
 
+        try:
+            transcode_args = (data, self.target_format, self.max_dimension, self.quality)
+            if transcode_pool is not None:
+                (converted, source_format), seconds = transcode_pool.submit(_timed_transcode, *transcode_args).result()
+            else:
+                (converted, source_format), seconds = _timed_transcode(*transcode_args)
+            RUN_METRICS.record_stage('transcode', seconds)
+        except Exception as e:
+            logger.warning("警告: 无法验证或转换图片 (%s) for '%s': %s。可能不是有效图片。", initial_image_url, 讲座名称, e)
+            return None
+
+        final_image_path = os.path.join(
+            self.temp_dir, f"{unified_base_name}{TARGET_EXTENSIONS[self.target_format]}")
+        with open(final_image_path, 'wb') as f:
+            f.write(converted)
+        logger.info("图片已转换 (%s -> %s, %s KB -> %s KB): %s", source_format, self.target_format.lower(), len(data) // 1024, len(converted) // 1024, final_image_path)
+
+        if self.poster_cache:
+            try:
+                self.poster_cache.store(cache_key, final_image_path, source_format)
+            except OSError as e:
+                logger.warning("警告: 写入海报缓存失败 (%s): %s", initial_image_url, e)
+
+        return final_image_path
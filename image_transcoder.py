@@ -0,0 +1,118 @@
+# image_transcoder.py
+
+import io
+from PIL import Image, ImageChops, ImageStat
+
+# 目标格式 -> 文件扩展名
+TARGET_EXTENSIONS = {
+    'JPEG': '.jpg',
+    'PNG': '.png',
+    'WEBP': '.webp',
+}
+
+
+def transcode_image(data, target_format='JPEG', max_dimension=1600, quality=85):
+    """
+    从内存中的字节数据一次性解码海报，验证其确为图片，按需缩小到最长边不超过 max_dimension，
+    并编码为统一的目标格式。该函数只依赖参数，可以在进程池中并行执行。
+
+    Args:
+        data (bytes): 下载得到的原始图片字节。
+        target_format (str): 目标格式，'JPEG'、'PNG' 或 'WEBP'。
+        max_dimension (int): 输出图片最长边的像素上限，None 表示不缩放。
+        quality (int): JPEG/WebP 编码质量。
+
+    Returns:
+        tuple: (编码后的字节, 原始格式小写名称，如 'jpeg'、'webp')。
+
+    Raises:
+        ValueError: 数据不是可识别的图片。
+    """
+    try:
+        img = Image.open(io.BytesIO(data))
+    except Exception as e:
+        raise ValueError(f"无法识别的图片数据: {e}")
+
+    with img:
+        source_format = (img.format or '').lower()
+        if max_dimension:
+            # JPEG 可以在解码阶段直接按比例缩小，避免解码全分辨率像素
+            img.draft('RGB', (max_dimension, max_dimension))
+        img.load()
+
+        if max_dimension and max(img.size) > max_dimension:
+            img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+        if target_format == 'JPEG' and img.mode not in ('RGB', 'L'):
+            # JPEG 不支持透明通道，透明部分铺白底
+            rgba = img.convert('RGBA')
+            background = Image.new('RGB', rgba.size, (255, 255, 255))
+            background.paste(rgba, mask=rgba.getchannel('A'))
+            img = background
+
+        output = io.BytesIO()
+        save_kwargs = {'optimize': True}
+        if target_format in ('JPEG', 'WEBP'):
+            save_kwargs['quality'] = quality
+        img.save(output, target_format, **save_kwargs)
+
+    return output.getvalue(), source_format
+
+
+def difference_hash(image_path, hash_size=8):
+    """
+    计算图片的差异哈希 (dHash)：缩小为 (hash_size + 1) x hash_size 的灰度图，比较每行相邻像素的明暗。
+    同一张海报经过重新编码、缩放或轻微压缩后哈希基本不变，可用汉明距离判断是否近似相同。
+
+    Args:
+        image_path (str): 图片文件路径。
+        hash_size (int): 每行比较的像素数，哈希长度为 hash_size * hash_size 位。
+
+    Returns:
+        int: 哈希值。
+    """
+    with Image.open(image_path) as img:
+        img.draft('L', (hash_size * 8, hash_size * 8)) # JPEG 在解码阶段直接缩小
+        pixels = list(img.convert('L').resize((hash_size + 1, hash_size), Image.LANCZOS).getdata())
+
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for column in range(hash_size):
+            value = (value << 1) | (pixels[offset + column] > pixels[offset + column + 1])
+    return value
+
+
+def comparison_thumbnail(image_path, size=128):
+    """
+    读取用于逐像素比较的缩略图：按区域平均缩小为 size x size 的灰度图。
+
+    Returns:
+        tuple: (宽高比, 缩略图 PIL.Image)。
+    """
+    with Image.open(image_path) as img:
+        aspect = img.width / img.height
+        thumbnail = img.convert('L').resize((size, size), Image.BOX)
+    return aspect, thumbnail
+
+
+def thumbnails_match(first, second, max_mse=2.0, max_pixel_difference=48, aspect_tolerance=0.01):
+    """
+    判断两张 comparison_thumbnail 缩略图是否为同一张图片 (重新编码或等比缩放后的副本)。
+    除均方误差外还限制单个像素的最大差异：同一模板只改了日期或讲者的海报整体误差很小，
+    但文字所在的像素差异很大。
+
+    Args:
+        first (tuple): (宽高比, 缩略图)。
+        second (tuple): (宽高比, 缩略图)。
+        max_mse (float): 允许的均方误差 (0-255 灰度)。
+        max_pixel_difference (int): 允许的单个像素最大差异。
+        aspect_tolerance (float): 允许的宽高比相对差异。
+    """
+    (first_aspect, first_thumbnail), (second_aspect, second_thumbnail) = first, second
+    if abs(first_aspect - second_aspect) > aspect_tolerance * max(first_aspect, second_aspect):
+        return False
+    difference = ImageChops.difference(first_thumbnail, second_thumbnail)
+    if difference.getextrema()[1] > max_pixel_difference:
+        return False
+    return ImageStat.Stat(difference).rms[0] ** 2 <= max_mse
@@ -0,0 +1,274 @@
+# lecture_index.py
+
+import logging
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import datetime
+from metrics import RUN_METRICS
+
+logger = logging.getLogger(__name__)
+
+# 参与全文检索的列
+INDEXED_COLUMNS = (
+    '讲座名称（全称）',
+    '讲座报告人+职称',
+    '讲座地点',
+    '讲座内容（摘要）',
+)
+
+# 连续的汉字 (含扩展 A 区和兼容汉字) 或连续的字母数字
+_TOKEN_PATTERN = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+|[0-9a-z]+')
+
+
+def tokenize(text):
+    """
+    将文本切分为检索词：汉字按相邻两字切分 (字二元组)，单独的一个汉字保留为一个词；
+    字母数字按整词切分并转为小写。
+
+    Returns:
+        set: 检索词集合。
+    """
+    tokens = set()
+    for run in _TOKEN_PATTERN.findall(text.lower()):
+        if run[0].isascii() or len(run) == 1:
+            tokens.add(run)
+        else:
+            tokens.update(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def _query_tokens(keyword):
+    """
+    查询词中可以走倒排索引的检索词。单独的一个汉字可能出现在更长的词中，
+    位于查询词首尾的字母数字可能只是某个词的一部分，这两种只能靠全文校验。
+    """
+    keyword = keyword.lower()
+    tokens = set()
+    for match in _TOKEN_PATTERN.finditer(keyword):
+        run = match.group()
+        if not run[0].isascii():
+            if len(run) > 1:
+                tokens.update(run[i:i + 2] for i in range(len(run) - 1))
+        elif match.start() > 0 and match.end() < len(keyword):
+            tokens.add(run)
+    return tokens
+
+
+def _lecture_time_key(value):
+    """讲座时间 -> 可按字典序比较的 ISO 字符串，无效时间返回 None。"""
+    if value is None:
+        return None
+    if hasattr(value, 'isoformat'):
+        try:
+            return value.isoformat()
+        except ValueError: # pandas 的 NaT
+            return None
+    text = str(value).strip().replace(' ', 'T', 1)
+    try:
+        return datetime.datetime.fromisoformat(text[:19]).isoformat()
+    except ValueError:
+        return None
+
+
+def _date_bounds(start_date_str, end_date_str):
+    """日期范围 -> (起始键, 结束日期次日的键)，未指定的一端为 None。"""
+    start_key = datetime.date.fromisoformat(start_date_str).isoformat() if start_date_str else None
+    end_key = None
+    if end_date_str:
+        end_key = (datetime.date.fromisoformat(end_date_str) + datetime.timedelta(days=1)).isoformat()
+    return start_key, end_key
+
+
+class LectureIndex:
+    """
+    讲座的本地全文倒排索引 (SQLite)。
+
+    lectures 表保存每条讲座报告所需的列 (JSON) 和用于全文校验的小写文本；postings 表以
+    (检索词, 讲座时间, 行 ID) 为主键，即每个检索词的倒排列表按讲座时间有序存储，
+    关键词与日期范围的组合查询只需在每个检索词的倒排列表上做一次范围扫描。
+    每行记录内容哈希，update() 只重新切分和写入新增或变化的行，并删除已不存在的行。
+    """
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, path, columns=None):
+        self.path = path
+        self.columns = list(columns) if columns else None # 保存到索引中的列，默认为全部列
+        self._connection = None
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def _connect(self):
+        if self._connection is None:
+            connection = sqlite3.connect(self.path)
+            connection.executescript("""
+                PRAGMA journal_mode = WAL;
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+                CREATE TABLE IF NOT EXISTS lectures (
+                    row_id TEXT PRIMARY KEY,
+                    lecture_time TEXT NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    search_text TEXT NOT NULL,
+                    row_json TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS lectures_by_time ON lectures (lecture_time);
+                CREATE TABLE IF NOT EXISTS postings (
+                    token TEXT NOT NULL,
+                    lecture_time TEXT NOT NULL,
+                    row_id TEXT NOT NULL,
+                    PRIMARY KEY (token, lecture_time, row_id)
+                ) WITHOUT ROWID;
+            """)
+            version = connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            if version is None:
+                connection.execute("INSERT INTO meta VALUES ('version', ?)", (str(self.FORMAT_VERSION),))
+                connection.commit()
+            elif int(version[0]) != self.FORMAT_VERSION:
+                connection.close()
+                raise ValueError(f"不支持的讲座索引版本: {version[0]}")
+            self._connection = connection
+        return self._connection
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _document(self, row):
+        """单行 -> (行 ID, 讲座时间键, 内容哈希, 全文校验文本, 行 JSON)，没有有效讲座时间时返回 None。"""
+        lecture_time = _lecture_time_key(row.get('讲座时间'))
+        if lecture_time is None:
+            return None
+        columns = self.columns or [column for column in row if not column.startswith('_')]
+        stored = {column: row.get(column) for column in columns if column != '讲座时间'}
+        row_json = json.dumps(stored, ensure_ascii=False, sort_keys=True, default=str)
+        row_id = row.get('_id') or hashlib.sha256(f"{lecture_time}\n{row_json}".encode('utf-8')).hexdigest()
+        search_text = '\n'.join(
+            str(row.get(column)) for column in INDEXED_COLUMNS if isinstance(row.get(column), str)
+        ).lower()
+        content_hash = hashlib.sha256(f"{lecture_time}\n{row_json}".encode('utf-8')).hexdigest()
+        return str(row_id), lecture_time, content_hash, search_text, row_json
+
+    @RUN_METRICS.timed('index_update')
+    def update(self, rows):
+        """
+        用讲座表的全部当前行增量更新索引：新增或内容变化的行重新写入，不再出现的行被删除。
+
+        Args:
+            rows (iterable): 行数据 (dict)，例如 build_lecture_timeline 结果的 to_dict('records')。
+
+        Returns:
+            dict: {'added': 新增行数, 'updated': 更新行数, 'removed': 删除行数, 'total': 索引中的行数}。
+        """
+        connection = self._connect()
+        known = dict(connection.execute("SELECT row_id, content_hash FROM lectures"))
+        seen = set()
+        added = updated = 0
+
+        with connection:
+            for row in rows:
+                document = self._document(row)
+                if document is None:
+                    continue
+                row_id, lecture_time, content_hash, search_text, row_json = document
+                if row_id in seen:
+                    continue # 重复的行 (相同 _id 或没有 _id 且内容完全相同) 只索引一次
+                seen.add(row_id)
+                previous_hash = known.get(row_id)
+                if previous_hash == content_hash:
+                    continue
+                if previous_hash is None:
+                    added += 1
+                else:
+                    updated += 1
+                    self._delete(connection, row_id)
+                connection.execute(
+                    "INSERT INTO lectures VALUES (?, ?, ?, ?, ?)",
+                    (row_id, lecture_time, content_hash, search_text, row_json)
+                )
+                connection.executemany(
+                    "INSERT OR IGNORE INTO postings VALUES (?, ?, ?)",
+                    ((token, lecture_time, row_id) for token in tokenize(search_text))
+                )
+
+            removed = 0
+            for row_id in known.keys() - seen:
+                self._delete(connection, row_id)
+                removed += 1
+            connection.execute("INSERT OR REPLACE INTO meta VALUES ('updated_at', ?)", (str(time.time()),))
+
+        total = len(known) + added - removed
+        RUN_METRICS.incr('index_rows_changed', added + updated + removed)
+        logger.info("讲座索引已更新: 新增 %s 行, 更新 %s 行, 删除 %s 行 (共 %s 行)", added, updated, removed, total)
+        return {'added': added, 'updated': updated, 'removed': removed, 'total': total}
+
+    def _delete(self, connection, row_id):
+        existing = connection.execute(
+            "SELECT lecture_time, search_text FROM lectures WHERE row_id = ?", (row_id,)
+        ).fetchone()
+        if existing is None:
+            return
+        lecture_time, search_text = existing
+        # 按旧文本重新切分得到旧的检索词，以主键删除倒排项，不需要额外的 row_id 索引
+        connection.executemany(
+            "DELETE FROM postings WHERE token = ? AND lecture_time = ? AND row_id = ?",
+            ((token, lecture_time, row_id) for token in tokenize(search_text))
+        )
+        connection.execute("DELETE FROM lectures WHERE row_id = ?", (row_id,))
+
+    def search(self, keywords=(), start_date_str=None, end_date_str=None, limit=None):
+        """
+        查找同时包含所有关键词、且讲座时间在日期范围内的讲座。
+
+        Args:
+            keywords (iterable): 关键词 (在名称、主讲人、地点、摘要中查找，不区分大小写)。
+            start_date_str (str, optional): 起始日期字符串 (YYYY-MM-DD)。
+            end_date_str (str, optional): 结束日期字符串 (YYYY-MM-DD)，包含当天。
+            limit (int, optional): 最多返回的条数。
+
+        Returns:
+            list: 按讲座时间排序的行数据 (dict)，'讲座时间' 为 ISO 格式字符串。
+        """
+        keywords = [keyword.strip().lower() for keyword in keywords if keyword and keyword.strip()]
+        start_key, end_key = _date_bounds(start_date_str, end_date_str)
+        time_conditions = []
+        time_params = []
+        if start_key:
+            time_conditions.append("lecture_time >= ?")
+            time_params.append(start_key)
+        if end_key:
+            time_conditions.append("lecture_time < ?")
+            time_params.append(end_key)
+
+        conditions = list(time_conditions)
+        params = list(time_params)
+        tokens = sorted(set().union(*(_query_tokens(keyword) for keyword in keywords)))
+        for token in tokens:
+            # 每个检索词的倒排列表按讲座时间有序，日期条件直接限定扫描范围
+            conditions.append(
+                "row_id IN (SELECT row_id FROM postings WHERE token = ?"
+                + ''.join(f" AND {condition}" for condition in time_conditions) + ")"
+            )
+            params += [token] + time_params
+
+        sql = "SELECT lecture_time, search_text, row_json FROM lectures"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY lecture_time, row_id"
+
+        with RUN_METRICS.stage('index_search'):
+            results = []
+            for lecture_time, search_text, row_json in self._connect().execute(sql, params):
+                # 字二元组只能找出候选行，最后确认每个关键词确实完整出现
+                if all(keyword in search_text for keyword in keywords):
+                    row = json.loads(row_json)
+                    row['讲座时间'] = lecture_time
+                    results.append(row)
+                    if limit and len(results) >= limit:
+                        break
+        return results
@@ -1,94 +1,301 @@
 # main.py
 
-import os
-import pandas as pd
-import subprocess
-from seatable_data import SeaTableDataManager
-from data_processor import process_and_filter_lectures
-from image_downloader import ImageManager
-from report_generator import ReportGenerator
+import sys
+import json
+import logging
+import argparse
+import datetime
+import importlib.util
 import config
 
-def main():
-    image_manager = None
+logger = logging.getLogger(__name__)
 
+# 顶层只导入轻量模块；pandas、PIL、seatable_api 等只在子命令真正需要时才导入 (见 pipeline.py)
+COMMANDS = ('fetch', 'filter', 'search', 'render', 'convert', 'all')
+
+REQUIRED_MODULES = {
+    'fetch': ('pandas', 'requests', 'seatable_api'),
+    'filter': ('numpy',),
+    'search': (),
+    'render': ('pandas', 'requests', 'PIL', 'seatable_api'),
+    'convert': (),
+    'all': ('pandas', 'requests', 'PIL', 'seatable_api'),
+}
+
+def check_requirements(command):
+    """确保子命令所需的库已安装 (只查找模块，不导入)。"""
+    missing = [name for name in REQUIRED_MODULES[command] if importlib.util.find_spec(name) is None]
+    if missing:
+        logger.error("错误：缺少必要的库: %s。请运行 'pip install -r requirements.txt' 安装。", ', '.join(missing))
+        return False
+    return True
+
+def check_docx_backend(backend=None):
+    """确保 Word 生成后端可用。Pandoc 的检测结果按可执行文件路径和修改时间缓存，不必每次启动都运行 Pandoc。"""
+    if (backend or config.DOCX_BACKEND) == 'native':
+        # 原生后端不需要 Pandoc，但需要 python-docx
+        if importlib.util.find_spec('docx') is None:
+            logger.error("错误：原生 DOCX 后端需要 python-docx。请运行 'pip install python-docx' 安装。")
+            return False
+        return True
+
+    from pandoc_tools import probe_pandoc
     try:
-        # 1. 连接SeaTable并获取数据
-        seatable_manager = SeaTableDataManager(
-            config.SERVER_URL,
-            config.API_TOKEN,
-            config.BASE_NAME,
-            config.TABLE_NAME
-        )
-        if not seatable_manager.authenticate():
-            print("SeaTable 认证失败，程序退出。")
-            return
-
-        seatable_api_instance = seatable_manager.get_api_instance()
-
-        # 2. 初始化图片管理器并设置临时目录
-        image_manager = ImageManager(
-            config.TEMP_IMAGE_DIR,
-            config.REQUEST_HEADERS,
-            config.IMAGE_DOWNLOAD_TIMEOUT,
-            seatable_api_instance # 传递 SeaTableAPI 实例
-        )
-        image_manager.setup_temp_dir()
+        probe = probe_pandoc(config.PANDOC_PROBE_CACHE)
+    except Exception as e:
+        logger.error("检查 Pandoc 时发生错误: %s", e)
+        return False
+    if probe is None:
+        logger.error("错误: Pandoc 命令未找到。请确保 Pandoc 已安装并添加到系统 PATH。")
+        logger.error("安装指南: https://pandoc.org/installing.html")
+        return False
+    if not probe['docx']:
+        logger.error("错误: Pandoc %s (%s) 不支持输出 docx 格式。", probe['version'], probe['path'])
+        return False
+    logger.debug("使用 Pandoc %s: %s", probe['version'], probe['path'])
+    return True
+
+def requested_date_range(args):
+    """命令行指定的日期范围，未指定的一端为 None。"""
+    start_date_str = end_date_str = None
+    if getattr(args, 'this_week', False):
+        today = datetime.date.today()
+        monday = today - datetime.timedelta(days=today.weekday())
+        start_date_str = monday.isoformat()
+        end_date_str = (monday + datetime.timedelta(days=6)).isoformat()
+    return getattr(args, 'start', None) or start_date_str, getattr(args, 'end', None) or end_date_str
 
-        raw_rows = seatable_manager.get_lecture_rows()
+def apply_date_range(args):
+    """命令行指定的日期范围覆盖 config 中的日期范围及对应的输出文件名。"""
+    start_date_str, end_date_str = requested_date_range(args)
+    start_date_str = start_date_str or config.START_DATE_STR
+    end_date_str = end_date_str or config.END_DATE_STR
 
-        # 3. 处理和筛选数据
-        filtered_df = process_and_filter_lectures(
-            raw_rows,
-            config.START_DATE_STR,
-            config.END_DATE_STR
+    if (start_date_str, end_date_str) != (config.START_DATE_STR, config.END_DATE_STR):
+        config.START_DATE_STR, config.END_DATE_STR = start_date_str, end_date_str
+        config.OUTPUT_MARKDOWN_FILENAME, config.OUTPUT_WORD_FILENAME = config.build_output_filenames(
+            start_date_str,
+            end_date_str
         )
 
-        # 4. 初始化报告生成器
-        reporter = ReportGenerator(
-            config.OUTPUT_MARKDOWN_FILENAME,
-            config.OUTPUT_WORD_FILENAME,
-            image_manager # 传递 image_manager 实例
+def iso_date_arg(value):
+    """argparse 的 type：校验 YYYY-MM-DD 格式的日期，返回规范化的日期字符串。"""
+    try:
+        return datetime.date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的日期 '{value}'，应为 YYYY-MM-DD 格式")
+
+def date_range_arg(value):
+    """argparse 的 type：将 START:END 解析为 (起始日期字符串, 结束日期字符串)，两端都必须是有效日期且 START 不晚于 END。"""
+    start, separator, end = value.partition(':')
+    if not separator:
+        raise argparse.ArgumentTypeError(f"无效的日期范围 '{value}'，应为 START:END 格式")
+    start, end = iso_date_arg(start), iso_date_arg(end)
+    if start > end:
+        raise argparse.ArgumentTypeError(f"日期范围 '{value}' 的起始日期晚于结束日期")
+    return start, end
+
+def cmd_fetch(args):
+    import pipeline
+    return pipeline.run_fetch()
+
+def cmd_filter(args):
+    """从本地列式快照列出日期范围内的讲座：不访问服务器，也不导入 pandas。"""
+    from columnar_snapshot import ColumnarSnapshot
+
+    if not config.COLUMNAR_SNAPSHOT_DIR or not ColumnarSnapshot(config.COLUMNAR_SNAPSHOT_DIR).exists():
+        logger.error("错误: 列式快照不存在，请先运行 'python main.py fetch'。")
+        return False
+
+    columns = ColumnarSnapshot(config.COLUMNAR_SNAPSHOT_DIR).read_columns(
+        config.REPORT_COLUMNS,
+        config.START_DATE_STR,
+        config.END_DATE_STR
+    )
+    times = columns['讲座时间']
+    empty = [None] * len(times)
+    lectures = [
+        {
+            '日期': str(lecture_time)[:10],
+            '具体时间': specific_time or '',
+            '名称': name or 'N/A',
+            '主讲人': speaker or 'N/A',
+            '地点': location or 'N/A',
+        }
+        for lecture_time, specific_time, name, speaker, location in zip(
+            times,
+            columns.get('具体时间（例：14:00-15:00）', empty),
+            columns.get('讲座名称（全称）', empty),
+            columns.get('讲座报告人+职称', empty),
+            columns.get('讲座地点', empty)
         )
+    ]
 
-        # 5. 生成Markdown内容 (此步骤会触发图片下载)
-        markdown_content = reporter.generate_markdown(filtered_df)
+    if args.json:
+        print(json.dumps(lectures, ensure_ascii=False, indent=2))
+    else:
+        print(f"{config.START_DATE_STR} 至 {config.END_DATE_STR}: 共 {len(lectures)} 场讲座")
+        for lecture in lectures:
+            print(f"{lecture['日期']} {lecture['具体时间']:<12} {lecture['名称']} | {lecture['主讲人']} | {lecture['地点']}")
+    return True
 
-        # 6. 将Markdown转换为Word文档
-        if markdown_content.strip(): # 检查是否有实际内容 (非空字符串或仅包含空格和换行符)
-            reporter.convert_markdown_to_word()
-        else:
-            print("Markdown内容为空，未生成Word文档。")
+def cmd_search(args):
+    """
+    在本地全文索引中按关键词和日期范围查找讲座 (不访问服务器)，
+    指定 --report 时直接为检索结果生成报告。检索时不限定 config 中的日期范围。
+    """
+    from lecture_index import LectureIndex
 
-    except Exception as e:
-        print(f"程序执行过程中发生意外错误: {e}")
+    if not config.LECTURE_INDEX_PATH or not LectureIndex(config.LECTURE_INDEX_PATH).exists():
+        logger.error("错误: 讲座索引不存在，请先运行 'python main.py fetch'。")
+        return False
+
+    start_date_str, end_date_str = requested_date_range(args)
+    lecture_index = LectureIndex(config.LECTURE_INDEX_PATH)
+    try:
+        lectures = lecture_index.search(args.keywords, start_date_str, end_date_str, limit=args.limit)
     finally:
-        # 7. 清理临时图片目录 (正式运行时，取消注释这行)
-        # if image_manager:
-        #     try:
-        #         image_manager.cleanup_temp_dir()
-        #     except Exception as e:
-        #         print(f"清理临时图片目录失败: {e}")
-        print("\n程序执行完毕。")
+        lecture_index.close()
+
+    if args.json:
+        print(json.dumps(lectures, ensure_ascii=False, indent=2, default=str))
+    else:
+        print(f"共 {len(lectures)} 场讲座")
+        for lecture in lectures:
+            print(f"{lecture['讲座时间'][:16].replace('T', ' ')} {lecture.get('讲座名称（全称）') or 'N/A'}"
+                  f" | {lecture.get('讲座报告人+职称') or 'N/A'} | {lecture.get('讲座地点') or 'N/A'}")
+
+    if not args.report:
+        return True
+    if not lectures:
+        logger.info("没有匹配的讲座，未生成报告。")
+        return True
+    if not check_requirements('render') or not check_docx_backend():
+        return False
+
+    import pandas as pd
+    import pipeline
+    config.OUTPUT_MARKDOWN_FILENAME, config.OUTPUT_WORD_FILENAME = config.build_search_filenames(
+        args.keywords,
+        start_date_str,
+        end_date_str
+    )
+    filtered_df = pd.DataFrame(lectures)
+    filtered_df['讲座时间'] = pd.to_datetime(filtered_df['讲座时间'])
+    return pipeline.report_lectures(filtered_df)
+
+def cmd_render(args):
+    import pipeline
+    return pipeline.render_markdown() is not None
+
+def cmd_convert(args):
+    import os
+    from pandoc_tools import convert_markdown_file
+
+    md_filename = args.markdown or config.OUTPUT_MARKDOWN_FILENAME
+    word_filename = args.output or config.OUTPUT_WORD_FILENAME
+    if not os.path.exists(md_filename):
+        logger.error("错误: Markdown 文件 %s 不存在，请先运行 'python main.py render'。", md_filename)
+        return False
+    return convert_markdown_file(md_filename, word_filename, config.TEMP_IMAGE_DIR)
+
+def cmd_all(args):
+    import pipeline
+    if args.ranges:
+        return pipeline.run_batch(args.ranges)
+    if args.weekly:
+        from data_processor import weekly_date_windows
+        return pipeline.run_batch(weekly_date_windows(*args.weekly))
+    if args.watch:
+        return pipeline.run_watch(args.interval or config.WATCH_INTERVAL_SECONDS)
+    return pipeline.main()
+
+COMMAND_HANDLERS = {
+    'fetch': cmd_fetch,
+    'filter': cmd_filter,
+    'search': cmd_search,
+    'render': cmd_render,
+    'convert': cmd_convert,
+    'all': cmd_all,
+}
+
+def parse_args(argv):
+    common = argparse.ArgumentParser(add_help=False)
+    verbosity = common.add_mutually_exclusive_group()
+    verbosity.add_argument('-q', '--quiet', action='store_true', help='只输出警告和错误')
+    verbosity.add_argument('-v', '--verbose', action='store_true', help='输出调试信息')
+    common.add_argument('--metrics-json', metavar='PATH', help='JSON 运行报告路径 (覆盖 config.METRICS_JSON_PATH)')
+    common.add_argument('--metrics-prom', metavar='PATH', help='Prometheus 文本文件路径 (覆盖 config.METRICS_PROMETHEUS_PATH)')
+
+    dates = argparse.ArgumentParser(add_help=False)
+    dates.add_argument('--start', metavar='YYYY-MM-DD', help='起始日期 (覆盖 config.START_DATE_STR)')
+    dates.add_argument('--end', metavar='YYYY-MM-DD', help='结束日期 (覆盖 config.END_DATE_STR)')
+    dates.add_argument('--this-week', action='store_true', help='使用本周 (周一至周日) 作为日期范围')
+
+    parser = argparse.ArgumentParser(description='从 SeaTable 生成讲座信息报告。省略子命令时执行 all。')
+    subparsers = parser.add_subparsers(dest='command', metavar='COMMAND')
+
+    subparsers.add_parser('fetch', parents=[common], help='获取整张表并更新本地列式快照')
+
+    filter_parser = subparsers.add_parser('filter', parents=[common, dates],
+                                          help='从本地列式快照列出日期范围内的讲座 (不访问服务器)')
+    filter_parser.add_argument('--json', action='store_true', help='以 JSON 格式输出')
+
+    search_parser = subparsers.add_parser('search', parents=[common, dates],
+                                          help='在本地全文索引中按关键词 (名称、主讲人、地点、摘要) 和日期范围查找讲座')
+    search_parser.add_argument('keywords', nargs='*', metavar='KEYWORD', help='关键词，多个关键词须同时出现')
+    search_parser.add_argument('--limit', type=int, metavar='N', help='最多列出的讲座数')
+    search_parser.add_argument('--json', action='store_true', help='以 JSON 格式输出')
+    search_parser.add_argument('--report', action='store_true', help='为检索结果生成报告 (下载海报并转换为 Word)')
+
+    subparsers.add_parser('render', parents=[common, dates], help='获取数据、下载海报并生成 Markdown 文件')
+
+    convert_parser = subparsers.add_parser('convert', parents=[common, dates], help='使用 Pandoc 将 Markdown 转换为 Word 文档')
+    convert_parser.add_argument('--markdown', metavar='PATH', help='输入的 Markdown 文件 (默认为日期范围对应的文件)')
+    convert_parser.add_argument('--output', metavar='PATH', help='输出的 Word 文件 (默认为日期范围对应的文件)')
+
+    all_parser = subparsers.add_parser('all', parents=[common, dates], help='完整流程：获取、筛选、生成报告 (默认)')
+    group = all_parser.add_mutually_exclusive_group()
+    group.add_argument('--ranges', nargs='+', type=date_range_arg, metavar='START:END',
+                       help='批量模式：多个日期范围，例如 2025-05-01:2025-05-07 2025-05-08:2025-05-14')
+    group.add_argument('--weekly', nargs=2, type=iso_date_arg, metavar=('START', 'END'),
+                       help='批量模式：从 START 到 END 按周生成报告')
+    group.add_argument('--watch', action='store_true',
+                       help='监视模式：常驻运行，讲座有变化时重新生成 config 中日期范围的报告')
+    all_parser.add_argument('--interval', type=float, metavar='SECONDS',
+                            help='监视模式的检测间隔 (覆盖 config.WATCH_INTERVAL_SECONDS)')
+
+    # 兼容旧的用法 (python main.py [--weekly ...])：没有子命令时视为 all；
+    # 公共选项写在子命令之前时 (python main.py -v filter)，把子命令移到最前面交给子命令的解析器
+    argv = list(argv)
+    command_position = next((i for i, token in enumerate(argv) if token in COMMANDS), None)
+    if command_position is None:
+        if not argv or argv[0] not in ('-h', '--help'):
+            argv = ['all'] + argv
+    elif command_position:
+        argv = [argv[command_position]] + argv[:command_position] + argv[command_position + 1:]
+    return parser.parse_args(argv)
 
 if __name__ == '__main__':
-    # 确保必要的库已安装
-    try:
-        import pandas as pd
-        import requests
-        from PIL import Image
-        from seatable_api import SeaTableAPI
-    except ImportError as e:
-        print(f"错误：缺少必要的库。请运行 'pip install pandas requests Pillow seatable-api' 安装。")
-        exit(1)
-    # 确保 Pandoc 已安装
-    try:
-        subprocess.run(['pandoc', '--version'], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    except FileNotFoundError:
-        print("错误: Pandoc 命令未找到。请确保 Pandoc 已安装并添加到系统 PATH。")
-        print("安装指南: https://pandoc.org/installing.html")
-        exit(1)
-    except Exception as e:
-        print(f"检查 Pandoc 时发生错误: {e}")
-        exit(1)
-    main()
+    args = parse_args(sys.argv[1:])
+    log_level = config.LOG_LEVEL
+    if args.quiet:
+        log_level = 'WARNING'
+    elif args.verbose:
+        log_level = 'DEBUG'
+    # seatable_api 在导入时会向根 logger 安装 INFO 级别的处理器，force=True 保证 -q/-v 无论导入顺序都生效
+    logging.basicConfig(level=log_level, format='%(message)s', force=True)
+    if args.metrics_json:
+        config.METRICS_JSON_PATH = args.metrics_json
+    if args.metrics_prom:
+        config.METRICS_PROMETHEUS_PATH = args.metrics_prom
+    apply_date_range(args)
+
+    if not check_requirements(args.command):
+        sys.exit(1)
+    if args.command == 'convert' and not check_docx_backend('pandoc'):
+        sys.exit(1)
+    if args.command == 'all' and not check_docx_backend():
+        sys.exit(1)
+
+    sys.exit(0 if COMMAND_HANDLERS[args.command](args) else 1)
@@ -0,0 +1,101 @@
+# metrics.py
+
+import os
+import json
+import time
+import threading
+import functools
+from contextlib import contextmanager
+
+
+class RunMetrics:
+    """
+    记录一次运行中各阶段的耗时和计数器 (行数、字节数、缓存命中/未命中等)，
+    并导出为 JSON 运行报告或 Prometheus 文本格式。线程安全。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.time()
+            self._started_perf = time.perf_counter()
+            self.stages = {} # 阶段名 -> {'calls', 'seconds', 'max_seconds'}
+            self.counters = {} # 计数器名 -> 数值
+
+    def record_stage(self, name, seconds):
+        with self._lock:
+            stage = self.stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+            stage['calls'] += 1
+            stage['seconds'] += seconds
+            stage['max_seconds'] = max(stage['max_seconds'], seconds)
+
+    @contextmanager
+    def stage(self, name):
+        """计时上下文管理器：with RUN_METRICS.stage('fetch'): ..."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_stage(name, time.perf_counter() - start)
+
+    def timed(self, name):
+        """计时装饰器，每次调用被装饰的函数记为该阶段的一次执行。"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'started_at': self.started_at,
+                'wall_seconds': time.perf_counter() - self._started_perf,
+                'stages': {name: dict(stage) for name, stage in self.stages.items()},
+                'counters': dict(self.counters),
+            }
+
+    def write_json(self, path):
+        """将运行报告写为 JSON 文件。"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def write_prometheus(self, path, prefix='lecture_report'):
+        """将运行报告写为 Prometheus 文本格式 (可供 node_exporter 的 textfile collector 读取)。"""
+        report = self.to_dict()
+        lines = [
+            f"# TYPE {prefix}_wall_seconds gauge",
+            f"{prefix}_wall_seconds {report['wall_seconds']:.6f}",
+            f"# TYPE {prefix}_stage_seconds_total counter",
+        ]
+        for name, stage in sorted(report['stages'].items()):
+            lines.append(f'{prefix}_stage_seconds_total{{stage="{name}"}} {stage["seconds"]:.6f}')
+        lines.append(f"# TYPE {prefix}_stage_calls_total counter")
+        for name, stage in sorted(report['stages'].items()):
+            lines.append(f'{prefix}_stage_calls_total{{stage="{name}"}} {stage["calls"]}')
+        lines.append(f"# TYPE {prefix}_stage_max_seconds gauge")
+        for name, stage in sorted(report['stages'].items()):
+            lines.append(f'{prefix}_stage_max_seconds{{stage="{name}"}} {stage["max_seconds"]:.6f}')
+        for name, value in sorted(report['counters'].items()):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, path)
+
+
+# 进程级的默认实例，各模块直接使用
+RUN_METRICS = RunMetrics()
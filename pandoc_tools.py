@@ -0,0 +1,107 @@
+# pandoc_tools.py
+
+import logging
+import os
+import json
+import shutil
+import subprocess
+from metrics import RUN_METRICS
+
+logger = logging.getLogger(__name__)
+
+def staging_path(path):
+    """与 path 同目录、扩展名相同的临时文件路径 (Pandoc 按扩展名确定输出格式)。"""
+    directory, filename = os.path.split(path)
+    stem, ext = os.path.splitext(filename)
+    return os.path.join(directory, f".{stem}.partial{ext}")
+
+def publish_file(staged_path, path):
+    """以原子替换的方式发布完整生成的文件，读者不会看到写了一半的报告。"""
+    os.replace(staged_path, path)
+
+def discard_file(staged_path):
+    try:
+        os.remove(staged_path)
+    except FileNotFoundError:
+        pass
+
+@RUN_METRICS.timed('pandoc')
+def convert_markdown_file(md_filename, word_filename, resource_path):
+    """
+    使用Pandoc将Markdown文件转换为Word文档。定义为模块级函数，以便在批量模式下由工作进程并行调用。
+
+    Returns:
+        bool: 转换是否成功。
+    """
+    logger.info("正在使用 Pandoc 将 '%s' 转换为 '%s'...", md_filename, word_filename)
+    staged_word_filename = staging_path(word_filename)
+    try:
+        subprocess.run(
+            ['pandoc', md_filename, '-o', staged_word_filename,
+             '--standalone', f'--resource-path={resource_path}'],
+            check=True,
+            encoding='utf-8'
+        )
+        publish_file(staged_word_filename, word_filename)
+        logger.info("成功生成 Word 文档: '%s'", word_filename)
+        return True
+    except FileNotFoundError:
+        logger.error("错误: Pandoc 命令未找到。请确保 Pandoc 已安装并添加到系统 PATH。")
+        logger.error("安装指南: https://pandoc.org/installing.html")
+    except subprocess.CalledProcessError as e:
+        logger.error("错误: Pandoc 转换失败。命令 '%s' 返回了非零退出码 %s。", ' '.join(e.cmd), e.returncode)
+        logger.error("标准输出:\n%s", e.stdout)
+        logger.error("标准错误:\n%s", e.stderr)
+        logger.error("请检查 Markdown 文件内容或 Pandoc 安装。")
+    except Exception as e:
+        logger.error("转换 Word 文档时发生意外错误: %s", e)
+    discard_file(staged_word_filename)
+    return False
+
+
+def probe_pandoc(cache_path=None):
+    """
+    检测 Pandoc 是否可用及其版本。结果按可执行文件的路径、修改时间和大小缓存到 cache_path，
+    Pandoc 未重新安装时后续启动无需再执行子进程。
+
+    Returns:
+        dict: {'path', 'version', 'docx'}，未找到 Pandoc 时返回 None。
+    """
+    binary = shutil.which('pandoc')
+    if binary is None:
+        return None
+    binary = os.path.realpath(binary)
+    stat = os.stat(binary)
+    key = {'path': binary, 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+    if cache_path and os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            if cached.get('key') == key:
+                return cached['probe']
+        except (OSError, ValueError, KeyError):
+            pass
+
+    version_output = subprocess.run(
+        [binary, '--version'], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding='utf-8'
+    ).stdout
+    formats_output = subprocess.run(
+        [binary, '--list-output-formats'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding='utf-8'
+    ).stdout
+    first_line = version_output.splitlines()[0] if version_output else ''
+    result = {
+        'path': binary,
+        'version': first_line.split()[-1] if first_line else None,
+        'docx': 'docx' in formats_output.split(),
+    }
+
+    if cache_path:
+        try:
+            tmp_path = f"{cache_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'key': key, 'probe': result}, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logger.debug("写入 Pandoc 检测缓存失败: %s", e)
+    return result
@@ -0,0 +1,548 @@
+# pipeline.py
+
+import time
+import sqlite3
+import datetime
+import hashlib
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from seatable_data import SeaTableDataManager, MultiSourceDataManager, SourceFetchError
+from data_processor import (
+    process_and_filter_lectures,
+    filter_lecture_timeline,
+    filter_lecture_pages,
+    build_lecture_timeline,
+    slice_lecture_windows,
+)
+from image_downloader import ImageManager
+from poster_cache import PosterCache
+from poster_dedup import PosterDeduplicator
+from http_client import get_http_client
+from snapshot_store import RowSnapshotStore
+from fragment_cache import FragmentCache
+from columnar_snapshot import ColumnarSnapshot
+from lecture_index import LectureIndex
+from report_generator import ReportGenerator
+from pandoc_tools import convert_markdown_file
+from staged_pipeline import StagedReportPipeline, PipelineError
+from metrics import RUN_METRICS
+import config
+
+logger = logging.getLogger(__name__)
+
+def create_seatable_manager():
+    if config.SEATABLE_SOURCES:
+        # 多个 base/表：各自认证并发获取，合并后去重
+        seatable_manager = MultiSourceDataManager(
+            config.SEATABLE_SOURCES,
+            config.SERVER_URL,
+            column_aliases=config.COLUMN_ALIASES,
+            max_workers=config.SOURCE_FETCH_WORKERS
+        )
+    else:
+        seatable_manager = SeaTableDataManager(
+            config.SERVER_URL,
+            config.API_TOKEN,
+            config.BASE_NAME,
+            config.TABLE_NAME
+        )
+    if not seatable_manager.authenticate():
+        return None
+    return seatable_manager
+
+def local_snapshot_available():
+    """'local' 模式且列式快照存在：讲座直接从快照读取，不需要连接 SeaTable。"""
+    return bool(config.FETCH_MODE == 'local' and config.COLUMNAR_SNAPSHOT_DIR
+                and ColumnarSnapshot(config.COLUMNAR_SNAPSHOT_DIR).exists())
+
+def _authenticate_for_posters():
+    """'local' 模式下第一次需要下载未缓存的 SeaTable 海报时才认证。"""
+    seatable_manager = create_seatable_manager()
+    if seatable_manager is None:
+        logger.error("SeaTable 认证失败，无法下载未缓存的 SeaTable 海报。")
+        return None
+    return seatable_manager.get_api_instance()
+
+def create_image_manager(seatable_api_instance, seatable_api_factory=None):
+    poster_cache = None
+    if config.POSTER_CACHE_DIR:
+        poster_cache = PosterCache(config.POSTER_CACHE_DIR, config.POSTER_CACHE_MAX_BYTES)
+    deduplicator = None
+    if config.POSTER_DEDUP_MAX_DISTANCE is not None:
+        deduplicator = PosterDeduplicator(config.POSTER_DEDUP_MAX_DISTANCE)
+
+    image_manager = ImageManager(
+        config.TEMP_IMAGE_DIR,
+        config.REQUEST_HEADERS,
+        config.IMAGE_DOWNLOAD_TIMEOUT,
+        seatable_api_instance, # 传递 SeaTableAPI 实例
+        max_workers=config.IMAGE_DOWNLOAD_WORKERS,
+        max_per_host=config.IMAGE_DOWNLOAD_PER_HOST,
+        poster_cache=poster_cache,
+        target_format=config.POSTER_TARGET_FORMAT,
+        max_dimension=config.POSTER_MAX_DIMENSION,
+        quality=config.POSTER_QUALITY,
+        transcode_workers=config.POSTER_TRANSCODE_WORKERS,
+        http_client=get_http_client(),
+        deduplicator=deduplicator,
+        seatable_api_factory=seatable_api_factory
+    )
+    image_manager.setup_temp_dir()
+    return image_manager
+
+def create_report_managers():
+    """
+    连接 SeaTable 并创建图片管理器。'local' 模式且列式快照存在时不认证，
+    只有海报缓存未命中、需要下载 SeaTable 海报时才连接服务器。
+
+    Returns:
+        tuple: (seatable_manager ('local' 模式下为 None), image_manager)，认证失败时返回 None。
+    """
+    if local_snapshot_available():
+        return None, create_image_manager(None, seatable_api_factory=_authenticate_for_posters)
+    seatable_manager = create_seatable_manager()
+    if seatable_manager is None:
+        logger.error("SeaTable 认证失败，程序退出。")
+        return None
+    return seatable_manager, create_image_manager(seatable_manager.get_api_instance())
+
+def create_fragment_cache():
+    if not config.FRAGMENT_CACHE_DIR:
+        return None
+    return FragmentCache(config.FRAGMENT_CACHE_DIR, config.FRAGMENT_CACHE_MAX_ENTRIES)
+
+def fetch_filtered_lectures(seatable_manager, start_date_str, end_date_str):
+    """按 config.FETCH_MODE 获取数据，并筛选出 [start_date_str, end_date_str] 内的讲座。"""
+    if config.FETCH_MODE == 'stream':
+        # 分页获取，每页到达时即筛选
+        return filter_lecture_pages(
+            seatable_manager.iter_lecture_pages(page_size=config.FETCH_PAGE_SIZE),
+            start_date_str,
+            end_date_str
+        )
+
+    if config.FETCH_MODE == 'local' and config.COLUMNAR_SNAPSHOT_DIR:
+        if local_snapshot_available():
+            # 内存映射读取，只解码报告所需的列和日期范围内的行
+            return process_and_filter_lectures(ColumnarSnapshot(config.COLUMNAR_SNAPSHOT_DIR),
+                                               start_date_str, end_date_str, columns=config.REPORT_COLUMNS)
+        logger.warning("列式快照 %s 不存在，改为全量获取。", config.COLUMNAR_SNAPSHOT_DIR)
+
+    if config.FETCH_MODE == 'sql':
+        raw_rows = seatable_manager.query_lecture_rows(
+            start_date_str,
+            end_date_str,
+            config.REPORT_COLUMNS,
+            page_size=config.SQL_PAGE_SIZE
+        )
+        return process_and_filter_lectures(raw_rows, start_date_str, end_date_str)
+
+    # 时间线已解析并排序，直接二分查找日期范围
+    return filter_lecture_timeline(fetch_lecture_timeline(seatable_manager), start_date_str, end_date_str)
+
+def iter_lecture_source(seatable_manager, start_date_str, end_date_str):
+    """
+    按 config.FETCH_MODE 逐页产出原始行数据，供分阶段流水线在获取线程中消费。
+    'stream' 和 'sql' 模式每页到达时立即产出；其他模式需要整张表或本地快照，筛选结果作为一页产出。
+    """
+    if config.FETCH_MODE == 'stream':
+        yield from seatable_manager.iter_lecture_pages(page_size=config.FETCH_PAGE_SIZE)
+    elif config.FETCH_MODE == 'sql':
+        yield from seatable_manager.iter_query_lecture_pages(
+            start_date_str,
+            end_date_str,
+            config.REPORT_COLUMNS,
+            page_size=config.SQL_PAGE_SIZE
+        )
+    else:
+        yield fetch_filtered_lectures(seatable_manager, start_date_str, end_date_str)
+
+def create_staged_pipeline(reporter, render_markdown=True):
+    return StagedReportPipeline(
+        reporter,
+        config.START_DATE_STR,
+        config.END_DATE_STR,
+        render_markdown=render_markdown,
+        queue_size=config.PIPELINE_QUEUE_SIZE,
+        poster_workers=config.IMAGE_DOWNLOAD_WORKERS,
+        transcode_workers=config.POSTER_TRANSCODE_WORKERS,
+        render_batch_size=config.PIPELINE_RENDER_BATCH_SIZE
+    )
+
+def fetch_lecture_timeline(seatable_manager):
+    """
+    获取整张表 ('delta' 模式为增量同步)，并将排序后的时间线保存为列式快照、增量更新全文索引，
+    供本地重复运行和检索直接读取。
+
+    Returns:
+        pd.DataFrame: build_lecture_timeline 返回的已排序DataFrame。
+    """
+    if config.FETCH_MODE == 'delta':
+        # 同步后从本地快照读取全部行
+        raw_rows = seatable_manager.sync_lecture_rows(
+            RowSnapshotStore(config.SNAPSHOT_PATH),
+            page_size=config.SQL_PAGE_SIZE
+        )
+    else:
+        raw_rows = seatable_manager.get_lecture_rows()
+
+    timeline_df = build_lecture_timeline(raw_rows)
+    if config.COLUMNAR_SNAPSHOT_DIR and not timeline_df.empty:
+        try:
+            ColumnarSnapshot(config.COLUMNAR_SNAPSHOT_DIR).write(timeline_df)
+        except OSError as e:
+            logger.warning("警告: 保存列式快照失败: %s", e)
+    if config.LECTURE_INDEX_PATH and not timeline_df.empty:
+        lecture_index = LectureIndex(config.LECTURE_INDEX_PATH, config.REPORT_COLUMNS)
+        try:
+            # 只有新增、修改和删除的行会改动索引
+            lecture_index.update(timeline_df.to_dict('records'))
+        except (OSError, sqlite3.Error) as e:
+            logger.warning("警告: 更新讲座索引失败: %s", e)
+        finally:
+            lecture_index.close()
+    return timeline_df
+
+def run_fetch():
+    """
+    fetch 子命令：获取整张表并更新列式快照。
+
+    Returns:
+        bool: 是否成功获取并保存。
+    """
+    seatable_manager = create_seatable_manager()
+    if seatable_manager is None:
+        logger.error("SeaTable 认证失败，程序退出。")
+        return False
+    try:
+        timeline_df = fetch_lecture_timeline(seatable_manager)
+    except SourceFetchError as e:
+        logger.error("部分数据源获取失败，未更新快照和索引: %s", e)
+        return False
+    finally:
+        write_run_report()
+    logger.info("已获取 %s 条有效讲座。", len(timeline_df))
+    return not timeline_df.empty
+
+def render_markdown():
+    """
+    render 子命令：获取数据、下载海报并生成 Markdown 文件，Word 转换留给 convert 子命令。
+
+    Returns:
+        dict: write_markdown 的结果摘要，认证失败或流水线失败时返回 None。
+    """
+    managers = create_report_managers()
+    if managers is None:
+        return None
+    seatable_manager, image_manager = managers
+
+    fragment_cache = create_fragment_cache()
+    try:
+        reporter = ReportGenerator(
+            config.OUTPUT_MARKDOWN_FILENAME,
+            config.OUTPUT_WORD_FILENAME,
+            image_manager,
+            fragment_cache=fragment_cache
+        )
+        result = create_staged_pipeline(reporter).run(
+            iter_lecture_source(seatable_manager, config.START_DATE_STR, config.END_DATE_STR)
+        )
+        return result['markdown']
+    except PipelineError as e:
+        logger.error("报告流水线在 '%s' 阶段失败，未生成 Markdown: %s", e.stage, e.error)
+        return None
+    finally:
+        if fragment_cache:
+            fragment_cache.prune()
+        write_run_report()
+
+def report_lectures(filtered_df):
+    """
+    为已选出的讲座 (例如全文检索的结果) 生成报告，不重新获取讲座表，只为下载海报连接 SeaTable。
+    输出到 config 中的输出路径。
+
+    Returns:
+        bool: Word 文档是否已生成 (或内容未变化而保留)。
+    """
+    seatable_manager = create_seatable_manager()
+    if seatable_manager is None:
+        logger.error("SeaTable 认证失败，程序退出。")
+        return False
+
+    fragment_cache = create_fragment_cache()
+    image_manager = None
+    try:
+        image_manager = create_image_manager(seatable_manager.get_api_instance())
+        return generate_report(image_manager, filtered_df, fragment_cache)
+    finally:
+        if image_manager:
+            image_manager.close()
+        if fragment_cache:
+            fragment_cache.prune()
+        write_run_report()
+
+def generate_report(image_manager, filtered_df, fragment_cache=None):
+    """
+    为 config 中的输出路径生成报告。
+
+    Returns:
+        bool: Word 文档是否已生成 (或内容未变化而保留)。
+    """
+    # 初始化报告生成器
+    reporter = ReportGenerator(
+        config.OUTPUT_MARKDOWN_FILENAME,
+        config.OUTPUT_WORD_FILENAME,
+        image_manager, # 传递 image_manager 实例
+        fragment_cache=fragment_cache
+    )
+
+    if config.DOCX_BACKEND == 'native':
+        # 直接生成Word文档 (此步骤会并发下载所有海报)，不经过Markdown和Pandoc
+        return reporter.generate_word_native(filtered_df)
+
+    # 生成Markdown内容 (此步骤会并发下载所有海报)
+    markdown_summary = reporter.generate_markdown(filtered_df)
+
+    # 将Markdown转换为Word文档
+    if markdown_summary['bytes']: # 检查是否有实际内容
+        return reporter.convert_markdown_to_word()
+    logger.info("Markdown内容为空，未生成Word文档。")
+    return False
+
+def generate_staged_report(seatable_manager, image_manager, fragment_cache=None):
+    """
+    以分阶段流水线为 config 中的日期范围生成报告：获取、筛选、海报下载和片段渲染相互重叠，
+    组装完成后再转换为 Word 文档 (或由原生后端直接生成)。
+
+    Returns:
+        bool: Word 文档是否已生成 (或内容未变化而保留)。
+
+    Raises:
+        PipelineError: 流水线的某个阶段失败。
+    """
+    reporter = ReportGenerator(
+        config.OUTPUT_MARKDOWN_FILENAME,
+        config.OUTPUT_WORD_FILENAME,
+        image_manager,
+        fragment_cache=fragment_cache
+    )
+    native = config.DOCX_BACKEND == 'native'
+    result = create_staged_pipeline(reporter, render_markdown=not native).run(
+        iter_lecture_source(seatable_manager, config.START_DATE_STR, config.END_DATE_STR)
+    )
+
+    if native:
+        return reporter.generate_word_native(result['filtered_df'], result['image_paths'])
+    if result['markdown']['bytes']: # 检查是否有实际内容
+        return reporter.convert_markdown_to_word()
+    logger.info("Markdown内容为空，未生成Word文档。")
+    return False
+
+def main():
+    """
+    完整流程：连接 SeaTable 后以分阶段流水线生成 config 中日期范围的报告。
+
+    Returns:
+        bool: Word 文档是否已生成。
+    """
+    image_manager = None
+    fragment_cache = create_fragment_cache()
+
+    try:
+        # 1-2. 连接SeaTable ('local' 模式直接读取列式快照)，初始化图片管理器并设置临时目录
+        managers = create_report_managers()
+        if managers is None:
+            return False
+        seatable_manager, image_manager = managers
+
+        # 3-6. 获取、筛选、下载海报、渲染片段，组装后转换为Word文档 (各阶段重叠执行)
+        return generate_staged_report(seatable_manager, image_manager, fragment_cache)
+
+    except PipelineError as e:
+        # 流水线已停止全部阶段且没有发布不完整的文档，其他异常照常抛出
+        logger.error("报告流水线在 '%s' 阶段失败，已停止: %s", e.stage, e.error)
+        return False
+    finally:
+        # 7. 清理临时图片目录 (正式运行时，取消注释这行)
+        # if image_manager:
+        #     try:
+        #         image_manager.cleanup_temp_dir()
+        #     except Exception as e:
+        #         print(f"清理临时图片目录失败: {e}")
+        if fragment_cache:
+            fragment_cache.prune()
+        write_run_report()
+        logger.info("程序执行完毕。")
+
+def _frame_fingerprint(filtered_df):
+    """变化检测查询不可用时，以筛选结果的内容哈希判断是否有变化。"""
+    payload = filtered_df.to_json(date_format='iso', force_ascii=False, default_handler=str)
+    return 'frame', hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _watch_cycle(seatable_manager, image_manager, fragment_cache, last_fingerprint):
+    """
+    执行一次监视周期：无变化时只有一次变化检测查询；有变化时重新获取并生成报告。
+
+    Returns:
+        成功发布报告后的新指纹 (无变化或生成失败时返回 last_fingerprint)。
+    """
+    start_date_str, end_date_str = config.START_DATE_STR, config.END_DATE_STR
+    fingerprint = seatable_manager.get_window_fingerprint(start_date_str, end_date_str)
+    if fingerprint is not None and fingerprint == last_fingerprint:
+        logger.debug("讲座无变化 (%s)。", fingerprint)
+        return last_fingerprint
+
+    RUN_METRICS.reset()
+    filtered_df = fetch_filtered_lectures(seatable_manager, start_date_str, end_date_str)
+    if fingerprint is None:
+        fingerprint = _frame_fingerprint(filtered_df)
+        if fingerprint == last_fingerprint:
+            logger.debug("讲座无变化。")
+            return last_fingerprint
+    elif filtered_df.empty and fingerprint[0]:
+        # 服务端报告范围内有讲座但获取结果为空，多半是临时的获取失败，保留已发布的报告
+        logger.warning("警告: 获取到的讲座为空 (服务端计数: %s)，本周期不更新报告。", fingerprint[0])
+        return last_fingerprint
+
+    logger.info("检测到 %s 至 %s 的讲座有变化，重新生成报告...", start_date_str, end_date_str)
+    image_manager.setup_temp_dir()
+    try:
+        published = generate_report(image_manager, filtered_df, fragment_cache)
+    finally:
+        if fragment_cache:
+            fragment_cache.prune()
+        write_run_report()
+    return fingerprint if published else last_fingerprint
+
+def run_watch(interval_seconds):
+    """
+    监视模式：常驻进程只认证一次并在访问令牌过期前刷新，每隔 interval_seconds 秒做一次轻量的变化检测，
+    只有日期范围内的讲座发生变化时才重新生成报告，并以原子替换的方式发布到输出路径。
+
+    Args:
+        interval_seconds (float): 变化检测的间隔。
+
+    Returns:
+        bool: 认证失败时为 False，按 Ctrl+C 正常停止时为 True。
+    """
+    seatable_manager = create_seatable_manager()
+    if seatable_manager is None:
+        logger.error("SeaTable 认证失败，程序退出。")
+        return False
+
+    image_manager = create_image_manager(seatable_manager.get_api_instance())
+    fragment_cache = create_fragment_cache()
+    last_fingerprint = None
+    logger.info("监视模式: 每 %s 秒检查一次 %s 至 %s 的讲座变化 (Ctrl+C 退出)。",
+                interval_seconds, config.START_DATE_STR, config.END_DATE_STR)
+    try:
+        while True:
+            try:
+                if seatable_manager.ensure_authenticated(config.TOKEN_REFRESH_MARGIN_SECONDS):
+                    last_fingerprint = _watch_cycle(seatable_manager, image_manager, fragment_cache, last_fingerprint)
+            except Exception as e:
+                logger.error("监视周期中发生意外错误: %s", e)
+            time.sleep(interval_seconds)
+    except KeyboardInterrupt:
+        logger.info("监视模式已停止。")
+    finally:
+        image_manager.close()
+    return True
+
+def run_batch(date_windows):
+    """
+    批量模式：一次认证、一次获取、每张海报只下载一次，然后为每个日期范围生成一份报告，
+    并在多个工作进程中并行执行 Pandoc 转换。
+
+    Args:
+        date_windows (list): (起始日期字符串, 结束日期字符串) 元组列表。
+
+    Returns:
+        bool: 所有日期范围的报告是否都已生成 (内容未变化而保留的文档也算成功)。
+    """
+    if not date_windows:
+        logger.warning("没有指定任何日期范围。")
+        return False
+
+    fragment_cache = create_fragment_cache()
+    image_manager = None
+    succeeded = False
+    try:
+        managers = create_report_managers()
+        if managers is None:
+            return False
+        seatable_manager, image_manager = managers
+
+        # 1. 覆盖所有日期范围的一次获取
+        overall_start = min((start for start, _ in date_windows), key=datetime.date.fromisoformat)
+        overall_end = max((end for _, end in date_windows), key=datetime.date.fromisoformat)
+        logger.info("批量模式: %s 个日期范围，总范围 %s 至 %s", len(date_windows), overall_start, overall_end)
+        # 各获取模式返回的结果已按讲座时间排序，可以直接作为时间线切片
+        timeline_df = fetch_filtered_lectures(seatable_manager, overall_start, overall_end)
+        window_frames = slice_lecture_windows(timeline_df, date_windows)
+
+        # 2. 所有范围的海报合并后只下载一次 (切片保留时间线索引，不会冲突)
+        image_paths = {}
+        if not timeline_df.empty:
+            used_positions = sorted({index for frame in window_frames for index in frame.index})
+            image_paths = image_manager.download_all(timeline_df.loc[used_positions])
+
+        # 3. 逐个渲染 Markdown (原生后端直接生成 Word 文档)
+        conversions = []
+        succeeded = True
+        for (start_date_str, end_date_str), frame in zip(date_windows, window_frames):
+            md_filename, word_filename = config.build_output_filenames(start_date_str, end_date_str)
+            logger.info("--- 生成报告: %s 至 %s (%s 条) ---", start_date_str, end_date_str, len(frame))
+            reporter = ReportGenerator(md_filename, word_filename, image_manager, fragment_cache=fragment_cache)
+            if config.DOCX_BACKEND == 'native':
+                succeeded = reporter.generate_word_native(frame, image_paths=image_paths) and succeeded
+                continue
+            markdown_summary = reporter.generate_markdown(frame, image_paths=image_paths)
+            if not markdown_summary['bytes']:
+                continue
+            if reporter.word_is_current():
+                logger.info("讲座内容未变化，保留已有的 Word 文档: '%s'", word_filename)
+                RUN_METRICS.incr('word_conversions_skipped')
+            else:
+                conversions.append(reporter)
+
+        # 4. 并行执行 Pandoc 转换
+        if conversions:
+            workers = max(1, min(config.BATCH_PANDOC_WORKERS, len(conversions)))
+            logger.info("使用 %s 个工作进程并行转换 %s 份 Word 文档...", workers, len(conversions))
+            with RUN_METRICS.stage('pandoc'), ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(
+                    convert_markdown_file,
+                    [reporter.output_md_filename for reporter in conversions],
+                    [reporter.output_word_filename for reporter in conversions],
+                    [image_manager.temp_dir] * len(conversions)
+                ))
+            for reporter, converted in zip(conversions, results):
+                if converted:
+                    reporter.mark_word_current()
+            logger.info("Word 文档转换完成: 成功 %s / %s", sum(results), len(results))
+            succeeded = succeeded and all(results)
+
+    except Exception as e:
+        logger.error("批量执行过程中发生意外错误: %s", e)
+        succeeded = False
+    finally:
+        if image_manager:
+            image_manager.close()
+        if fragment_cache:
+            fragment_cache.prune()
+        write_run_report()
+        logger.info("批量执行完毕。")
+    return succeeded
+
+def write_run_report():
+    """将本次运行的各阶段耗时和计数器写为 JSON 运行报告，并可选地写为 Prometheus 文本文件。"""
+    try:
+        if config.METRICS_JSON_PATH:
+            RUN_METRICS.write_json(config.METRICS_JSON_PATH)
+            logger.info("运行报告已保存到: %s", config.METRICS_JSON_PATH)
+        if config.METRICS_PROMETHEUS_PATH:
+            RUN_METRICS.write_prometheus(config.METRICS_PROMETHEUS_PATH)
+            logger.info("Prometheus 指标已保存到: %s", config.METRICS_PROMETHEUS_PATH)
+    except OSError as e:
+        logger.warning("警告: 写入运行报告失败: %s", e)
@@ -0,0 +1,161 @@
+# poster_cache.py
+
+import logging
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class PosterCache:
+    """
+    持久化的海报磁盘缓存。
+
+    图片文件按内容哈希 (SHA-256) 存储，同一张海报即使对应多个 URL 也只保存一份；
+    index.json 记录 SeaTable 资源 URL -> 内容哈希 的映射，以及每个文件的原始格式、
+    缓存变体 (转换后的扩展名)、字节大小和最近使用时间。总大小超过字节预算时按 LRU 淘汰。
+    """
+
+    INDEX_FILENAME = 'index.json'
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._index_path = os.path.join(cache_dir, self.INDEX_FILENAME)
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._index = self._load_index()
+
+    def _load_index(self):
+        if os.path.exists(self._index_path):
+            try:
+                with open(self._index_path, 'r', encoding='utf-8') as f:
+                    index = json.load(f)
+                index.setdefault('urls', {})
+                index.setdefault('entries', {})
+                return index
+            except (OSError, ValueError) as e:
+                logger.warning("警告: 海报缓存索引损坏，将重建: %s", e)
+        return {'urls': {}, 'entries': {}}
+
+    def _entry_path(self, entry):
+        return os.path.join(self.cache_dir, entry['file'])
+
+    def _total_bytes(self):
+        return sum(entry['size'] for entry in self._index['entries'].values())
+
+    def lookup(self, url):
+        """
+        根据资源 URL 查找缓存的海报文件。
+
+        Returns:
+            tuple: (content_hash, entry) ，未命中时返回 None。
+        """
+        with self._lock:
+            content_hash = self._index['urls'].get(url)
+            entry = self._index['entries'].get(content_hash) if content_hash else None
+            if entry is None:
+                return None
+            if not os.path.exists(self._entry_path(entry)):
+                # 文件被外部删除，丢弃失效的索引项
+                self._drop_entry(content_hash)
+                return None
+            entry['last_used'] = time.time()
+            return content_hash, dict(entry)
+
+    def copy_to(self, url, dest_base_path):
+        """
+        缓存命中时将海报复制到 dest_base_path + 缓存变体扩展名，跳过下载和图片处理。
+
+        Returns:
+            str: 复制后的文件路径，未命中时返回 None。
+        """
+        hit = self.lookup(url)
+        if hit is None:
+            return None
+        _, entry = hit
+        dest_path = f"{dest_base_path}{entry['variant']}"
+        source_path = self._entry_path(entry)
+        try:
+            if os.path.exists(dest_path):
+                os.remove(dest_path)
+            os.link(source_path, dest_path)
+        except OSError:
+            shutil.copyfile(source_path, dest_path)
+        return dest_path
+
+    def store(self, url, image_path, original_format):
+        """
+        将处理完成的海报文件存入缓存，并记录 URL -> 内容哈希 的映射。
+
+        Args:
+            url (str): SeaTable 资源 URL。
+            image_path (str): 最终 (已转换) 的图片文件路径。
+            original_format (str): 下载得到的原始图片格式，如 'jpeg'、'webp'。
+
+        Returns:
+            str: 图片内容的 SHA-256 哈希。
+        """
+        hasher = hashlib.sha256()
+        with open(image_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                hasher.update(chunk)
+        content_hash = hasher.hexdigest()
+        variant = os.path.splitext(image_path)[1].lower()
+        cache_filename = f"{content_hash}{variant}"
+
+        with self._lock:
+            cache_path = os.path.join(self.cache_dir, cache_filename)
+            if not os.path.exists(cache_path):
+                tmp_path = f"{cache_path}.{threading.get_ident()}.tmp"
+                shutil.copyfile(image_path, tmp_path)
+                os.replace(tmp_path, cache_path)
+            self._index['entries'][content_hash] = {
+                'file': cache_filename,
+                'format': original_format,
+                'variant': variant,
+                'size': os.path.getsize(cache_path),
+                'last_used': time.time(),
+            }
+            self._index['urls'][url] = content_hash
+            self._evict()
+            self._save_index()
+        return content_hash
+
+    def _drop_entry(self, content_hash):
+        entry = self._index['entries'].pop(content_hash, None)
+        self._index['urls'] = {
+            url: h for url, h in self._index['urls'].items() if h != content_hash
+        }
+        if entry is not None:
+            try:
+                os.remove(self._entry_path(entry))
+            except FileNotFoundError:
+                pass
+
+    def _evict(self):
+        total = self._total_bytes()
+        if total <= self.max_bytes:
+            return
+        by_age = sorted(self._index['entries'].items(), key=lambda item: item[1]['last_used'])
+        for content_hash, entry in by_age:
+            if total <= self.max_bytes:
+                break
+            total -= entry['size']
+            self._drop_entry(content_hash)
+            logger.info("海报缓存超出预算，已淘汰: %s", entry['file'])
+
+    def _save_index(self):
+        tmp_path = f"{self._index_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._index, f, ensure_ascii=False)
+        os.replace(tmp_path, self._index_path)
+
+    def flush(self):
+        """将内存中的索引 (包括最近使用时间) 写回磁盘。"""
+        with self._lock:
+            self._save_index()
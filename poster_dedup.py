@@ -0,0 +1,99 @@
+# poster_dedup.py
+
+import logging
+import os
+import hashlib
+import threading
+from image_transcoder import difference_hash, comparison_thumbnail, thumbnails_match
+from metrics import RUN_METRICS
+
+logger = logging.getLogger(__name__)
+
+
+class PosterDeduplicator:
+    """
+    本次运行中已处理海报的去重登记表。
+
+    同一系列讲座经常使用同一张海报，或以不同的资源 URL 重复上传。每张处理完成的海报先按内容哈希
+    (SHA-256) 查找完全相同的文件，再按差异哈希 (dHash) 查找候选：汉明距离不超过 max_distance
+    的已登记海报只是候选，还要经过逐像素比较 (宽高比相同、缩略图的均方误差和最大像素差异都很小)
+    确认后才视为同一张。命中时删除新文件并返回已登记的文件路径，所有相同海报的讲座引用同一个文件，
+    Pandoc/python-docx 只嵌入一份。线程安全。
+
+    同一模板只改了讲者或日期的系列海报 dHash 可能完全相同，逐像素比较是区分它们的依据，
+    max_distance 默认为 0，调大只会增加需要比较的候选。
+    """
+
+    def __init__(self, max_distance=0):
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """清空登记表 (临时图片目录被清空时调用)。"""
+        with self._lock:
+            self._by_content = {} # SHA-256 -> 登记的文件路径
+            self._perceptual = [] # (dHash, 登记的文件路径)
+            self._thumbnails = {} # 登记的文件路径 -> 比较用缩略图，首次作为候选时读取
+
+    def _discard_duplicate(self, image_path, canonical_path, kind):
+        size = os.path.getsize(image_path)
+        os.remove(image_path)
+        RUN_METRICS.incr('poster_duplicates')
+        RUN_METRICS.incr('poster_duplicate_bytes', size)
+        logger.info("海报%s重复: %s -> %s", kind, os.path.basename(image_path), os.path.basename(canonical_path))
+        return canonical_path
+
+    def resolve(self, image_path):
+        """
+        登记一张处理完成的海报。
+
+        Args:
+            image_path (str): 海报文件路径。
+
+        Returns:
+            str: 应引用的文件路径：与已登记的海报相同或近似相同时为已登记的路径 (新文件已删除)，否则为 image_path。
+        """
+        hasher = hashlib.sha256()
+        with open(image_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                hasher.update(chunk)
+        content_hash = hasher.hexdigest()
+
+        with self._lock:
+            canonical_path = self._by_content.get(content_hash)
+            if canonical_path is not None and canonical_path != image_path:
+                return self._discard_duplicate(image_path, canonical_path, '内容')
+            if canonical_path is not None:
+                return image_path
+
+        with RUN_METRICS.stage('poster_dedup'):
+            perceptual_hash = difference_hash(image_path)
+            with self._lock:
+                candidates = [
+                    canonical_path for known_hash, canonical_path in self._perceptual
+                    if bin(perceptual_hash ^ known_hash).count('1') <= self.max_distance
+                ]
+            thumbnail = comparison_thumbnail(image_path) if candidates else None
+            match = None
+            for canonical_path in candidates:
+                if thumbnails_match(thumbnail, self._thumbnail(canonical_path)):
+                    match = canonical_path
+                    break
+
+        with self._lock:
+            if match is not None:
+                self._by_content[content_hash] = match
+                return self._discard_duplicate(image_path, match, '近似')
+            self._by_content[content_hash] = image_path
+            self._perceptual.append((perceptual_hash, image_path))
+        return image_path
+
+    def _thumbnail(self, canonical_path):
+        with self._lock:
+            thumbnail = self._thumbnails.get(canonical_path)
+        if thumbnail is None:
+            thumbnail = comparison_thumbnail(canonical_path)
+            with self._lock:
+                self._thumbnails[canonical_path] = thumbnail
+        return thumbnail
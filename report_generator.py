@@ -1,90 +1,267 @@
 # report_generator.py
 
+import logging
 import os
-import subprocess
+import hashlib
+import time
 import pandas as pd
 from image_downloader import ImageManager # 需要导入以使用其方法和属性
+from fragment_cache import FragmentCache, fragment_key, file_digest
+from metrics import RUN_METRICS
+from pandoc_tools import convert_markdown_file, staging_path, publish_file
+
+logger = logging.getLogger(__name__)
+
+# 单条讲座的 Markdown 模板，渲染时只做一次 format_map
+LECTURE_MARKDOWN_TEMPLATE = (
+    "# {名称}\n"
+    "\n"
+    "**主讲人：** {主讲人}\n"
+    "\n"
+    "**时间：** {时间}\n"
+    "\n"
+    "**地点：** {地点}\n"
+    "\n"
+    "**内容摘要：** {摘要}\n"
+    "\n"
+    "{海报}\n"
+    "\n"
+    "\n"
+    "---\n"
+    "\n"
+)
+_render_lecture_markdown = LECTURE_MARKDOWN_TEMPLATE.format_map
+
+EMPTY_MARKDOWN_CONTENT = "# 讲座信息\n\n无可用讲座信息。\n"
+
+# 片段缓存键中的输出类型：模板变化后旧的 Markdown 片段自动失效；原生 DOCX 版式变化时递增版本号
+MARKDOWN_FRAGMENT_KIND = 'markdown:' + hashlib.sha256(LECTURE_MARKDOWN_TEMPLATE.encode('utf-8')).hexdigest()[:16]
+NATIVE_DOCX_FRAGMENT_KIND = 'docx-native:1'
+
+# 缓存的片段中海报文件名的占位符：文件名随讲座在文档中的位置变化，写出时才替换为实际文件名，
+# 插入或删除一条讲座不会使其后所有讲座的片段失效
+POSTER_FILENAME_PLACEHOLDER = '{海报文件}'
+
+def _column_values(df, column, default):
+    """按列取值，列不存在或值缺失 (None/NaN) 时使用默认值。"""
+    if column not in df.columns:
+        return [default] * len(df)
+    values = df[column].tolist()
+    missing = df[column].isna().tolist()
+    return [default if is_missing else value for value, is_missing in zip(values, missing)]
+
+def format_lecture_columns(df):
+    """
+    按列提取并格式化讲座的展示字段，供 Markdown 和原生 DOCX 两种输出共用。
+    日期格式化以整列向量化完成，避免逐行构造 Series。
+
+    Returns:
+        dict: 名称、主讲人、时间、地点、摘要 -> 与 df 行顺序一致的值列表。
+    """
+    if '讲座时间' in df.columns:
+        dates = pd.to_datetime(df['讲座时间'], errors='coerce').dt.strftime('%Y年%m月%d日')
+        dates = dates.fillna('N/A').tolist()
+    else:
+        dates = ['N/A'] * len(df)
+    具体时间 = _column_values(df, '具体时间（例：14:00-15:00）', '')
+    formatted_times = [
+        f"{date} {detail}" if detail else date
+        for date, detail in zip(dates, 具体时间)
+    ]
+
+    return {
+        '名称': _column_values(df, '讲座名称（全称）', 'N/A'),
+        '主讲人': _column_values(df, '讲座报告人+职称', 'N/A'),
+        '时间': formatted_times,
+        '地点': _column_values(df, '讲座地点', 'N/A'),
+        '摘要': _column_values(df, '讲座内容（摘要）', '无摘要'),
+    }
 
 class ReportGenerator:
-    def __init__(self, output_md_filename, output_word_filename, image_manager: ImageManager):
+    def __init__(self, output_md_filename, output_word_filename, image_manager: ImageManager,
+                 fragment_cache: FragmentCache = None):
         self.output_md_filename = output_md_filename
         self.output_word_filename = output_word_filename
         self.image_manager = image_manager # 传入ImageManager实例
+        self.fragment_cache = fragment_cache # 可选的讲座片段缓存
+        self.document_hash = None # 最近一次生成的文档哈希，用于判断 Word 文档是否需要重新生成
+        self._poster_digests = {} # (路径, 大小, 修改时间) -> 海报内容哈希，去重后共用的海报只计算一次
 
-    def generate_markdown(self, filtered_df):
+    def _poster_digest(self, image_path):
+        if not image_path:
+            return None
+        stat = os.stat(image_path)
+        signature = (image_path, stat.st_size, stat.st_mtime_ns)
+        digest = self._poster_digests.get(signature)
+        if digest is None:
+            digest = self._poster_digests[signature] = file_digest(image_path)
+        return digest
+
+    def word_is_current(self):
+        """Word 文档是否已由内容完全相同的讲座片段生成过，此时可以跳过转换。"""
+        return (self.fragment_cache is not None and self.document_hash is not None
+                and self.fragment_cache.is_document_current(self.output_word_filename, self.document_hash))
+
+    def mark_word_current(self):
+        if self.fragment_cache is not None and self.document_hash is not None:
+            self.fragment_cache.mark_document(self.output_word_filename, self.document_hash)
+
+    def render_fragments(self, filtered_df, image_paths):
         """
-        根据筛选后的DataFrame生成Markdown内容。
+        按列取值并套用预编译的模板，逐条产出讲座的 Markdown 片段。
+        启用片段缓存时，字段和海报内容都未变化的讲座直接复用缓存的片段。
+
+        Args:
+            filtered_df (pd.DataFrame): 讲座信息DataFrame (可以只是全部讲座中的一批)。
+            image_paths (dict): 行索引 -> 海报路径 (无海报时为 None)。
+
+        Yields:
+            tuple: (片段缓存键 (未启用缓存时为 None), 片段字节, 是否复用了缓存)。
         """
-        markdown_output = []
+        render_seconds = 0.0
+        columns = format_lecture_columns(filtered_df)
+        for index, 名称, 主讲人, 时间, 地点, 摘要 in zip(filtered_df.index, *columns.values()):
+            render_start = time.perf_counter()
+            final_image_path = image_paths.get(index)
+            if final_image_path:
+                海报 = f"![{名称}海报]({POSTER_FILENAME_PLACEHOLDER})"
+            else:
+                海报 = f"<!-- 讲座 '{名称}' 没有找到有效海报图片 -->" # 添加一个注释，方便调试
 
-        if filtered_df.empty:
-            print("没有筛选后的数据可供生成 Markdown。")
-            full_markdown_content = "# 讲座信息\n\n无可用讲座信息。\n"
-        else:
-            for index, row in filtered_df.iterrows():
-                讲座名称 = row.get('讲座名称（全称）', 'N/A')
-                报告人_职称 = row.get('讲座报告人+职称', 'N/A')
-                讲座时间 = row.get('讲座时间')
-                具体时间 = row.get('具体时间（例：14:00-15:00）', '')
-                讲座地点 = row.get('讲座地点', 'N/A')
-                讲座内容 = row.get('讲座内容（摘要）', '无摘要')
-
-                formatted_time = "N/A"
-                if pd.notna(讲座时间):
-                    formatted_time = 讲座时间.strftime('%Y年%m月%d日')
-                if 具体时间:
-                    formatted_time = f"{formatted_time} {具体时间}"
-
-                lecture_md = []
-                lecture_md.append(f"# {讲座名称}")
-                lecture_md.append(f"\n**主讲人：** {报告人_职称}")
-                lecture_md.append(f"\n**时间：** {formatted_time}")
-                lecture_md.append(f"\n**地点：** {讲座地点}")
-                lecture_md.append(f"\n**内容摘要：** {讲座内容}\n")
-
-                # 调用 ImageManager 下载图片
-                final_image_path = self.image_manager.download_and_convert_image(row, index)
-
-                if final_image_path:
-
-
-                    markdown_image_filename = os.path.basename(final_image_path)
-
-                    lecture_md.append(f"![{讲座名称}海报]({markdown_image_filename})\n")
+            fields = {
+                '名称': 名称, '主讲人': 主讲人, '时间': 时间,
+                '地点': 地点, '摘要': 摘要, '海报': 海报,
+            }
+            key = None
+            reused = False
+            if self.fragment_cache is None:
+                fragment = _render_lecture_markdown(fields)
+            else:
+                # 键只包含字段和海报内容哈希，不包含随位置变化的海报文件名
+                key = fragment_key(MARKDOWN_FRAGMENT_KIND, fields, self._poster_digest(final_image_path))
+                cached = self.fragment_cache.get(key)
+                reused = cached is not None
+                if reused:
+                    fragment = cached.decode('utf-8')
                 else:
-                    lecture_md.append(f"<!-- 讲座 '{讲座名称}' 没有找到有效海报图片 -->\n") # 添加一个注释，方便调试
+                    fragment = _render_lecture_markdown(fields)
+                    self.fragment_cache.put(key, fragment.encode('utf-8'))
+            if final_image_path:
+                # 海报行是模板的最后一个字段，只替换最后一个占位符，避免误改字段正文中的相同文本
+                head, _, tail = fragment.rpartition(POSTER_FILENAME_PLACEHOLDER)
+                fragment = head + os.path.basename(final_image_path) + tail
+            render_seconds += time.perf_counter() - render_start
+            yield key, fragment.encode('utf-8'), reused
+        RUN_METRICS.record_stage('render', render_seconds)
 
-                markdown_output.append("\n".join(lecture_md))
-                markdown_output.append("\n---\n")
+    def write_markdown(self, fragments):
+        """
+        将已按顺序排好的讲座片段写入临时文件，全部写完后原子替换到输出路径。
+        片段逐条写入，不在内存中拼接整份文档。
 
-            full_markdown_content = "\n".join(markdown_output)
+        Args:
+            fragments (iterable): render_fragments 产出的 (片段缓存键, 片段字节, 是否复用) 元组。
 
-        with open(self.output_md_filename, 'w', encoding='utf-8') as f:
-            f.write(full_markdown_content)
-        print(f"\nMarkdown 内容已保存到 '{self.output_md_filename}' 文件中。")
-        return full_markdown_content
+        Returns:
+            dict: {'path': Markdown 文件路径, 'lectures': 讲座条数, 'bytes': 写入的字节数, 'fragments_reused': 复用的片段数}。
+        """
+        lecture_count = 0
+        byte_count = 0
+        fragment_keys = []
+        reused = 0
+
+        staged_md_filename = staging_path(self.output_md_filename)
+        with open(staged_md_filename, 'wb') as f:
+            for key, fragment, fragment_reused in fragments:
+                if key is not None:
+                    fragment_keys.append(key)
+                reused += fragment_reused
+                byte_count += f.write(fragment)
+                lecture_count += 1
+            if not lecture_count:
+                logger.info("没有筛选后的数据可供生成 Markdown。")
+                byte_count += f.write(EMPTY_MARKDOWN_CONTENT.encode('utf-8'))
+        publish_file(staged_md_filename, self.output_md_filename)
+
+        if self.fragment_cache is not None:
+            self.document_hash = FragmentCache.document_hash([MARKDOWN_FRAGMENT_KIND] + fragment_keys)
+            RUN_METRICS.incr('fragment_cache_hits', reused)
+            RUN_METRICS.incr('fragment_cache_misses', len(fragment_keys) - reused)
+            logger.info("复用了 %s / %s 个已缓存的讲座片段。", reused, len(fragment_keys))
+
+        RUN_METRICS.incr('markdown_bytes', byte_count)
+        logger.info("Markdown 内容已保存到 '%s' 文件中 (%s 条讲座, %s 字节)。", self.output_md_filename, lecture_count, byte_count)
+        return {'path': self.output_md_filename, 'lectures': lecture_count, 'bytes': byte_count,
+                'fragments_reused': reused}
+
+    def generate_markdown(self, filtered_df, image_paths=None):
+        """
+        根据筛选后的DataFrame生成Markdown文件。
+
+        Args:
+            filtered_df (pd.DataFrame): 筛选后的讲座信息DataFrame。
+            image_paths (dict, optional): 行索引 -> 海报路径。批量模式下传入已下载好的结果，
+                                          为 None 时由 ImageManager 并发下载。
+
+        Returns:
+            dict: write_markdown 的结果摘要。
+        """
+        if filtered_df.empty:
+            return self.write_markdown(())
+        # 并发下载所有海报，渲染时只按索引读取结果
+        if image_paths is None:
+            image_paths = self.image_manager.download_all(filtered_df)
+        return self.write_markdown(self.render_fragments(filtered_df, image_paths))
 
     def convert_markdown_to_word(self):
         """
-        使用Pandoc将Markdown文件转换为Word文档。
+        使用Pandoc将Markdown文件转换为Word文档。所有讲座片段都与上次转换时相同时跳过转换。
+        """
+        if self.word_is_current():
+            logger.info("讲座内容未变化，保留已有的 Word 文档: '%s'", self.output_word_filename)
+            RUN_METRICS.incr('word_conversions_skipped')
+            return True
+        converted = convert_markdown_file(
+            self.output_md_filename,
+            self.output_word_filename,
+            self.image_manager.temp_dir
+        )
+        if converted:
+            self.mark_word_current()
+        return converted
+
+    def generate_word_native(self, filtered_df, image_paths=None):
+        """
+        不经过 Markdown 文件和 Pandoc，直接从DataFrame和海报路径生成Word文档。
+
+        Args:
+            filtered_df (pd.DataFrame): 筛选后的讲座信息DataFrame。
+            image_paths (dict, optional): 行索引 -> 海报路径，为 None 时由 ImageManager 并发下载。
+
+        Returns:
+            bool: 生成是否成功。
         """
-        print(f"正在使用 Pandoc 将 '{self.output_md_filename}' 转换为 '{self.output_word_filename}'...")
-        try:
-            subprocess.run(
-                ['pandoc', self.output_md_filename, '-o', self.output_word_filename,
-                 '--standalone', f'--resource-path={self.image_manager.temp_dir}'],
-                check=True,
-                encoding='utf-8'
-            )
-            print(f"\n成功生成 Word 文档: '{self.output_word_filename}'")
-        except FileNotFoundError:
-            print("错误: Pandoc 命令未找到。请确保 Pandoc 已安装并添加到系统 PATH。")
-            print("安装指南: https://pandoc.org/installing.html")
-        except subprocess.CalledProcessError as e:
-            print(f"错误: Pandoc 转换失败。命令 '{' '.join(e.cmd)}' 返回了非零退出码 {e.returncode}。")
-            print(f"标准输出:\n{e.stdout}")
-            print(f"标准错误:\n{e.stderr}")
-            print("请检查 Markdown 文件内容或 Pandoc 安装。")
-        except Exception as e:
-            print(f"转换 Word 文档时发生意外错误: {e}")
+        from docx_writer import DocxReportWriter # 可选依赖，仅在使用原生后端时导入
+
+        if image_paths is None and not filtered_df.empty:
+            image_paths = self.image_manager.download_all(filtered_df)
+        image_paths = image_paths or {}
+
+        if self.fragment_cache is not None:
+            # 原生后端的片段即整份文档的组成部分，只要有一条讲座变化就重新生成整份文档
+            columns = format_lecture_columns(filtered_df)
+            fragment_keys = [
+                fragment_key(NATIVE_DOCX_FRAGMENT_KIND, dict(zip(columns, values)),
+                             self._poster_digest(image_paths.get(index)))
+                for index, *values in zip(filtered_df.index, *columns.values())
+            ]
+            self.document_hash = FragmentCache.document_hash([NATIVE_DOCX_FRAGMENT_KIND] + fragment_keys)
+            if self.word_is_current():
+                logger.info("讲座内容未变化，保留已有的 Word 文档: '%s'", self.output_word_filename)
+                RUN_METRICS.incr('word_conversions_skipped')
+                return True
 
+        written = DocxReportWriter(self.output_word_filename).write(filtered_df, image_paths)
+        if written:
+            self.mark_word_current()
+        return written
@@ -1,38 +1,457 @@
 # seatable_data.py
 
+import logging
+import os
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from seatable_api import SeaTableAPI
 import pandas as pd
+from data_processor import normalize_lecture_columns, merge_lecture_sources
+from snapshot_store import RowSnapshotStore
+from metrics import RUN_METRICS
+
+logger = logging.getLogger(__name__)
+
+class SourceFetchError(Exception):
+    """多数据源获取时有数据源失败，不合并不完整的结果。"""
+
+    def __init__(self, failures):
+        super().__init__('; '.join(f"{name}: {error}" for name, error in failures))
+        self.failures = failures # [(数据源名称, 异常)]
+
 
 class SeaTableDataManager:
-    def __init__(self, server_url, api_token, base_name, table_name):
+    def __init__(self, server_url, api_token, base_name, table_name, strict=False):
         self.api = SeaTableAPI(api_token, server_url) # SeaTableAPI 实例
         self.base_name = base_name
         self.table_name = table_name
         self.server_url = server_url
+        self.strict = strict # 获取失败时抛出异常，而不是记录错误后返回空结果 (多数据源合并时使用)
 
     def authenticate(self):
 
         try:
-            self.api.auth()
-            print(f"成功连接到 SeaTable 服务器: {self.server_url}")
+            with RUN_METRICS.stage('auth'):
+                self.api.auth()
+            logger.info("成功连接到 SeaTable 服务器: %s", self.server_url)
             return True
         except Exception as e:
-            print(f"连接失败: {e}")
+            logger.error("连接失败: %s", e)
             return False
 
+    def ensure_authenticated(self, refresh_margin_seconds=3600):
+        """
+        在访问令牌过期前 refresh_margin_seconds 秒重新认证，供长时间运行的监视模式使用。
+
+        Returns:
+            bool: 令牌是否有效 (或刷新成功)。
+        """
+        jwt_exp = getattr(self.api, 'jwt_exp', None)
+        if jwt_exp is not None and datetime.now() + timedelta(seconds=refresh_margin_seconds) < jwt_exp:
+            return True
+        logger.info("访问令牌即将过期 (%s)，重新认证...", jwt_exp)
+        return self.authenticate()
+
+    def _window_bounds_sql(self, start_date_str, end_date_str):
+        # 日期先经过解析再格式化，避免将任意字符串拼接进 SQL
+        start_sql = pd.to_datetime(start_date_str).strftime('%Y-%m-%d')
+        end_exclusive_sql = (pd.to_datetime(end_date_str) + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+        return start_sql, end_exclusive_sql
+
+    def get_window_fingerprint(self, start_date_str, end_date_str):
+        """
+        轻量的变化检测：一次 SQL 查询取得日期范围内的行数和最大 `_mtime`。
+        范围内任何行的新增、修改、删除或移入移出都会改变其中至少一项。
+
+        Returns:
+            tuple: (行数, 最大 _mtime)；SQL 接口不可用时返回 None。
+        """
+        start_sql, end_exclusive_sql = self._window_bounds_sql(start_date_str, end_date_str)
+        try:
+            with RUN_METRICS.stage('change_check'):
+                rows = self.api.query(
+                    f"SELECT COUNT(*), MAX(`_mtime`) FROM `{self.table_name}` "
+                    f"WHERE `讲座时间` >= '{start_sql}' AND `讲座时间` < '{end_exclusive_sql}'"
+                )
+        except Exception as e:
+            logger.warning("变化检测查询失败 (%s)，将获取完整数据进行比较。", e)
+            return None
+        return tuple(rows[0].values()) if rows else (0, None)
+
     def get_lecture_rows(self):
 
-        print(f"\n从 SeaTable 获取数据 (表: '{self.table_name}')...")
+        logger.info("从 SeaTable 获取数据 (表: '%s')...", self.table_name)
         try:
-            rows = self.api.list_rows(self.table_name)
-            print(f"获取到原始行数: {len(rows)} 条")
+            with RUN_METRICS.stage('fetch'):
+                rows = self.api.list_rows(self.table_name)
+            RUN_METRICS.incr('rows_fetched', len(rows))
+            logger.info("获取到原始行数: %s 条", len(rows))
             if not rows:
-                print("警告: 从 SeaTable 获取到的数据为空。请检查 BASE_NAME 和 TABLE_NAME 或 API Token。")
+                logger.warning("警告: 从 SeaTable 获取到的数据为空。请检查 BASE_NAME 和 TABLE_NAME 或 API Token。")
             return rows
         except Exception as e:
-            print(f"从 SeaTable 获取数据失败: {e}")
+            if self.strict:
+                raise
+            logger.error("从 SeaTable 获取数据失败: %s", e)
             return []
 
+    def iter_lecture_pages(self, page_size=1000):
+        """
+        以 start/limit 分页的方式逐页获取讲座表，每次产出一页原始行数据。
+        下游可以在后续页面到达之前就开始处理已到达的页面。第一页获取失败时记录错误并不产出任何页面；
+        已产出部分页面后失败则抛出异常，不能让不完整的表看起来像是完整的。
+
+        Args:
+            page_size (int): 每页行数。
+
+        Yields:
+            list: 一页原始行数据。
+        """
+        logger.info("分页获取 SeaTable 数据 (表: '%s', 每页 %s 行)...", self.table_name, page_size)
+        start = 0
+        while True:
+            try:
+                with RUN_METRICS.stage('fetch'):
+                    page = self.api.list_rows(self.table_name, start=start, limit=page_size)
+            except Exception as e:
+                if start or self.strict:
+                    raise # 已产出部分页面，下游 (如分阶段流水线) 需要知道数据不完整
+                logger.error("从 SeaTable 获取第 %s 页数据失败: %s", start // page_size + 1, e)
+                return
+            if not page:
+                break
+            RUN_METRICS.incr('rows_fetched', len(page))
+            yield page
+            if len(page) < page_size:
+                break
+            start += page_size
+        logger.info("分页获取完成，共读取原始行数: %s 条", start + len(page or []))
+
+    @staticmethod
+    def _page_sql(sql, page_size, offset):
+        """LIMIT/OFFSET 分页按 `_id` 排序：没有确定的顺序时，服务端可能在页与页之间重复或遗漏行。"""
+        return f"{sql} ORDER BY `_id` LIMIT {page_size} OFFSET {offset}"
+
+    def _query_all(self, sql, page_size):
+        """按 LIMIT/OFFSET 分页执行 SQL 查询并返回全部结果。"""
+        rows = []
+        offset = 0
+        while True:
+            with RUN_METRICS.stage('fetch'):
+                page = self.api.query(self._page_sql(sql, page_size, offset))
+            RUN_METRICS.incr('rows_fetched', len(page))
+            rows.extend(page)
+            if len(page) < page_size:
+                return rows
+            offset += page_size
+
+    def _lecture_window_sql(self, start_date_str, end_date_str, columns):
+        start_sql, end_exclusive_sql = self._window_bounds_sql(start_date_str, end_date_str)
+        column_sql = ', '.join(f"`{column}`" for column in columns)
+        return (
+            f"SELECT {column_sql} FROM `{self.table_name}` "
+            f"WHERE `讲座时间` >= '{start_sql}' AND `讲座时间` < '{end_exclusive_sql}'"
+        )
+
+    def query_lecture_rows(self, start_date_str, end_date_str, columns, page_size=10000):
+        """
+        通过 SeaTable 的 SQL 查询接口在服务端按日期范围筛选，并只返回所需的列。
+        SQL 接口不可用时透明地回退到全表获取 + 客户端列投影
+        (日期筛选仍由 process_and_filter_lectures 完成)。
+
+        Args:
+            start_date_str (str): 起始日期字符串 (YYYY-MM-DD)。
+            end_date_str (str): 结束日期字符串 (YYYY-MM-DD)，包含当天。
+            columns (list): 需要获取的列名列表。
+            page_size (int): 每次 SQL 查询返回的最大行数 (SeaTable 上限为 10000)。
+
+        Returns:
+            list: 行数据 (dict) 列表。
+        """
+        logger.info("通过 SQL 从 SeaTable 获取数据 (表: '%s', 日期: %s 至 %s, 列数: %s)...", self.table_name, start_date_str, end_date_str, len(columns))
+        try:
+            rows = self._query_all(self._lecture_window_sql(start_date_str, end_date_str, columns), page_size)
+        except Exception as e:
+            logger.warning("SQL 查询接口不可用 (%s)，回退到客户端筛选。", e)
+            return [
+                {column: row.get(column) for column in columns}
+                for row in self.get_lecture_rows()
+            ]
+
+        logger.info("服务端筛选后获取到行数: %s 条", len(rows))
+        return rows
+
+    def iter_query_lecture_pages(self, start_date_str, end_date_str, columns, page_size=10000):
+        """
+        query_lecture_rows 的分页版本：每次 SQL 查询返回的一页到达时立即产出，
+        下游可以在后续页面到达之前就开始处理。第一页查询失败时回退到全表获取 + 客户端列投影。
+
+        Yields:
+            list: 一页行数据 (dict)。
+        """
+        sql = self._lecture_window_sql(start_date_str, end_date_str, columns)
+        logger.info("通过 SQL 分页获取 SeaTable 数据 (表: '%s', 日期: %s 至 %s, 每页 %s 行)...", self.table_name, start_date_str, end_date_str, page_size)
+        offset = 0
+        while True:
+            try:
+                with RUN_METRICS.stage('fetch'):
+                    page = self.api.query(self._page_sql(sql, page_size, offset))
+            except Exception as e:
+                if offset:
+                    raise # 已产出部分结果，不能再回退到全表获取
+                logger.warning("SQL 查询接口不可用 (%s)，回退到客户端筛选。", e)
+                yield [{column: row.get(column) for column in columns} for row in self.get_lecture_rows()]
+                return
+            RUN_METRICS.incr('rows_fetched', len(page))
+            if page:
+                yield page
+            if len(page) < page_size:
+                break
+            offset += page_size
+        logger.info("SQL 分页获取完成，服务端筛选后行数: %s 条", offset + len(page))
+
+    def sync_lecture_rows(self, snapshot_store, page_size=10000):
+        """
+        增量同步讲座表到本地快照。首次运行 (或快照不可用) 时全量获取；之后只请求
+        `_mtime` 不早于上次水位线的行，并通过行数对比检测删除，仅在行数不一致时才获取 `_id` 列表。
+
+        Args:
+            snapshot_store (RowSnapshotStore): 本地行快照。
+            page_size (int): 每次 SQL 查询返回的最大行数。
+
+        Returns:
+            list: 合并后的全部原始行数据。
+        """
+        if not snapshot_store.is_empty():
+            logger.info("增量同步 SeaTable 数据 (表: '%s', 水位线: %s)...", self.table_name, snapshot_store.watermark)
+            try:
+                changed_rows = self._query_all(
+                    f"SELECT * FROM `{self.table_name}` WHERE `_mtime` >= '{snapshot_store.watermark}'",
+                    page_size
+                )
+                merged = snapshot_store.merge(changed_rows)
+
+                with RUN_METRICS.stage('fetch'):
+                    count_rows = self.api.query(f"SELECT COUNT(*) FROM `{self.table_name}`")
+                server_count = next(iter(count_rows[0].values())) if count_rows else 0
+                deleted = 0
+                if server_count != len(snapshot_store.rows):
+                    id_rows = self._query_all(f"SELECT `_id` FROM `{self.table_name}`", page_size)
+                    deleted = snapshot_store.retain(row['_id'] for row in id_rows)
+                logger.info("增量同步完成: 新增/修改 %s 行, 删除 %s 行", merged, deleted)
+                snapshot_store.save()
+                return snapshot_store.get_rows()
+            except Exception as e:
+                logger.warning("增量同步失败 (%s)，改为全量获取。", e)
+
+        rows = self.get_lecture_rows()
+        if rows:
+            snapshot_store.replace(rows)
+            snapshot_store.save()
+        return snapshot_store.get_rows()
+
     def get_api_instance(self):
 
         return self.api
+
+
+class MultiSourceDataManager:
+    """
+    多个 base/表 数据源 (例如每个学期或院系一张表) 的组合数据管理器，接口与 SeaTableDataManager 相同。
+
+    每个数据源是一个独立的 SeaTableDataManager，拥有自己的 API Token 和认证会话；
+    认证和获取在线程池中并发进行，总耗时接近最慢的数据源而不是各数据源之和。
+    获取结果的列名按 column_aliases 和数据源自己的 column_mapping 规范化为标准列名，
+    合并后由 merge_lecture_sources 去除跨数据源重复的讲座。任一数据源获取失败时抛出 SourceFetchError，
+    不会发布缺少某个数据源的报告。
+    各数据源的 `_id` 加上数据源名称作为前缀，合并后仍然唯一。
+    """
+
+    def __init__(self, sources, default_server_url, column_aliases=None, max_workers=4):
+        """
+        Args:
+            sources (list): 数据源配置 (dict)，包含 'api_token'、'base_name'、'table_name'，
+                可选 'name' (默认为 '<base_name>/<table_name>')、'server_url' 和 'column_mapping' (源列名 -> 标准列名)。
+            default_server_url (str): 未指定 'server_url' 的数据源使用的服务器。
+            column_aliases (dict, optional): 所有数据源共用的列名别名 -> 标准列名。
+            max_workers (int): 并发访问的数据源数。
+        """
+        self.sources = []
+        for source in sources:
+            manager = SeaTableDataManager(
+                source.get('server_url') or default_server_url,
+                source['api_token'],
+                source['base_name'],
+                source['table_name'],
+                strict=True
+            )
+            name = source.get('name') or f"{source['base_name']}/{source['table_name']}"
+            column_mapping = {**(column_aliases or {}), **source.get('column_mapping', {})}
+            self.sources.append((name, manager, column_mapping))
+        self.max_workers = max(1, max_workers)
+        self.table_name = ', '.join(name for name, _, _ in self.sources)
+
+    def _map_sources(self, task):
+        """在线程池中对每个数据源执行 task(name, manager, column_mapping)，结果按数据源顺序返回。"""
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(self.sources)),
+                                thread_name_prefix='seatable-source') as executor:
+            return list(executor.map(lambda source: task(*source), self.sources))
+
+    def _fetch_sources(self, task):
+        """
+        与 _map_sources 相同，但任一数据源失败时在所有数据源结束后抛出 SourceFetchError (列出全部失败的数据源)，
+        不会把缺少某个学期或院系的不完整结果交给下游合并和发布。
+        """
+        def run(name, manager, column_mapping):
+            try:
+                return task(name, manager, column_mapping), None
+            except Exception as e:
+                logger.error("数据源 '%s' 获取失败: %s", name, e)
+                return None, e
+
+        results = self._map_sources(run)
+        failures = [(name, error) for (name, _, _), (_, error) in zip(self.sources, results) if error is not None]
+        if failures:
+            raise SourceFetchError(failures)
+        return [result for result, _ in results]
+
+    def authenticate(self):
+        results = self._map_sources(lambda name, manager, _: manager.authenticate())
+        failed = [name for (name, _, _), ok in zip(self.sources, results) if not ok]
+        if failed:
+            logger.error("以下数据源认证失败: %s", ', '.join(failed))
+            return False
+        return True
+
+    def ensure_authenticated(self, refresh_margin_seconds=3600):
+        return all(self._map_sources(
+            lambda name, manager, _: manager.ensure_authenticated(refresh_margin_seconds)
+        ))
+
+    def get_window_fingerprint(self, start_date_str, end_date_str):
+        """
+        各数据源 SeaTableDataManager.get_window_fingerprint 的组合，任一数据源变化都会改变结果。
+
+        Returns:
+            tuple: 各数据源的 (行数, 最大 _mtime)；任一数据源的 SQL 接口不可用时返回 None。
+        """
+        fingerprints = self._map_sources(
+            lambda name, manager, _: manager.get_window_fingerprint(start_date_str, end_date_str)
+        )
+        if any(fingerprint is None for fingerprint in fingerprints):
+            return None
+        return tuple(fingerprints)
+
+    def _normalize(self, name, rows, column_mapping):
+        """一个数据源的行 -> 列名规范化并带有数据源标记的DataFrame。"""
+        df = normalize_lecture_columns(rows, column_mapping)
+        if df.empty:
+            return df
+        if '_id' in df.columns:
+            df['_id'] = name + ':' + df['_id'].astype(str)
+        df['_source'] = name
+        return df
+
+    def _query_columns(self, manager, columns, column_mapping):
+        """
+        标准列名 -> 该数据源表中实际存在的列名，SQL 查询只能使用源列名。
+        标准列名存在时直接使用，否则使用第一个存在的别名；读取表结构失败时按原列名查询。
+        """
+        try:
+            existing = {column['name'] for column in manager.api.list_columns(manager.table_name)}
+        except Exception as e:
+            logger.warning("读取数据源 '%s' 的列信息失败 (%s)，按标准列名查询。", manager.table_name, e)
+            return list(columns)
+        query_columns = []
+        for column in columns:
+            if column in existing:
+                query_columns.append(column)
+                continue
+            aliases = [alias for alias, canonical in column_mapping.items() if canonical == column and alias in existing]
+            query_columns.append(aliases[0] if aliases else column)
+        return query_columns
+
+    def _merge(self, frames):
+        merged = merge_lecture_sources(frames)
+        RUN_METRICS.incr('sources_fetched', len(frames))
+        return merged
+
+    def get_lecture_rows(self):
+        """
+        并发获取所有数据源的整张表并合并去重。
+
+        Returns:
+            pd.DataFrame: 合并后的原始行数据 (列名已规范化)。
+        """
+        logger.info("并发获取 %s 个数据源: %s", len(self.sources), self.table_name)
+        return self._merge(self._fetch_sources(
+            lambda name, manager, column_mapping: self._normalize(name, manager.get_lecture_rows(), column_mapping)
+        ))
+
+    def iter_lecture_pages(self, page_size=1000):
+        """
+        并发分页获取所有数据源，合并去重后按 page_size 分页产出。
+        去重需要看到所有数据源的行，因此第一页要等所有数据源获取完成后才产出。
+
+        Yields:
+            pd.DataFrame: 一页合并后的行数据。
+        """
+        def fetch_source(name, manager, column_mapping):
+            pages = list(manager.iter_lecture_pages(page_size=page_size))
+            return self._normalize(name, [row for page in pages for row in page], column_mapping)
+
+        merged = self._merge(self._fetch_sources(fetch_source))
+        for start in range(0, len(merged), page_size):
+            yield merged.iloc[start:start + page_size]
+
+    def query_lecture_rows(self, start_date_str, end_date_str, columns, page_size=10000):
+        """
+        在每个数据源上并发执行服务端日期筛选的 SQL 查询 (见 SeaTableDataManager.query_lecture_rows)，
+        查询使用各数据源自己的列名，结果规范化后合并去重。
+
+        Returns:
+            pd.DataFrame: 合并后的行数据。
+        """
+        def query_source(name, manager, column_mapping):
+            rows = manager.query_lecture_rows(
+                start_date_str, end_date_str, self._query_columns(manager, columns, column_mapping), page_size
+            )
+            return self._normalize(name, rows, column_mapping)
+
+        return self._merge(self._fetch_sources(query_source))
+
+    def iter_query_lecture_pages(self, start_date_str, end_date_str, columns, page_size=10000):
+        """
+        query_lecture_rows 的分页产出版本。去重需要看到所有数据源的行，结果在全部数据源查询完成后分页产出。
+
+        Yields:
+            pd.DataFrame: 一页合并后的行数据。
+        """
+        merged = self.query_lecture_rows(start_date_str, end_date_str, columns, page_size)
+        for start in range(0, len(merged), page_size):
+            yield merged.iloc[start:start + page_size]
+
+    def sync_lecture_rows(self, snapshot_store, page_size=10000):
+        """
+        每个数据源各自增量同步到独立的本地快照 (文件名由 snapshot_store.path 加数据源名称的哈希构成)，
+        然后合并去重。
+
+        Returns:
+            pd.DataFrame: 合并后的全部原始行数据。
+        """
+        root, extension = os.path.splitext(snapshot_store.path)
+
+        def sync_source(name, manager, column_mapping):
+            suffix = hashlib.sha256(name.encode('utf-8')).hexdigest()[:12]
+            source_store = RowSnapshotStore(f"{root}.{suffix}{extension}")
+            return self._normalize(name, manager.sync_lecture_rows(source_store, page_size), column_mapping)
+
+        return self._merge(self._fetch_sources(sync_source))
+
+    def get_api_instance(self):
+        """
+        Returns:
+            list: 各数据源的 SeaTableAPI 实例，ImageManager 按海报 URL 中的 base UUID 选择对应的实例。
+        """
+        return [manager.get_api_instance() for _, manager, _ in self.sources]
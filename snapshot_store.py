@@ -0,0 +1,88 @@
+# snapshot_store.py
+
+import logging
+import os
+import json
+
+logger = logging.getLogger(__name__)
+
+
+class RowSnapshotStore:
+    """
+    本地原始行快照，以 SeaTable 行的 `_id` 为键保存，并记录上次同步的 `_mtime` 水位线。
+    后续运行只需获取水位线之后修改过的行并合并进快照。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.watermark = None # 已同步行中最大的 _mtime
+        self.rows = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.watermark = data.get('watermark')
+            self.rows = data.get('rows', {})
+            logger.info("已加载本地快照: %s (%s 行, 水位线: %s)", self.path, len(self.rows), self.watermark)
+        except (OSError, ValueError) as e:
+            logger.warning("警告: 本地快照损坏，将重新全量同步: %s", e)
+            self.watermark = None
+            self.rows = {}
+
+    def is_empty(self):
+        return self.watermark is None
+
+    def _advance_watermark(self, rows):
+        for row in rows:
+            mtime = row.get('_mtime')
+            if mtime and (self.watermark is None or mtime > self.watermark):
+                self.watermark = mtime
+
+    def replace(self, rows):
+        """用一次全量获取的结果替换整个快照。"""
+        self.rows = {row['_id']: row for row in rows if row.get('_id')}
+        self.watermark = None
+        self._advance_watermark(self.rows.values())
+
+    def merge(self, changed_rows):
+        """
+        将增量获取的新增/修改行合并进快照。
+
+        Returns:
+            int: 合并的行数。
+        """
+        merged = 0
+        for row in changed_rows:
+            row_id = row.get('_id')
+            if row_id:
+                self.rows[row_id] = row
+                merged += 1
+        self._advance_watermark(changed_rows)
+        return merged
+
+    def retain(self, live_ids):
+        """
+        删除服务端已不存在的行。
+
+        Returns:
+            int: 删除的行数。
+        """
+        live_ids = set(live_ids)
+        deleted_ids = [row_id for row_id in self.rows if row_id not in live_ids]
+        for row_id in deleted_ids:
+            del self.rows[row_id]
+        return len(deleted_ids)
+
+    def get_rows(self):
+        return list(self.rows.values())
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'watermark': self.watermark, 'rows': self.rows}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        logger.info("本地快照已保存: %s (%s 行)", self.path, len(self.rows))
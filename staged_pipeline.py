@@ -0,0 +1,232 @@
+# staged_pipeline.py
+
+import logging
+import queue
+import threading
+import pandas as pd
+from data_processor import lecture_window_bounds, filter_lecture_page
+from image_downloader import LazyProcessPool
+from report_generator import ReportGenerator
+from metrics import RUN_METRICS
+
+logger = logging.getLogger(__name__)
+
+_END = object() # 队列结束标记
+_POLL_SECONDS = 0.1 # 阻塞在队列上的线程检查停止标志的间隔
+
+
+class PipelineError(Exception):
+    """流水线的某个阶段失败，其余阶段已随之停止。"""
+
+    def __init__(self, stage, error):
+        super().__init__(f"{stage}: {error}")
+        self.stage = stage
+        self.error = error
+
+
+class StagedReportPipeline:
+    """
+    以有界队列连接的分阶段报告流水线：
+
+        获取分页 -> 筛选 -> 海报下载/转码 (多线程) -> 片段渲染 -> 文档组装
+
+    前四个阶段各自在独立线程中运行，网络请求、筛选、转码和渲染相互重叠，
+    总耗时接近最慢的阶段而不是各阶段之和。队列已满时上游阶段阻塞等待 (背压)，
+    因此尚未筛选的原始页和处理中的行只占用与队列长度相当的内存；日期范围内的讲座
+    (行数据、海报路径和片段) 则保留到组装阶段，占用随命中的讲座数增长，与整张表的大小无关。
+    片段按到达顺序渲染，组装时再按讲座时间排序写出。转码进程池在第一次缓存未命中时才启动。
+
+    任何阶段出错时设置停止标志，其余阶段在当前任务完成后退出，
+    run() 等所有线程结束后抛出 PipelineError，不会发布不完整的文档。
+    """
+
+    def __init__(self, reporter: ReportGenerator, start_date_str, end_date_str, render_markdown=True,
+                 queue_size=256, poster_workers=8, transcode_workers=4, render_batch_size=64):
+        self.reporter = reporter
+        self.image_manager = reporter.image_manager
+        self.start_date_str = start_date_str
+        self.end_date_str = end_date_str
+        self.render_markdown = render_markdown # 原生 DOCX 后端只需要行和海报，不渲染 Markdown 片段
+        self.poster_workers = max(1, poster_workers)
+        self.transcode_workers = max(1, transcode_workers)
+        self.render_batch_size = max(1, render_batch_size) # 每批按列格式化的讲座条数
+
+        self._pages = queue.Queue(maxsize=max(1, queue_size // 64)) # 每项是一整页
+        self._rows = queue.Queue(maxsize=queue_size)
+        self._posters = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._errors = []
+        self._active_poster_workers = 0
+        self._results = [] # (讲座时间, 序号, 行数据, 海报路径, 片段)
+        self.rows_seen = 0
+
+    def _put(self, target_queue, item):
+        """放入队列，队列已满时阻塞 (背压)；流水线停止时放弃并返回 False。"""
+        while not self._stop.is_set():
+            try:
+                target_queue.put(item, timeout=_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, source_queue):
+        """从队列取出一项；流水线停止时返回结束标记。"""
+        while not self._stop.is_set():
+            try:
+                return source_queue.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _run_stage(self, name, target, *args):
+        try:
+            target(*args)
+        except Exception as e:
+            logger.error("流水线阶段 '%s' 失败: %s", name, e)
+            with self._lock:
+                self._errors.append(PipelineError(name, e))
+            self._stop.set()
+
+    def _fetch(self, pages):
+        try:
+            for page in pages:
+                if not self._put(self._pages, page):
+                    return
+        finally:
+            self._put(self._pages, _END)
+
+    def _filter(self):
+        start_ts, end_exclusive_ts = lecture_window_bounds(self.start_date_str, self.end_date_str)
+        sequence = 0
+        try:
+            while True:
+                page = self._get(self._pages)
+                if page is _END:
+                    return
+                if not len(page):
+                    continue
+                self.rows_seen += len(page)
+                chunk = filter_lecture_page(page, start_ts, end_exclusive_ts)
+                if chunk is None:
+                    continue
+                # 序号按到达顺序递增，既是海报文件名的索引，也是同一时间讲座的排序依据
+                for row in chunk.to_dict('records'):
+                    if not self._put(self._rows, (sequence, row)):
+                        return
+                    sequence += 1
+        finally:
+            for _ in range(self.poster_workers):
+                self._put(self._rows, _END)
+
+    def _resolve_posters(self, transcode_pool):
+        try:
+            while True:
+                item = self._get(self._rows)
+                if item is _END:
+                    return
+                sequence, row = item
+                try:
+                    image_path = self.image_manager.download_and_convert_image(row, sequence, transcode_pool)
+                except Exception as e:
+                    # 单张海报失败不影响报告，与 ImageManager.download_all 一致
+                    logger.warning("警告: 海报下载任务失败 (行 %s): %s", sequence, e)
+                    image_path = None
+                if not self._put(self._posters, (sequence, row, image_path)):
+                    return
+        finally:
+            with self._lock:
+                self._active_poster_workers -= 1
+                last_worker = self._active_poster_workers == 0
+            if last_worker:
+                self._put(self._posters, _END)
+
+    def _render(self):
+        finished = False
+        while not finished:
+            item = self._get(self._posters)
+            if item is _END:
+                return
+            # 取出已到达的讲座凑成一批，按列格式化比逐条格式化快
+            batch = [item]
+            while len(batch) < self.render_batch_size:
+                try:
+                    item = self._posters.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _END:
+                    finished = True
+                    break
+                batch.append(item)
+            self._render_batch(batch)
+
+    def _render_batch(self, batch):
+        if self.render_markdown:
+            frame = pd.DataFrame([row for _, row, _ in batch], index=[sequence for sequence, _, _ in batch])
+            image_paths = {sequence: image_path for sequence, _, image_path in batch}
+            fragments = list(self.reporter.render_fragments(frame, image_paths))
+        else:
+            fragments = [None] * len(batch)
+        for (sequence, row, image_path), fragment in zip(batch, fragments):
+            self._results.append((row['讲座时间'], sequence, row, image_path, fragment))
+
+    def run(self, pages):
+        """
+        运行流水线直到所有页面处理完毕，然后按讲座时间组装文档。
+
+        Args:
+            pages (iterable): 逐页产出原始行数据 (list 或 DataFrame) 的可迭代对象，在获取线程中迭代。
+
+        Returns:
+            dict: {'filtered_df': 按讲座时间排序的讲座 (索引为序号), 'image_paths': 序号 -> 海报路径,
+                   'markdown': write_markdown 的结果摘要 (render_markdown 为 False 时为 None)}。
+
+        Raises:
+            PipelineError: 某个阶段失败。
+        """
+        logger.info("分阶段流水线: %s 至 %s (海报线程: %s, 队列长度: %s)",
+                    self.start_date_str, self.end_date_str, self.poster_workers, self._rows.maxsize)
+        with RUN_METRICS.stage('pipeline'), LazyProcessPool(self.transcode_workers) as transcode_pool:
+            self._active_poster_workers = self.poster_workers
+            threads = [
+                threading.Thread(target=self._run_stage, args=('fetch', self._fetch, pages), name='pipeline-fetch'),
+                threading.Thread(target=self._run_stage, args=('filter', self._filter), name='pipeline-filter'),
+                threading.Thread(target=self._run_stage, args=('render', self._render), name='pipeline-render'),
+            ]
+            threads += [
+                threading.Thread(target=self._run_stage, args=('poster', self._resolve_posters, transcode_pool),
+                                 name=f'pipeline-poster-{worker}')
+                for worker in range(self.poster_workers)
+            ]
+            for thread in threads:
+                thread.start()
+            try:
+                for thread in threads:
+                    thread.join()
+            except BaseException:
+                # Ctrl+C 等：通知各阶段尽快退出
+                self._stop.set()
+                raise
+
+        if self.image_manager.poster_cache:
+            self.image_manager.poster_cache.flush()
+        if self._errors:
+            raise self._errors[0]
+
+        # 文档组装：片段按讲座时间 (相同时按到达顺序) 排序后写出
+        with RUN_METRICS.stage('assemble'):
+            self._results.sort(key=lambda result: (result[0], result[1]))
+            filtered_df = pd.DataFrame(
+                [row for _, _, row, _, _ in self._results],
+                index=[sequence for _, sequence, _, _, _ in self._results]
+            )
+            image_paths = {sequence: image_path for _, sequence, _, image_path, _ in self._results}
+        RUN_METRICS.incr('rows_matched', len(filtered_df))
+        logger.info("流水线处理完成: 共处理 %s 行，日期范围内 %s 条，海报成功 %s 张",
+                    self.rows_seen, len(filtered_df), sum(1 for path in image_paths.values() if path))
+
+        markdown_summary = None
+        if self.render_markdown:
+            markdown_summary = self.reporter.write_markdown(fragment for *_, fragment in self._results)
+        return {'filtered_df': filtered_df, 'image_paths': image_paths, 'markdown': markdown_summary}